@@ -0,0 +1,138 @@
+"""
+Annotated Output Video
+The background analysis writes its annotated frames to a video file once, so a finished upload
+is replayed from disk (with seeking) instead of being re-detected
+"""
+
+import os
+import tempfile
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+
+# (fourcc, container) in order of preference; H.264 needs an OpenCV build with an H.264 encoder,
+# VP8/WebM plays in every browser, MPEG-4 Part 2 is the last resort
+VIDEO_CODECS: Sequence[Tuple[str, str]] = (('avc1', 'mp4'), ('VP80', 'webm'), ('mp4v', 'mp4'))
+
+VIDEO_MIMETYPES = {'mp4': 'video/mp4', 'webm': 'video/webm'}
+
+_probed_codecs = {}
+
+
+class AnnotatedVideoWriter:
+    """
+    Writes frames to '<path_prefix>.<container>' with the first codec this OpenCV build can encode
+    The file is written under a temporary name and only appears once it is complete
+    """
+
+    def __init__(self, path_prefix: str, fps: float, codecs: Sequence[Tuple[str, str]] = VIDEO_CODECS):
+        self.path_prefix = path_prefix
+        self.fps = fps if fps and fps > 0 else 25.0
+        self.codecs = codecs
+        self.codec = None
+        self.container = None
+        self.frames = 0
+        self.size = None
+        self._writer = None
+        self._tmp_path = None
+        self._failed = False
+
+    @property
+    def path(self) -> Optional[str]:
+        return f"{self.path_prefix}.{self.container}" if self.container else None
+
+    def write(self, frame) -> bool:
+        if self._writer is None and not self._open(frame):
+            return False
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+        self._writer.write(frame)
+        self.frames += 1
+        return True
+
+    def close(self) -> Optional[str]:
+        """Finish the file and move it into place; returns its path, or None if nothing was written"""
+        if self._writer is None:
+            return None
+        self._writer.release()
+        self._writer = None
+        if not self.frames:
+            self.discard()
+            return None
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def discard(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def _open(self, frame) -> bool:
+        if self._failed:
+            return False
+        self.size = (frame.shape[1], frame.shape[0])
+        for fourcc, container in self.codecs:
+            tmp_path = f"{self.path_prefix}.part.{container}"
+            writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*fourcc), self.fps, self.size)
+            if writer.isOpened():
+                self._writer, self._tmp_path = writer, tmp_path
+                self.codec, self.container = fourcc, container
+                return True
+            writer.release()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        print(f"No video encoder available for {self.path_prefix}; annotated video not written")
+        self._failed = True
+        return False
+
+
+def available_codec(codecs: Sequence[Tuple[str, str]] = VIDEO_CODECS) -> Optional[str]:
+    """The 'fourcc.container' an AnnotatedVideoWriter would use in this process, probed once; None if none can encode"""
+    codecs = tuple(codecs)
+    if codecs not in _probed_codecs:
+        _probed_codecs[codecs] = None
+        directory = tempfile.mkdtemp()
+        try:
+            for fourcc, container in codecs:
+                path = os.path.join(directory, f"probe.{container}")
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), 25.0, (64, 64))
+                opened = writer.isOpened()
+                writer.release()
+                if os.path.exists(path):
+                    os.remove(path)
+                if opened:
+                    _probed_codecs[codecs] = f"{fourcc}.{container}"
+                    break
+        finally:
+            os.rmdir(directory)
+    return _probed_codecs[codecs]
+
+
+def concatenate_videos(paths: List[str], path_prefix: str, fps: float,
+                       codecs: Sequence[Tuple[str, str]] = VIDEO_CODECS) -> Optional[AnnotatedVideoWriter]:
+    """
+    Join segment videos into one file by decoding and re-encoding their frames (no inference)
+    The segment files are deleted; returns the finished writer, or None if nothing was written
+    """
+    writer = AnnotatedVideoWriter(path_prefix, fps, codecs)
+    try:
+        for path in paths:
+            capture = cv2.VideoCapture(path)
+            try:
+                while True:
+                    ret, frame = capture.read()
+                    if not ret:
+                        break
+                    writer.write(frame)
+            finally:
+                capture.release()
+        return writer if writer.close() else None
+    except Exception:
+        writer.discard()
+        raise
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
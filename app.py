@@ -9,11 +9,25 @@ from simulation import SimulationEngine, TrafficPredictor
 from google_maps_service import GoogleMapsService, GoogleEarthEngineService, EmergencyVehicleTracker
 from traffic_ml import AdvancedTrafficPredictor, V2ICommunicationSystem
 from nlp_classifier import ComplaintClassifier
+from model_registry import ModelRegistry
+from inference_service import InferenceService
+from complaint_store import save_complaint, clear_clip_path, ComplaintWriter
+from video_jobs import VideoJobManager
+from result_store import ResultStore
+from upload_cache import ResultCache, save_upload
+from annotated_video import VIDEO_MIMETYPES
+from detection_pipeline import make_divisible
+from roi import parse_polygon, parse_tiles
+from live_stream import LiveStreamManager
+from incident_clips import ClipWriter
+from video_sources import RoundRobinScheduler, SourceRegistry
+from stage_timings import PipelineMetrics, metric_lines
 import threading
 import time
+import atexit
 import numpy as np
 import os
-from flask import Flask, render_template, request, jsonify, Response, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, Response, redirect, url_for, flash, send_file
 import cv2
 import torch
 import numpy as np
@@ -87,21 +101,163 @@ ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'wmv', 'mkv', 'flv'}
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize models
-MODELS = {
-    'accident': 'models/ACCIDENT.pt',
-    'pothole': 'models/pathole_hump.pt'
+MODELS = app.config['MODELS']
+
+# Shared model registry - each model is loaded once per process
+model_registry = ModelRegistry(
+    MODELS,
+    confidence=app.config.get('YOLO_CONFIDENCE_THRESHOLD'),
+    memory_budget_mb=app.config.get('MODEL_MEMORY_BUDGET_MB'),
+    idle_timeout=app.config.get('MODEL_IDLE_TIMEOUT'),
+    warmup=app.config.get('MODEL_WARMUP')
+)
+if app.config.get('MODEL_PRELOAD'):
+    threading.Thread(target=model_registry.preload, daemon=True).start()
+
+# In-process callers share micro-batched forward passes; live streams are served first
+inference_service = InferenceService(
+    model_registry,
+    max_batch_size=app.config.get('INFERENCE_MAX_BATCH_SIZE'),
+    max_wait=app.config.get('INFERENCE_MAX_WAIT_MS') / 1000
+)
+atexit.register(inference_service.close)
+
+# Snapshot and complaint writes happen off the frame loops
+complaint_writer_settings = {
+    'db_path': 'complaints.db',
+    'max_queue': app.config.get('COMPLAINT_WRITER_QUEUE_SIZE'),
+    'flush_interval': app.config.get('COMPLAINT_WRITER_FLUSH_INTERVAL'),
+    'flush_size': app.config.get('COMPLAINT_WRITER_FLUSH_SIZE'),
+    'block_timeout': app.config.get('COMPLAINT_WRITER_BLOCK_TIMEOUT')
 }
+complaint_writer = ComplaintWriter(**complaint_writer_settings)
+atexit.register(complaint_writer.close)
 
-# Global variables for processing
-processing_videos = {}
-live_camera = None
-live_detection_active = False
-current_live_detection_type = None
+# Completed analyses keyed by video content, models and settings
+result_cache = ResultCache(
+    app.config.get('RESULT_CACHE_FOLDER'),
+    max_entries=app.config.get('RESULT_CACHE_MAX_ENTRIES')
+)
+
+def cache_completed_job(job):
+    result_cache.store(job, result_store.results(job.job_id))
+
+def forget_session(session_id):
+    video_jobs.forget(session_id)
+    result_cache.forget(session_id)
+    pipeline_metrics.forget(session_id)
+
+# Stage duration histograms of both frame loops, served at /metrics
+pipeline_metrics = PipelineMetrics()
+
+# Background analysis of uploaded videos in worker processes
+video_jobs = VideoJobManager(
+    settings={
+        'model_paths': MODELS,
+        'conf_threshold': app.config.get('YOLO_CONFIDENCE_THRESHOLD'),
+        'high_conf_threshold': app.config.get('HIGH_CONFIDENCE_THRESHOLD'),
+        'batch_size': app.config.get('YOLO_BATCH_SIZE'),
+        'inference_size': None,
+        'default_inference_size': app.config.get('INFERENCE_SIZE'),
+        'display_width': app.config.get('DISPLAY_MAX_WIDTH'),
+        'roi': None,
+        'roi_tiles': parse_tiles(app.config.get('ROI_TILES')),
+        'roi_overlap': app.config.get('ROI_TILE_OVERLAP'),
+        'roi_auto_frames': app.config.get('ROI_AUTO_SAMPLE_FRAMES'),
+        'decode_buffer_size': app.config.get('VIDEO_DECODE_BUFFER_SIZE'),
+        'frame_pool': app.config.get('FRAME_POOL'),
+        'model_memory_budget_mb': app.config.get('MODEL_MEMORY_BUDGET_MB'),
+        'model_warmup': app.config.get('MODEL_WARMUP'),
+        'detection_stride': app.config.get('VIDEO_DETECTION_STRIDE'),
+        'max_detection_stride': app.config.get('VIDEO_MAX_DETECTION_STRIDE'),
+        'adaptive_stride': app.config.get('VIDEO_ADAPTIVE_STRIDE'),
+        'segments': app.config.get('VIDEO_SEGMENTS'),
+        'min_segment_frames': app.config.get('VIDEO_MIN_SEGMENT_FRAMES'),
+        'stitch_window': app.config.get('VIDEO_STITCH_WINDOW'),
+        'track_iou_threshold': app.config.get('TRACK_IOU_THRESHOLD'),
+        'track_max_misses': app.config.get('TRACK_MAX_MISSES'),
+        'preview_fps': app.config.get('VIDEO_PREVIEW_FPS'),
+        'progress_interval': app.config.get('VIDEO_PROGRESS_INTERVAL'),
+        'results_dir': app.config.get('RESULTS_FOLDER'),
+        'worker_nice': app.config.get('VIDEO_WORKER_NICE'),
+        'annotated_video': app.config.get('ANNOTATED_VIDEO'),
+        'complaint_writer': complaint_writer_settings
+    },
+    max_workers=app.config.get('VIDEO_WORKER_PROCESSES'),
+    preview_buffer=app.config.get('VIDEO_PREVIEW_BUFFER'),
+    on_complete=cache_completed_job,
+    metrics=pipeline_metrics
+)
+
+# Pre/post-roll clips of live incidents, written off the frame loops
+os.makedirs(app.config['LIVE_CLIP_FOLDER'], exist_ok=True)
+clip_writer = ClipWriter(app.config.get('LIVE_CLIP_QUEUE_SIZE'), on_lost=clear_clip_path)
+
+# Named cameras, and the detection workers they share in turn
+video_sources = SourceRegistry(app.config.get('LIVE_SOURCES'), app.config.get('LIVE_DEFAULT_SOURCE'))
+live_scheduler = RoundRobinScheduler(app.config.get('LIVE_INFERENCE_WORKERS'))
+
+# One capture and inference pipeline per video source and detection type, shared by all viewers
+live_streams = LiveStreamManager(
+    inference_service.lane('live'),
+    complaint_writer,
+    settings={
+        'conf_threshold': app.config.get('YOLO_CONFIDENCE_THRESHOLD'),
+        'high_conf_threshold': app.config.get('HIGH_CONFIDENCE_THRESHOLD'),
+        'track_iou_threshold': app.config.get('TRACK_IOU_THRESHOLD'),
+        'track_max_misses': app.config.get('TRACK_MAX_MISSES'),
+        'incident_report_delay': app.config.get('LIVE_INCIDENT_REPORT_DELAY'),
+        'default_inference_size': app.config.get('INFERENCE_SIZE'),
+        'display_width': app.config.get('DISPLAY_MAX_WIDTH'),
+        'idle_grace': app.config.get('LIVE_IDLE_GRACE_SECONDS'),
+        'frame_pool': app.config.get('FRAME_POOL'),
+        'motion_gate': app.config.get('LIVE_MOTION_GATE'),
+        'motion_threshold': app.config.get('LIVE_MOTION_THRESHOLD'),
+        'motion_pixel_delta': app.config.get('LIVE_MOTION_PIXEL_DELTA'),
+        'motion_max_interval': app.config.get('LIVE_MOTION_MAX_INTERVAL'),
+        'roi': app.config.get('LIVE_CAMERA_ROI'),
+        'roi_tiles': parse_tiles(app.config.get('ROI_TILES')),
+        'roi_overlap': app.config.get('ROI_TILE_OVERLAP'),
+        'roi_auto_frames': app.config.get('ROI_AUTO_SAMPLE_FRAMES'),
+        'clip_types': app.config.get('LIVE_CLIP_TYPES'),
+        'clip_pre_roll': app.config.get('LIVE_CLIP_PRE_ROLL_SECONDS'),
+        'clip_post_roll': app.config.get('LIVE_CLIP_POST_ROLL_SECONDS'),
+        'clip_buffer_mb': app.config.get('LIVE_CLIP_BUFFER_MB'),
+        'clip_folder': app.config.get('LIVE_CLIP_FOLDER')
+    },
+    metrics=pipeline_metrics,
+    sources=video_sources,
+    scheduler=live_scheduler,
+    clip_writer=clip_writer
+)
+atexit.register(clip_writer.drain, 10.0)
+atexit.register(live_streams.stop)
+# Registered with threading rather than atexit so it runs before concurrent.futures' exit hook,
+# which would otherwise wait for every running upload to finish
+threading._register_atexit(video_jobs.shutdown)
+
+# Per-session detections live on disk; only small summaries are kept in memory
+result_store = ResultStore(
+    app.config.get('RESULTS_FOLDER'),
+    ttl=app.config.get('SESSION_TTL_SECONDS'),
+    max_sessions=app.config.get('MAX_SESSIONS'),
+    is_active=video_jobs.is_active,
+    on_evict=forget_session
+)
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def known_detection_type(detection_type):
+    """'all' or a type with a configured model; anything else would start a pipeline and metrics for nothing"""
+    return detection_type == 'all' or detection_type in MODELS
+
+def clip_if_written(complaint):
+    """A complaint row's incident clip path, or None until the clip exists on disk"""
+    clip_path = complaint[10] if len(complaint) > 10 else None
+    return clip_path if clip_path and os.path.exists(clip_path) else None
+
 def init_db():
     conn = sqlite3.connect('complaints.db')
     c = conn.cursor()
@@ -115,7 +271,13 @@ def init_db():
                   image_path TEXT,
                   latitude REAL,
                   longitude REAL,
-                  address TEXT)''')
+                  address TEXT,
+                  clip_path TEXT)''')
+    
+    # Databases created before incident clips need the clip_path column
+    c.execute('PRAGMA table_info(complaints)')
+    if 'clip_path' not in [col[1] for col in c.fetchall()]:
+        c.execute('ALTER TABLE complaints ADD COLUMN clip_path TEXT')
     
     # Create terrain_analysis table
     c.execute('''CREATE TABLE IF NOT EXISTS terrain_analysis
@@ -147,224 +309,14 @@ def init_db():
 
 init_db()
 
-def get_model(detection_type):
-    """Load and return the appropriate model"""
-    model_path = MODELS.get(detection_type)
-    if model_path and os.path.exists(model_path):
-        try:
-            model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path, force_reload=False)
-            model.conf = 0.25
-            return model
-        except Exception as e:
-            print(f"Error loading model {detection_type}: {e}")
-            return None
-    else:
-        print(f"Model path not found: {model_path}")
-        return None
-
-def save_complaint(detection_type, confidence, image_path=None, description=""):
-    """Save detection as a complaint in database"""
-    conn = sqlite3.connect('complaints.db')
-    c = conn.cursor()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    c.execute('''INSERT INTO complaints 
-                 (detection_type, confidence, timestamp, location, description, image_path) 
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (detection_type, confidence, timestamp, "Live Detection", description, image_path))
-    conn.commit()
-    conn.close()
-
-def generate_live_frames(detection_type):
-    """Generate live camera frames with object detection"""
-    global live_camera, live_detection_active
-    
-    model = get_model(detection_type)
-    if not model:
-        # Return a black frame if model fails to load
-        black_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(black_frame, "Model not available", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        ret, buffer = cv2.imencode('.jpg', black_frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        return
-    
-    live_camera = cv2.VideoCapture(0)
-    live_detection_active = True
-    
-    while live_detection_active:
-        success, frame = live_camera.read()
-        if not success:
-            break
-        
-        try:
-            # Perform detection
-            results = model(frame)
-            predictions = results.pandas().xyxy[0]
-            
-            # Draw bounding boxes and labels
-            for _, row in predictions.iterrows():
-                if row['confidence'] > 0.25:  # Confidence threshold
-                    x1, y1, x2, y2 = int(row['xmin']), int(row['ymin']), int(row['xmax']), int(row['ymax'])
-                    label = f"{row['name']} {row['confidence']:.2f}"
-                    color = (0, 255, 0) if detection_type == 'pothole' else (0, 0, 255)
-                    
-                    # Draw bounding box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Draw label background
-                    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-                    cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
-                    
-                    # Draw label text
-                    cv2.putText(frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    
-                    # Save high confidence detections
-                    if row['confidence'] > 0.7:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        image_path = f"static/uploads/live_detection_{timestamp}.jpg"
-                        cv2.imwrite(image_path, frame)
-                        save_complaint(detection_type, float(row['confidence']), image_path,
-                                     "Detected in live camera feed")
-            
-            # Add status overlay
-            cv2.putText(frame, f"Live {detection_type.title()} Detection", (10, 30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(frame, "Press 'q' to quit", (10, 60), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                       
-        except Exception as e:
-            print(f"Live detection error: {e}")
-            cv2.putText(frame, f"Error: {str(e)}", (10, 30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-        
-        # Encode frame
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        
+def generate_live_frames(detection_type, source=None):
+    """Multipart MJPEG stream of the shared live pipeline for a video source and detection type"""
+    if source is None:
+        source = video_sources.default
+    for frame_bytes in live_streams.subscribe(source, detection_type):
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-    
-    if live_camera:
-        live_camera.release()
 
-def generate_processed_frames(video_path, detection_type, session_id):
-    """Generate processed video frames with bounding boxes"""
-    model = get_model(detection_type)
-    if not model:
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + 
-               cv2.imencode('.jpg', np.zeros((480, 640, 3), dtype=np.uint8))[1].tobytes() + 
-               b'\r\n')
-        return
-    
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error opening video file: {video_path}")
-        return
-    
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    processing_videos[session_id] = {
-        'status': 'processing',
-        'current_frame': 0,
-        'total_frames': total_frames,
-        'detections': []
-    }
-    
-    frame_count = 0
-    detections_found = 0
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        frame_count += 1
-        processing_videos[session_id]['current_frame'] = frame_count
-        
-        # Perform detection on every frame for real-time streaming
-        try:
-            results = model(frame)
-            predictions = results.pandas().xyxy[0]
-            
-            frame_detections = []
-            
-            # Draw bounding boxes and labels
-            for _, row in predictions.iterrows():
-                if row['confidence'] > 0.25:  # Confidence threshold
-                    x1, y1, x2, y2 = int(row['xmin']), int(row['ymin']), int(row['xmax']), int(row['ymax'])
-                    label = f"{row['name']} {row['confidence']:.2f}"
-                    color = (0, 255, 0) if detection_type == 'pothole' else (0, 0, 255)
-                    
-                    # Draw bounding box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Draw label background
-                    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-                    cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
-                    
-                    # Draw label text
-                    cv2.putText(frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    
-                    detection_info = {
-                        'frame': frame_count,
-                        'type': row['name'],
-                        'confidence': float(row['confidence']),
-                        'bbox': [x1, y1, x2, y2]
-                    }
-                    frame_detections.append(detection_info)
-                    
-                    # Save high confidence detections
-                    if row['confidence'] > 0.7:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        image_path = f"static/uploads/detection_{timestamp}_{frame_count}.jpg"
-                        cv2.imwrite(image_path, frame)
-                        save_complaint(detection_type, float(row['confidence']), image_path,
-                                     f"Detected in uploaded video at frame {frame_count}")
-                        detections_found += 1
-            
-            if frame_detections:
-                processing_videos[session_id]['detections'].extend(frame_detections)
-                
-        except Exception as e:
-            print(f"Error processing frame {frame_count}: {e}")
-        
-        # Add processing info overlay
-        progress = (frame_count / total_frames) * 100
-        info_text = f"Frame: {frame_count}/{total_frames} | Detections: {detections_found} | Progress: {progress:.1f}%"
-        cv2.putText(frame, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(frame, f"Detection: {detection_type}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        # Resize frame for faster streaming if needed
-        frame = resize_frame(frame, max_width=800)
-        
-        # Encode frame
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-        frame_bytes = buffer.tobytes()
-        
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        # Small delay to simulate real-time processing (adjust as needed)
-        time.sleep(0.03)  # ~30 FPS
-    
-    cap.release()
-    processing_videos[session_id]['status'] = 'completed'
-    processing_videos[session_id]['total_detections'] = detections_found
-    
-    print(f"Video processing completed. Total detections: {detections_found}")
-
-def resize_frame(frame, max_width=800):
-    """Resize frame while maintaining aspect ratio"""
-    height, width = frame.shape[:2]
-    if width > max_width:
-        ratio = max_width / width
-        new_width = max_width
-        new_height = int(height * ratio)
-        frame = cv2.resize(frame, (new_width, new_height))
-    return frame
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -375,30 +327,125 @@ def main():
 
 @app.route('/live_detection')
 def live_detection():
-    return render_template('live_detection.html')
+    return render_template('live_detection.html', sources=video_sources.describe(),
+                           default_source=video_sources.default)
 
 @app.route('/video_feed/<detection_type>')
 def video_feed(detection_type):
     """Live camera feed with detection"""
+    if not known_detection_type(detection_type):
+        return "Detection type not found", 404
     return Response(generate_live_frames(detection_type),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/video_feed/<source>/<detection_type>')
+def source_video_feed(source, detection_type):
+    """Live feed of a named video source with detection"""
+    if video_sources.get(source) is None:
+        return "Video source not found", 404
+    if not known_detection_type(detection_type):
+        return "Detection type not found", 404
+    return Response(generate_live_frames(detection_type, source),
+                   mimetype='multipart/x-mixed-replace; boundary=frame')
+
 @app.route('/start_live_detection/<detection_type>')
 def start_live_detection(detection_type):
-    """Start live detection"""
-    global current_live_detection_type
-    current_live_detection_type = detection_type
+    """Start live detection; the pipeline itself starts when the feed is opened"""
     return jsonify({'status': 'started', 'type': detection_type})
 
 @app.route('/stop_live_detection')
 def stop_live_detection():
-    """Stop live detection"""
-    global live_detection_active, live_camera
-    live_detection_active = False
-    if live_camera:
-        live_camera.release()
-        live_camera = None
-    return jsonify({'status': 'stopped'})
+    """
+    Stop live detection for this viewer
+    Closing the feed unsubscribes it; the shared pipeline stops once no viewers remain
+    """
+    return jsonify({'status': 'stopped', 'live_streams': live_streams.stats()})
+
+@app.route('/api/live/status')
+def get_live_status():
+    """Shared live pipelines with their subscriber counts, target and achieved rates and lag"""
+    return jsonify(live_streams.stats())
+
+@app.route('/api/live/sources')
+def get_live_sources():
+    """Configured video sources (without their URIs) and the default one"""
+    return jsonify({'default': video_sources.default, 'sources': video_sources.describe()})
+
+@app.route('/api/models/status')
+def get_models_status():
+    """Loaded detection models with load time and resident size, and the inference batching counters"""
+    return jsonify(dict(model_registry.stats(), inference=inference_service.stats()))
+
+@app.route('/api/complaints/writer_status')
+def get_complaint_writer_status():
+    """Queue depth and backpressure counters of the background complaint writer"""
+    return jsonify(complaint_writer.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format stage histograms, stream counts, queue depths and dropped frames"""
+    live = live_streams.stats()
+    writer = complaint_writer.stats()
+    jobs = video_jobs.stats()
+    streams = [(s, {'source': s['source'], 'detection_type': s['detection_type']}) for s in live['streams']]
+
+    lines = pipeline_metrics.exposition()
+    lines += inference_service.exposition()
+    lines += metric_lines('sanchar_live_active_streams', 'gauge', 'Running live pipelines',
+                          [({}, live['active_streams'])])
+    lines += metric_lines('sanchar_live_subscribers', 'gauge', 'Viewers of live pipelines',
+                          [(labels, s['subscribers']) for s, labels in streams])
+    lines += metric_lines('sanchar_live_frames_total', 'counter', 'Live frames per pipeline step',
+                          [(dict(labels, step=step), s[f'frames_{step}']) for s, labels in streams
+                           for step in ('captured', 'inferred', 'skipped', 'encoded')])
+    lines += metric_lines('sanchar_live_frames_dropped_total', 'counter',
+                          'Live frames replaced before the next stage took them',
+                          [(dict(labels, stage=stage), count) for s, labels in streams
+                           for stage, count in s['dropped_frames'].items()])
+    lines += metric_lines('sanchar_live_output_fps', 'gauge', 'Encoded live frames per second',
+                          [(labels, s['output_fps']) for s, labels in streams])
+    lines += metric_lines('sanchar_live_capture_fps', 'gauge', 'Captured live frames per second',
+                          [(labels, s['fps']) for s, labels in streams])
+    lines += metric_lines('sanchar_live_target_fps', 'gauge', 'Configured frame rate of each live source',
+                          [(labels, s['target_fps']) for s, labels in streams if s['target_fps']])
+    lines += metric_lines('sanchar_live_lag_seconds', 'gauge',
+                          'Capture to detection done, over the recent frames of each stream',
+                          [(dict(labels, quantile=quantile), s['lag_ms'][key] / 1000) for s, labels in streams
+                           for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'))
+                           if s['lag_ms'][key] is not None])
+    lines += metric_lines('sanchar_live_source_reconnects_total', 'counter', 'Reconnects of live stream sources',
+                          [(labels, s['reconnects']) for s, labels in streams])
+    if live['scheduler'] is not None:
+        lines += metric_lines('sanchar_live_inference_workers', 'gauge', 'Shared live detection workers by state',
+                              [({'state': 'busy'}, live['scheduler']['busy']),
+                               ({'state': 'idle'}, live['scheduler']['workers'] - live['scheduler']['busy'])])
+        lines += metric_lines('sanchar_live_sources_waiting', 'gauge', 'Live sources waiting for a detection worker',
+                              [({}, live['scheduler']['waiting'])])
+    lines += metric_lines('sanchar_live_clip_buffer_bytes', 'gauge', 'Encoded frames kept for incident clips',
+                          [(labels, s['clip_buffer_bytes']) for s, labels in streams])
+    if live['clips'] is not None:
+        lines += metric_lines('sanchar_live_clips_total', 'counter', 'Incident clips by outcome',
+                              [({'outcome': outcome}, live['clips'][outcome])
+                               for outcome in ('written', 'dropped', 'failed')])
+    lines += metric_lines('sanchar_video_jobs', 'gauge', 'Upload analysis jobs by status',
+                          [({'status': status}, count) for status, count in jobs['jobs'].items()])
+    if jobs['pending_events'] is not None:
+        lines += metric_lines('sanchar_video_pending_events', 'gauge', 'Worker events not yet applied',
+                              [({}, jobs['pending_events'])])
+    lines += metric_lines('sanchar_complaint_queue_depth', 'gauge', 'Complaints waiting to be written',
+                          [({}, writer['queue_depth'])])
+    lines += metric_lines('sanchar_complaint_queue_capacity', 'gauge', 'Complaint writer queue size',
+                          [({}, writer['queue_capacity'])])
+    lines += metric_lines('sanchar_complaints_dropped_total', 'counter', 'Complaints dropped under backpressure',
+                          [({}, writer['dropped'])])
+    lines += metric_lines('sanchar_complaints_written_total', 'counter', 'Complaints written to the database',
+                          [({}, writer['written'])])
+    lines += metric_lines('sanchar_complaint_snapshots_failed_total', 'counter',
+                          'Snapshots that could not be written; their complaints are saved without an image',
+                          [({}, writer['snapshots_failed'])])
+    lines += metric_lines('sanchar_model_resident_mb', 'gauge', 'Approximate memory of loaded models',
+                          [({}, model_registry.stats()['resident_mb'])])
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
 
 @app.route('/video_upload')
 def video_upload():
@@ -406,16 +453,16 @@ def video_upload():
 
 @app.route('/video_stream/<session_id>')
 def video_stream(session_id):
-    """Stream processed video with detections"""
-    video_info = processing_videos.get(session_id)
-    if not video_info:
+    """Stream the annotated frames of a background analysis job"""
+    if not video_jobs.get(session_id):
         return "Video not found", 404
     
-    video_path = video_info['video_path']
-    detection_type = video_info['detection_type']
+    def generate():
+        for frame_bytes in video_jobs.tail(session_id):
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
     
-    return Response(generate_processed_frames(video_path, detection_type, session_id),
-                   mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/upload_video', methods=['POST'])
 def upload_video():
@@ -430,27 +477,75 @@ def upload_video():
             return jsonify({'error': 'No file selected'}), 400
         
         if file and allowed_file(file.filename):
+            # Options are parsed before anything is stored, so a rejected upload leaves nothing behind
+            # Optional detector stride: a number of frames, or 'auto' to adapt to motion
+            options = {}
+            detection_stride = request.form.get('detection_stride', '').strip().lower()
+            if detection_stride == 'auto':
+                options['adaptive_stride'] = True
+            elif detection_stride.isdigit() and int(detection_stride) > 0:
+                options['detection_stride'] = int(detection_stride)
+                options['adaptive_stride'] = False
+            
+            # Optional parallel segments: a number, or 'auto' for one per worker process
+            segments = request.form.get('segments', '').strip().lower()
+            if segments == 'auto':
+                options['segments'] = video_jobs.max_workers
+            elif segments.isdigit() and int(segments) > 0:
+                options['segments'] = int(segments)
+            
+            # Optional model input size, rounded up to the network stride
+            inference_size = request.form.get('inference_size', '').strip()
+            if inference_size.isdigit() and int(inference_size) > 0:
+                options['inference_size'] = make_divisible(min(int(inference_size), 1920))
+            
+            # Optional road region of interest ('auto' or a JSON polygon) and tile grid
+            try:
+                roi = request.form.get('roi', '').strip()
+                if roi:
+                    options['roi'] = 'auto' if roi.lower() == 'auto' else parse_polygon(roi)
+                roi_tiles = request.form.get('roi_tiles', '').strip()
+                if roi_tiles:
+                    options['roi_tiles'] = parse_tiles(roi_tiles)
+            except (ValueError, TypeError) as e:
+                return jsonify({'error': f'Invalid region of interest: {str(e)}'}), 400
+            
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            extension = filename.rsplit('.', 1)[1].lower()
+            # Hashed while streamed to disk; identical uploads share one stored file
+            filepath, video_digest, duplicate = save_upload(file.stream, app.config['UPLOAD_FOLDER'], extension)
             
             # Create unique session ID for this processing job
             session_id = f"{int(time.time())}_{filename}"
             
             # Store video info
-            processing_videos[session_id] = {
-                'filename': filename,
-                'video_path': filepath,
-                'detection_type': detection_type,
-                'status': 'uploaded',
-                'upload_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
+            result_store.create(
+                session_id,
+                filename=filename,
+                video_path=filepath,
+                detection_type=detection_type,
+                upload_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
+            
+            # A repeat upload analysed with the same models and settings is answered from the cache
+            model_specs = {name: model_registry.spec(name) for name in model_registry.types(detection_type)}
+            cache_key = result_cache.key(video_digest, detection_type, model_specs, video_jobs.job_settings(options))
+            cached = result_cache.lookup(cache_key)
+            if cached:
+                preview = result_cache.restore(cache_key, result_store.results(session_id))
+                video_jobs.restore(session_id, filepath, detection_type, cached, preview)
+            else:
+                # Analysis runs in the background whether or not anyone is watching
+                result_cache.expect(session_id, cache_key)
+                video_jobs.submit(session_id, filepath, detection_type, options)
             
             return jsonify({
                 'status': 'success',
                 'message': 'Video uploaded successfully',
                 'session_id': session_id,
-                'filename': filename
+                'filename': filename,
+                'cache': 'hit' if cached else 'miss',
+                'duplicate_upload': duplicate
             })
         else:
             return jsonify({'error': 'Invalid file type. Allowed types: mp4, avi, mov, wmv, mkv, flv'}), 400
@@ -460,37 +555,103 @@ def upload_video():
 
 @app.route('/get_processing_status/<session_id>')
 def get_processing_status(session_id):
-    """Get current processing status"""
-    video_info = processing_videos.get(session_id)
-    if not video_info:
+    """
+    Get current processing status with the detections found since the caller's cursor
+    ?since=<detection index> or ?since_frame=<frame> returns only newer detections (up to a page)
+    and the next cursor; without either, the most recent detections are returned.
+    ?timeline_since=<frame> adds per-frame detection counts for the frames after it
+    """
+    job = video_jobs.get(session_id)
+    if not job or not result_store.get(session_id):
         return jsonify({'error': 'Session not found'}), 404
     
-    return jsonify({
-        'status': video_info.get('status', 'unknown'),
-        'current_frame': video_info.get('current_frame', 0),
-        'total_frames': video_info.get('total_frames', 0),
-        'detections': video_info.get('detections', []),
-        'total_detections': video_info.get('total_detections', 0)
-    })
+    status = job.progress()
+    results = result_store.results(session_id)
+    limit = app.config.get('RESULTS_MAX_PAGE_SIZE')
+    since = request.args.get('since', type=int)
+    since_frame = request.args.get('since_frame', type=int)
+    if since_frame is not None and since is None:
+        since = results.index_after_frame(since_frame)
+    if since is None:
+        limit = app.config.get('STATUS_RECENT_DETECTIONS')
+        since = max(job.detection_count - limit, 0)
+    
+    # Read no further than the count the worker last reported, so the cursor never skips records
+    since = min(max(since, 0), job.detection_count)
+    status['detections'] = results.page(since, min(limit, job.detection_count - since))
+    status['cursor'] = since + len(status['detections'])
+    
+    timeline_since = request.args.get('timeline_since', type=int)
+    if timeline_since is not None:
+        timeline_since = max(timeline_since, 0)
+        status['timeline'] = {
+            'start_frame': timeline_since + 1,
+            'counts': results.timeline(timeline_since, max(job.current_frame - timeline_since, 0))
+        }
+    if job.status == 'completed' and results.annotated_video():
+        status['annotated_video'] = url_for('annotated_video', session_id=session_id)
+    return jsonify(status)
 
 @app.route('/get_detection_results/<session_id>')
 def get_detection_results(session_id):
-    """Get final detection results"""
-    video_info = processing_videos.get(session_id)
-    if not video_info:
+    """Get final detection results, one page of the stored detections at a time"""
+    job = video_jobs.get(session_id)
+    video_info = result_store.get(session_id)
+    if not job or not video_info:
         return jsonify({'error': 'Session not found'}), 404
     
-    if video_info.get('status') != 'completed':
+    if job.status != 'completed':
         return jsonify({'error': 'Processing not completed'}), 400
     
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', app.config.get('RESULTS_PAGE_SIZE'), type=int), 1),
+                app.config.get('RESULTS_MAX_PAGE_SIZE'))
+    results = result_store.results(session_id)
+    detections = results.page(offset, limit)
+    next_offset = offset + len(detections)
+    has_video = results.annotated_video() is not None
+    
     return jsonify({
         'status': 'completed',
-        'total_detections': video_info.get('total_detections', 0),
-        'detections': video_info.get('detections', []),
+        'total_detections': job.total_detections,
+        'detection_count': job.detection_count,
+        'detections': detections,
+        'offset': offset,
+        'next_offset': next_offset if next_offset < job.detection_count else None,
         'filename': video_info.get('filename', ''),
-        'detection_type': video_info.get('detection_type', '')
+        'detection_type': video_info.get('detection_type', ''),
+        'annotated_video': url_for('annotated_video', session_id=session_id) if has_video else None,
+        'sidecar': url_for('annotated_video_sidecar', session_id=session_id) if has_video else None
     })
 
+@app.route('/annotated_video/<session_id>')
+def annotated_video(session_id):
+    """
+    The finished annotated video of an upload, written once by the analysis
+    Range requests are honoured so players can seek; replay runs no inference
+    """
+    if not result_store.get(session_id):
+        return "Video not found", 404
+    path = result_store.results(session_id).annotated_video()
+    if not path:
+        return "Annotated video not available", 404
+    return send_file(os.path.abspath(path), mimetype=VIDEO_MIMETYPES[path.rsplit('.', 1)[-1]], conditional=True)
+
+@app.route('/annotated_video/<session_id>/sidecar')
+def annotated_video_sidecar(session_id):
+    """The annotated video's detections as one JSON file"""
+    if not result_store.get(session_id):
+        return "Video not found", 404
+    path = result_store.results(session_id).sidecar_path
+    if not os.path.exists(path):
+        return "Annotated video not available", 404
+    return send_file(os.path.abspath(path), mimetype='application/json', conditional=True)
+
+@app.route('/api/sessions/status')
+def get_sessions_status():
+    """Stored video sessions, detections on disk, evictions and result cache hits"""
+    return jsonify(dict(result_store.stats(), result_cache=result_cache.stats()))
+
 @app.route('/complaints')
 def complaints():
     conn = sqlite3.connect('complaints.db')
@@ -499,7 +660,8 @@ def complaints():
     complaints_data = c.fetchall()
     conn.close()
     
-    return render_template('complaints.html', complaints=complaints_data)
+    clips = {complaint[0]: clip_if_written(complaint) for complaint in complaints_data}
+    return render_template('complaints.html', complaints=complaints_data, clips=clips)
 
 @app.route('/add_complaint', methods=['POST'])
 def add_complaint():
@@ -520,21 +682,29 @@ def delete_complaint(complaint_id):
     conn = sqlite3.connect('complaints.db')
     c = conn.cursor()
     
-    # Get image path before deletion
-    c.execute('SELECT image_path FROM complaints WHERE id = ?', (complaint_id,))
+    # Get image and clip paths before deletion
+    c.execute('SELECT image_path, clip_path FROM complaints WHERE id = ?', (complaint_id,))
     result = c.fetchone()
     
     # Delete the complaint
     c.execute('DELETE FROM complaints WHERE id = ?', (complaint_id,))
+    
+    # Incidents close together share one clip; keep it while another complaint links to it
+    paths = [result[0]] if result else []
+    if result and result[1]:
+        c.execute('SELECT COUNT(*) FROM complaints WHERE clip_path = ?', (result[1],))
+        if c.fetchone()[0] == 0:
+            paths.append(result[1])
     conn.commit()
     conn.close()
     
-    # Delete associated image file if it exists
-    if result and result[0] and os.path.exists(result[0]):
-        try:
-            os.remove(result[0])
-        except Exception as e:
-            print(f"Error deleting image file: {e}")
+    # Delete associated files if they exist
+    for path in paths:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except Exception as e:
+                print(f"Error deleting complaint file: {e}")
     
     flash('Complaint deleted successfully!', 'success')
     return redirect(url_for('complaints'))
@@ -1010,7 +1180,8 @@ def get_all_complaints_with_location():
             'image_path': complaint[6],
             'latitude': complaint[7] if len(complaint) > 7 else None,
             'longitude': complaint[8] if len(complaint) > 8 else None,
-            'address': complaint[9] if len(complaint) > 9 else None
+            'address': complaint[9] if len(complaint) > 9 else None,
+            'clip_path': clip_if_written(complaint)
         })
     
     return jsonify({'complaints': complaints_list})
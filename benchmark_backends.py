@@ -0,0 +1,153 @@
+"""
+Inference Backend Benchmark
+Compares frames/sec of the PyTorch models against the ONNX Runtime / OpenVINO backends,
+and checks that their detections agree with PyTorch within the documented tolerance
+
+Usage:
+    python benchmark_backends.py sample.mp4 --type pothole --backends pytorch onnx onnx-int8 openvino
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from config import Config
+from detection_pipeline import infer_batch, class_name_lookup, postprocess_detections
+from model_registry import ModelRegistry
+from object_tracking import iou_matrix, greedy_match
+from onnx_backend import TOLERANCES
+
+
+def read_frames(video_path, count):
+    """Decode the first frames up front so only inference is timed"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_backend(registry, detection_type, frames, batch_size):
+    """Detections for every frame and the measured frames/sec"""
+    model = registry.get(detection_type)
+    if model is None:
+        return None, 0.0
+    input_size = registry.input_size(detection_type, Config.INFERENCE_SIZE)
+    class_names = class_name_lookup(model.names)
+
+    detections = []
+    start = time.perf_counter()
+    for index in range(0, len(frames), batch_size):
+        for pred in infer_batch(model, frames[index:index + batch_size], input_size):
+            detections.append(postprocess_detections(
+                pred, class_names, Config.YOLO_CONFIDENCE_THRESHOLD, Config.HIGH_CONFIDENCE_THRESHOLD
+            ))
+    elapsed = time.perf_counter() - start
+    return detections, len(frames) / elapsed if elapsed else 0.0
+
+
+def agreement(detections, reference, iou_threshold=0.5):
+    """Recall of the reference boxes, mean IoU of matches and largest confidence difference"""
+    matched = total = 0
+    iou_total = 0.0
+    confidence_delta = 0.0
+    for predicted, expected in zip(detections, reference):
+        total += len(expected)
+        if not len(predicted) or not len(expected):
+            continue
+        iou = iou_matrix(expected.boxes, predicted.boxes)
+        iou = np.where(expected.class_ids[:, None] == predicted.class_ids[None, :], iou, 0.0)
+        rows, cols = greedy_match(iou, iou_threshold)
+        matched += len(rows)
+        iou_total += float(iou[rows, cols].sum())
+        if len(rows):
+            delta = np.abs(expected.confidences[rows] - predicted.confidences[cols]).max()
+            confidence_delta = max(confidence_delta, float(delta))
+    return {
+        'recall': round(matched / total, 4) if total else 1.0,
+        'mean_iou': round(iou_total / matched, 4) if matched else 1.0,
+        'max_confidence_delta': round(confidence_delta, 4)
+    }
+
+
+def within_tolerance(result, precision):
+    tolerance = TOLERANCES[precision]
+    return (result['recall'] >= tolerance['min_recall']
+            and result['mean_iou'] >= tolerance['min_mean_iou']
+            and result['max_confidence_delta'] <= tolerance['max_confidence_delta'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='Sample clip to benchmark')
+    parser.add_argument('--type', default='pothole', choices=sorted(Config.MODELS), help='Detection type')
+    parser.add_argument('--backends', nargs='+', default=['pytorch', 'onnx', 'onnx-int8'],
+                        help="Backends to compare; append '-int8' for a quantized model")
+    parser.add_argument('--frames', type=int, default=200, help='Frames to run through each backend')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--calibration', help='Video or image directory for INT8 calibration (default: the clip)')
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    frames = read_frames(args.video, args.frames)
+    if not frames:
+        raise SystemExit(f"No frames could be read from {args.video}")
+
+    base_spec = ModelRegistry(Config.MODELS).spec(args.type)
+    backends = ['pytorch'] + [b for b in args.backends if b != 'pytorch']
+    results = []
+    reference = None
+    for name in backends:
+        backend, _, precision = name.partition('-')
+        precision = precision or 'fp32'
+        spec = dict(base_spec, backend=backend, precision=precision,
+                    calibration=base_spec.get('calibration') or args.calibration or args.video)
+        registry = ModelRegistry({args.type: spec}, confidence=Config.YOLO_CONFIDENCE_THRESHOLD)
+
+        print(f"Running {name} on {len(frames)} frames...")
+        detections, fps = run_backend(registry, args.type, frames, args.batch_size)
+        if detections is None:
+            print(f"  {name} could not be loaded, skipping")
+            continue
+
+        result = {'backend': name, 'fps': round(fps, 1), 'ms_per_frame': round(1000 / fps, 2) if fps else None}
+        if reference is None:
+            reference = detections
+        else:
+            result.update(agreement(detections, reference))
+            result['within_tolerance'] = within_tolerance(result, precision)
+        results.append(result)
+
+    baseline_fps = results[0]['fps'] if results else 0.0
+    print(f"\n{'backend':>14} {'fps':>7} {'speedup':>8} {'recall':>7} {'mIoU':>6} {'max dconf':>9} {'ok':>4}")
+    for r in results:
+        speedup = r['fps'] / baseline_fps if baseline_fps else 0.0
+        r['speedup'] = round(speedup, 2)
+        if 'recall' in r:
+            print(f"{r['backend']:>14} {r['fps']:>7.1f} {speedup:>7.2f}x {r['recall']:>7.3f} {r['mean_iou']:>6.3f} "
+                  f"{r['max_confidence_delta']:>9.3f} {'yes' if r['within_tolerance'] else 'NO':>4}")
+        else:
+            print(f"{r['backend']:>14} {r['fps']:>7.1f} {speedup:>7.2f}x {'(reference)':>28}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'video': args.video,
+                'detection_type': args.type,
+                'frames': len(frames),
+                'batch_size': args.batch_size,
+                'tolerances': TOLERANCES,
+                'results': results
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Inference Batching Benchmark
+Compares total frames/sec of concurrent producers calling a model directly against the same
+producers sharing the micro-batching inference service, at increasing numbers of producers
+
+Usage:
+    python benchmark_batching.py --producers 1 2 4 8 --latency-ms 20 --per-frame-ms 2
+    python benchmark_batching.py --model real --type pothole --producers 1 4 8 --output batching.json
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from benchmark_pipeline import build_registry
+from config import Config
+from detection_pipeline import infer_batch
+from inference_service import InferenceService
+
+
+def run_producers(get_model, producers, bulk_producers, frames, image, input_size):
+    """Frames/sec over all producers, plus each lane's mean latency per frame in milliseconds"""
+    latencies = {'live': [], 'bulk': []}
+    lock = threading.Lock()
+
+    def produce(lane):
+        model = get_model(lane)
+        for _ in range(frames):
+            start = time.perf_counter()
+            infer_batch(model, [image], input_size)
+            with lock:
+                latencies[lane].append(time.perf_counter() - start)
+
+    lanes = ['live'] * producers + ['bulk'] * bulk_producers
+    threads = [threading.Thread(target=produce, args=(lane,)) for lane in lanes]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'fps': round(len(lanes) * frames / elapsed, 1),
+        'latency_ms': {lane: round(float(np.mean(values)) * 1000, 1) for lane, values in latencies.items() if values}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='stub', choices=['stub', 'real'])
+    parser.add_argument('--type', default='pothole', choices=sorted(Config.MODELS))
+    parser.add_argument('--producers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Concurrent live producers to test')
+    parser.add_argument('--bulk-producers', type=int, default=0,
+                        help='Bulk producers running alongside, to show the live lane priority')
+    parser.add_argument('--frames', type=int, default=50, help='Frames per producer')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Stub delay per forward pass')
+    parser.add_argument('--per-frame-ms', type=float, default=2.0, help='Stub delay per image in a pass')
+    parser.add_argument('--max-batch-size', type=int, default=Config.INFERENCE_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=Config.INFERENCE_MAX_WAIT_MS)
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    registry = build_registry(args.model, args.latency_ms, args.per_frame_ms)
+    if registry.get(args.type) is None:
+        raise SystemExit(f"No {args.type} model could be loaded")
+    input_size = registry.input_size(args.type, Config.INFERENCE_SIZE)
+    image = np.random.default_rng(0).integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+    service = InferenceService(registry, args.max_batch_size, args.max_wait_ms / 1000)
+
+    results = []
+    print(f"{'producers':>9} {'direct fps':>11} {'batched fps':>12} {'speedup':>8} {'live ms':>8} {'bulk ms':>8}")
+    for producers in args.producers:
+        # The registry model is not thread-safe, so direct callers take turns as they do today
+        model_lock = threading.Lock()
+        model = registry.get(args.type)
+
+        def direct(images, size=None):
+            with model_lock:
+                return model(images, size=size)
+        direct.names = model.names
+
+        baseline = run_producers(lambda lane: direct, producers, args.bulk_producers, args.frames, image,
+                                 input_size)
+        batched = run_producers(lambda lane: service.lane(lane).get(args.type), producers, args.bulk_producers,
+                                args.frames, image, input_size)
+        speedup = batched['fps'] / baseline['fps'] if baseline['fps'] else 0.0
+        results.append({'producers': producers, 'direct': baseline, 'batched': batched, 'speedup': round(speedup, 2)})
+        print(f"{producers:>9} {baseline['fps']:>11.1f} {batched['fps']:>12.1f} {speedup:>7.2f}x "
+              f"{batched['latency_ms'].get('live', 0):>8.1f} {batched['latency_ms'].get('bulk', 0):>8.1f}")
+    service.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'config': {
+                    'model': args.model,
+                    'detection_type': args.type,
+                    'frames': args.frames,
+                    'bulk_producers': args.bulk_producers,
+                    'stub_latency_ms': args.latency_ms if args.model == 'stub' else None,
+                    'stub_per_frame_ms': args.per_frame_ms if args.model == 'stub' else None,
+                    'max_batch_size': args.max_batch_size,
+                    'max_wait_ms': args.max_wait_ms
+                },
+                'results': results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Detection Stride Benchmark
+Measures accuracy vs. speed of running the detector every k frames with tracking in between
+
+Usage:
+    python benchmark_detection_stride.py sample.mp4 --type pothole --strides 1 2 4 8 auto
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from config import Config
+from detection_pipeline import FrameReader, infer_batch, class_name_lookup, postprocess_detections
+from model_registry import ModelRegistry
+from object_tracking import IoUTracker, StrideController, frame_motion, iou_matrix, greedy_match
+
+
+def detect_every_frame(model, video_path, batch_size, input_size=None):
+    """Reference detections for every frame, plus the mean inference cost per frame"""
+    cap = cv2.VideoCapture(video_path)
+    reader = FrameReader(cap, buffer_size=batch_size * 4)
+    class_names = class_name_lookup(model.names)
+    reference = []
+    inference_time = 0.0
+    try:
+        for batch in reader.batches(batch_size):
+            start = time.perf_counter()
+            predictions = infer_batch(model, [frame for _, frame in batch], input_size)
+            inference_time += time.perf_counter() - start
+            for pred in predictions:
+                reference.append(postprocess_detections(
+                    pred, class_names, Config.YOLO_CONFIDENCE_THRESHOLD, Config.HIGH_CONFIDENCE_THRESHOLD
+                ))
+    finally:
+        reader.close()
+        cap.release()
+    return reference, inference_time / max(len(reference), 1)
+
+
+def compare(predicted, reference, iou_threshold=0.5):
+    """True positives, false positives, false negatives and summed IoU of matches"""
+    if not len(predicted) or not len(reference):
+        return 0, len(predicted), len(reference), 0.0
+    iou = iou_matrix(predicted.boxes, reference.boxes)
+    same_class = predicted.class_ids[:, None] == reference.class_ids[None, :]
+    iou = np.where(same_class, iou, 0.0)
+    rows, cols = greedy_match(iou, iou_threshold)
+    matched = len(rows)
+    return matched, len(predicted) - matched, len(reference) - matched, float(iou[rows, cols].sum())
+
+
+def run_stride(video_path, reference, stride, adaptive, max_stride):
+    """Replay the clip with keyframe detection and tracking, scoring against the reference"""
+    stride_control = StrideController(base_stride=stride, max_stride=max_stride, adaptive=adaptive)
+    tracker = IoUTracker()
+    previous_gray = None
+    keyframes = 0
+    true_pos = false_pos = false_neg = 0
+    iou_total = 0.0
+
+    cap = cv2.VideoCapture(video_path)
+    start = time.perf_counter()
+    frame_index = 0
+    while frame_index < len(reference):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gray = tracker.prepare(frame)
+        if stride_control.should_detect(frame_motion(previous_gray, gray)):
+            # A detector pass would produce exactly the reference output for this frame
+            detections = reference[frame_index]
+            tracker.update(detections, frame_index + 1, gray)
+            keyframes += 1
+        else:
+            detections = tracker.propagate(gray)
+        previous_gray = gray
+
+        tp, fp, fn, iou_sum = compare(detections, reference[frame_index])
+        true_pos += tp
+        false_pos += fp
+        false_neg += fn
+        iou_total += iou_sum
+        frame_index += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+
+    precision = true_pos / (true_pos + false_pos) if true_pos + false_pos else 1.0
+    recall = true_pos / (true_pos + false_neg) if true_pos + false_neg else 1.0
+    return {
+        'stride': 'auto' if adaptive else stride,
+        'frames': frame_index,
+        'keyframes': keyframes,
+        'inference_fraction': round(keyframes / max(frame_index, 1), 3),
+        'precision': round(precision, 3),
+        'recall': round(recall, 3),
+        'f1': round(2 * precision * recall / (precision + recall), 3) if precision + recall else 0.0,
+        'mean_iou': round(iou_total / true_pos, 3) if true_pos else 0.0,
+        'decode_track_seconds': round(elapsed, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='Sample clip to benchmark')
+    parser.add_argument('--type', default='pothole', choices=sorted(Config.MODELS), help='Detection type')
+    parser.add_argument('--strides', nargs='+', default=['1', '2', '3', '4', '6', '8', 'auto'],
+                        help="Detector strides to compare; 'auto' uses the adaptive controller")
+    parser.add_argument('--max-stride', type=int, default=Config.VIDEO_MAX_DETECTION_STRIDE)
+    parser.add_argument('--batch-size', type=int, default=Config.YOLO_BATCH_SIZE)
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(Config.MODELS, confidence=Config.YOLO_CONFIDENCE_THRESHOLD)
+    model = registry.get(args.type)
+    if model is None:
+        raise SystemExit(f"Model for '{args.type}' could not be loaded")
+
+    print(f"Running reference detection on every frame of {args.video}...")
+    input_size = registry.input_size(args.type, Config.INFERENCE_SIZE)
+    reference, inference_seconds = detect_every_frame(model, args.video, args.batch_size, input_size)
+    print(f"  {len(reference)} frames, {inference_seconds * 1000:.1f} ms inference per frame")
+
+    results = []
+    for stride in args.strides:
+        adaptive = stride == 'auto'
+        result = run_stride(args.video, reference, 1 if adaptive else int(stride), adaptive, args.max_stride)
+
+        # Effective throughput: tracking/decode time plus inference on keyframes only
+        total_seconds = result['decode_track_seconds'] + result['keyframes'] * inference_seconds
+        result['estimated_fps'] = round(result['frames'] / total_seconds, 1) if total_seconds else 0.0
+        result['inference_fps'] = round(result['keyframes'] / total_seconds, 1) if total_seconds else 0.0
+        results.append(result)
+
+    print(f"\n{'stride':>6} {'infer%':>7} {'prec':>6} {'recall':>6} {'f1':>6} {'mIoU':>6} {'est fps':>8}")
+    for r in results:
+        print(f"{str(r['stride']):>6} {r['inference_fraction'] * 100:>6.1f}% {r['precision']:>6.3f} "
+              f"{r['recall']:>6.3f} {r['f1']:>6.3f} {r['mean_iou']:>6.3f} {r['estimated_fps']:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'video': args.video,
+                'detection_type': args.type,
+                'inference_ms_per_frame': round(inference_seconds * 1000, 2),
+                'results': results
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
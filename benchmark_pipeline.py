@@ -0,0 +1,363 @@
+"""
+Video Pipeline Benchmark
+Drives the uploaded-video and live pipelines end to end on a synthetic clip, with either
+deterministic stub models of configurable latency or the real models, and reports
+decode, inference, postprocess, draw, encode and yield timings as p50/p95/p99
+
+Usage:
+    python benchmark_pipeline.py --model stub --latency-ms 20 --output pipeline.json
+    python benchmark_pipeline.py --model real --type pothole --clip sample.mp4 --output pipeline.json
+    python benchmark_pipeline.py --paths sources --sources 16 --source-fps 10 --workers 4 --seconds 30
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import Config
+from inference_service import InferenceService
+from live_stream import LiveStreamManager
+from model_registry import ModelRegistry
+from roi import parse_tiles
+from stage_timings import StageTimings
+from video_jobs import generate_processed_frames
+from video_sources import RoundRobinScheduler, SourceRegistry
+
+
+def make_synthetic_clip(path, frames=300, size=(1280, 720), fps=30, objects=3, seed=0):
+    """
+    Write a road-like clip: a fixed grey texture with bright rectangles moving across it
+    The same arguments always produce the same clip
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = rng.integers(60, 110, size=(height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (7, 7), 0)
+    boxes = [
+        (rng.integers(0, width), rng.integers(height // 3, height - 80),
+         rng.integers(-12, 13), rng.integers(-3, 4), rng.integers(40, 120), rng.integers(30, 80))
+        for _ in range(objects)
+    ]
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    try:
+        for index in range(frames):
+            frame = background.copy()
+            for x, y, dx, dy, w, h in boxes:
+                left = int(x + dx * index) % width
+                top = int(np.clip(y + dy * index, 0, height - h))
+                cv2.rectangle(frame, (left, top), (min(left + w, width - 1), top + h), (235, 235, 235), -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+class StubResults:
+    def __init__(self, xyxy):
+        self.xyxy = xyxy
+
+
+class StubModel:
+    """
+    Stand-in for a YOLOv5 AutoShape model: reports bright blobs as class 0 after a fixed delay
+    latency_ms is paid once per forward pass and per_frame_ms once per image in it
+    """
+
+    def __init__(self, detection_type, latency_ms=20.0, per_frame_ms=0.0, min_area=400):
+        self.names = {0: detection_type}
+        self.latency_ms = latency_ms
+        self.per_frame_ms = per_frame_ms
+        self.min_area = min_area
+
+    def __call__(self, images, size=None):
+        if isinstance(images, np.ndarray):
+            images = [images]
+        time.sleep((self.latency_ms + self.per_frame_ms * len(images)) / 1000)
+        return StubResults([self._detect(image) for image in images])
+
+    def _detect(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        rows = [
+            [x, y, x + w, y + h, 0.9, 0]
+            for x, y, w, h, area in stats[1:count].tolist() if area >= self.min_area
+        ]
+        return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+class DiscardWriter:
+    """ComplaintWriter stand-in that only counts submissions, so the database is not timed"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return True
+
+    def drain(self, timeout=None):
+        return True
+
+
+def build_registry(model, latency_ms, per_frame_ms):
+    """The configured models, or the same detection types served by stub models"""
+    if model == 'real':
+        return ModelRegistry(Config.MODELS, confidence=Config.YOLO_CONFIDENCE_THRESHOLD)
+
+    specs = {
+        name: dict(spec, path=__file__, backend='stub', name=name) for name, spec in Config.MODELS.items()
+    }
+    registry = ModelRegistry(specs, confidence=Config.YOLO_CONFIDENCE_THRESHOLD, warmup=False)
+    registry.register_backend(
+        'stub', lambda path, confidence, spec: StubModel(spec['name'], latency_ms, per_frame_ms)
+    )
+    return registry
+
+
+def video_settings(registry, models, frame_pool=True):
+    """Job settings as app.py builds them for uploaded videos"""
+    return {
+        'conf_threshold': Config.YOLO_CONFIDENCE_THRESHOLD,
+        'high_conf_threshold': Config.HIGH_CONFIDENCE_THRESHOLD,
+        'batch_size': Config.YOLO_BATCH_SIZE,
+        'inference_sizes': {name: registry.input_size(name, Config.INFERENCE_SIZE) for name in models},
+        'display_width': Config.DISPLAY_MAX_WIDTH,
+        'roi': None,
+        'roi_tiles': parse_tiles(Config.ROI_TILES),
+        'roi_overlap': Config.ROI_TILE_OVERLAP,
+        'decode_buffer_size': Config.VIDEO_DECODE_BUFFER_SIZE,
+        'frame_pool': frame_pool,
+        'detection_stride': Config.VIDEO_DETECTION_STRIDE,
+        'max_detection_stride': Config.VIDEO_MAX_DETECTION_STRIDE,
+        'adaptive_stride': Config.VIDEO_ADAPTIVE_STRIDE,
+        'stitch_window': Config.VIDEO_STITCH_WINDOW,
+        'track_iou_threshold': Config.TRACK_IOU_THRESHOLD,
+        'track_max_misses': Config.TRACK_MAX_MISSES
+    }
+
+
+def live_settings(motion_gate, frame_pool=True):
+    """Live stream settings as app.py builds them"""
+    return {
+        'conf_threshold': Config.YOLO_CONFIDENCE_THRESHOLD,
+        'high_conf_threshold': Config.HIGH_CONFIDENCE_THRESHOLD,
+        'track_iou_threshold': Config.TRACK_IOU_THRESHOLD,
+        'track_max_misses': Config.TRACK_MAX_MISSES,
+        'incident_report_delay': Config.LIVE_INCIDENT_REPORT_DELAY,
+        'default_inference_size': Config.INFERENCE_SIZE,
+        'display_width': Config.DISPLAY_MAX_WIDTH,
+        'idle_grace': Config.LIVE_IDLE_GRACE_SECONDS,
+        'frame_pool': frame_pool,
+        'motion_gate': motion_gate,
+        'motion_threshold': Config.LIVE_MOTION_THRESHOLD,
+        'motion_pixel_delta': Config.LIVE_MOTION_PIXEL_DELTA,
+        'motion_max_interval': Config.LIVE_MOTION_MAX_INTERVAL,
+        'roi': None,
+        'roi_tiles': parse_tiles(Config.ROI_TILES),
+        'roi_overlap': Config.ROI_TILE_OVERLAP,
+        'roi_auto_frames': Config.ROI_AUTO_SAMPLE_FRAMES
+    }
+
+
+def multipart(jpeg):
+    """One part of the MJPEG response, framed as the streaming endpoints do"""
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+
+def run_video(registry, detection_type, clip, frame_pool=True):
+    """generate_processed_frames over the clip, encoding and framing every frame it yields"""
+    timings = StageTimings()
+    models = {name: registry.get(name) for name in registry.types(detection_type)}
+    if not all(models.values()):
+        return None
+    writer = DiscardWriter()
+    sink = io.BytesIO()
+    capture = cv2.VideoCapture(clip)
+    frames = 0
+    start = time.perf_counter()
+    try:
+        for result in generate_processed_frames(models, capture, detection_type,
+                                                video_settings(registry, models, frame_pool), writer,
+                                                timings=timings):
+            with timings.time('encode'):
+                ret, buffer = cv2.imencode('.jpg', result['frame'])
+            with timings.time('yield'):
+                sink.write(multipart(buffer.tobytes()))
+            sink.seek(0)
+            frames += 1
+    finally:
+        capture.release()
+    elapsed = time.perf_counter() - start
+    return {
+        'frames': frames,
+        'fps': round(frames / elapsed, 1) if elapsed else 0.0,
+        'complaints': writer.submitted,
+        'stages': timings.summary()
+    }
+
+
+def run_live(registry, detection_type, clip, motion_gate, frame_pool=True):
+    """The shared live pipeline reading the clip as its camera, with one subscriber"""
+    timings = StageTimings()
+    manager = LiveStreamManager(registry, DiscardWriter(), live_settings(motion_gate, frame_pool), timings)
+    sink = io.BytesIO()
+    frames = 0
+    start = time.perf_counter()
+    for jpeg in manager.subscribe(clip, detection_type):
+        sink.write(multipart(jpeg))
+        sink.seek(0)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    stats = manager.get(clip, detection_type).stats()
+    return {
+        'frames': frames,
+        'fps': round(frames / elapsed, 1) if elapsed else 0.0,
+        'frames_captured': stats['frames_captured'],
+        'frames_inferred': stats['frames_inferred'],
+        'frames_skipped': stats['frames_skipped'],
+        'dropped_frames': stats['dropped_frames'],
+        'frame_buffer_allocations': stats['frame_buffer_allocations'],
+        'stages': timings.summary()
+    }
+
+
+def run_sources(registry, detection_type, clip, count, fps, workers, seconds, motion_gate, frame_pool=True):
+    """
+    count copies of the clip as looping sources at fps, sharing workers detection threads and the
+    batching inference service as in app.py, each with one subscriber for the given seconds
+    """
+    sources = SourceRegistry({f"camera-{index}": {'uri': clip, 'fps': fps} for index in range(count)})
+    scheduler = RoundRobinScheduler(workers)
+    service = InferenceService(registry, Config.INFERENCE_MAX_BATCH_SIZE, Config.INFERENCE_MAX_WAIT_MS / 1000)
+    manager = LiveStreamManager(service.lane('live'), DiscardWriter(), live_settings(motion_gate, frame_pool),
+                                sources=sources, scheduler=scheduler)
+    deadline = time.perf_counter() + seconds
+
+    def watch(name):
+        for jpeg in manager.subscribe(name, detection_type):
+            multipart(jpeg)
+            if time.perf_counter() >= deadline:
+                break
+
+    threads = [threading.Thread(target=watch, args=(name,)) for name in sources.names()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = manager.stats()
+    manager.stop()
+    # Let each pipeline finish its last frame before the inference service goes away
+    while manager.stats()['active_streams'] and time.perf_counter() < deadline + 10:
+        time.sleep(0.1)
+    service.close()
+    return {
+        'scheduler': stats['scheduler'],
+        'sources': {
+            s['source']: {key: s[key] for key in ('target_fps', 'fps', 'output_fps', 'frames_paced',
+                                                   'dropped_frames', 'lag_ms', 'latency_ms')}
+            for s in stats['streams']
+        }
+    }
+
+
+def print_sources(result):
+    print(f"\nsources: {len(result['sources'])} sharing {result['scheduler']['workers']} workers")
+    print(f"{'source':>12} {'target':>7} {'fps':>7} {'out fps':>8} {'lag p50':>8} {'lag p95':>8}")
+    for name, row in sorted(result['sources'].items()):
+        lag = row['lag_ms']
+        print(f"{name:>12} {row['target_fps'] or 0:>7.1f} {row['fps']:>7.1f} {row['output_fps']:>8.1f} "
+              f"{lag['p50'] or 0:>8.1f} {lag['p95'] or 0:>8.1f}")
+
+
+def print_stages(name, result):
+    print(f"\n{name}: {result['frames']} frames at {result['fps']} fps")
+    print(f"{'stage':>12} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage, row in result['stages'].items():
+        print(f"{stage:>12} {row['count']:>7} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='stub', choices=['stub', 'real'],
+                        help='Deterministic stub models or the configured model files')
+    parser.add_argument('--type', default='pothole', choices=sorted(Config.MODELS) + ['all'],
+                        help='Detection type')
+    parser.add_argument('--paths', nargs='+', default=['video', 'live'], choices=['video', 'live', 'sources'])
+    parser.add_argument('--clip', help='Clip to use instead of a generated one')
+    parser.add_argument('--frames', type=int, default=300, help='Length of the generated clip')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--objects', type=int, default=3, help='Moving objects in the generated clip')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Stub delay per forward pass')
+    parser.add_argument('--per-frame-ms', type=float, default=2.0, help='Stub delay per image in a pass')
+    parser.add_argument('--no-motion-gate', action='store_true', help='Run the live models on every frame')
+    parser.add_argument('--no-frame-pool', action='store_true', help='Allocate a new buffer for every frame')
+    parser.add_argument('--sources', type=int, default=8, help='Looping copies of the clip for the sources path')
+    parser.add_argument('--source-fps', type=float, default=10.0, help='Target frame rate of each source')
+    parser.add_argument('--workers', type=int, default=Config.LIVE_INFERENCE_WORKERS,
+                        help='Shared live detection workers')
+    parser.add_argument('--seconds', type=float, default=20.0, help='Duration of the sources run')
+    parser.add_argument('--output', help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    registry = build_registry(args.model, args.latency_ms, args.per_frame_ms)
+    with tempfile.TemporaryDirectory() as directory:
+        clip = args.clip
+        if clip is None:
+            clip = make_synthetic_clip(os.path.join(directory, 'synthetic.avi'), args.frames,
+                                       (args.width, args.height), objects=args.objects)
+
+        results = {}
+        if 'video' in args.paths:
+            print("Running the uploaded-video pipeline...")
+            results['video'] = run_video(registry, args.type, clip, not args.no_frame_pool)
+        if 'live' in args.paths:
+            print("Running the live pipeline...")
+            results['live'] = run_live(registry, args.type, clip, not args.no_motion_gate, not args.no_frame_pool)
+        if 'sources' in args.paths:
+            print(f"Running {args.sources} live sources...")
+            results['sources'] = run_sources(registry, args.type, clip, args.sources, args.source_fps, args.workers,
+                                             args.seconds, not args.no_motion_gate, not args.no_frame_pool)
+
+    for name, result in results.items():
+        if result is None:
+            print(f"\n{name}: models could not be loaded, skipped")
+        elif name == 'sources':
+            print_sources(result)
+        else:
+            print_stages(name, result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'config': {
+                    'model': args.model,
+                    'detection_type': args.type,
+                    'clip': args.clip or {'frames': args.frames, 'width': args.width,
+                                          'height': args.height, 'objects': args.objects},
+                    'stub_latency_ms': args.latency_ms if args.model == 'stub' else None,
+                    'stub_per_frame_ms': args.per_frame_ms if args.model == 'stub' else None,
+                    'batch_size': Config.YOLO_BATCH_SIZE,
+                    'inference_size': Config.INFERENCE_SIZE,
+                    'display_width': Config.DISPLAY_MAX_WIDTH,
+                    'motion_gate': not args.no_motion_gate,
+                    'frame_pool': not args.no_frame_pool,
+                    'sources': {'count': args.sources, 'fps': args.source_fps, 'workers': args.workers,
+                                'seconds': args.seconds} if 'sources' in args.paths else None
+                },
+                'results': results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Complaint Storage
+SQLite helpers for recording detections as complaints, shared by the web app and worker processes
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+
+def save_complaint(detection_type, confidence, image_path=None, description="", db_path='complaints.db'):
+    """Save detection as a complaint in database"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    c.execute('''INSERT INTO complaints 
+                 (detection_type, confidence, timestamp, location, description, image_path) 
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (detection_type, confidence, timestamp, "Live Detection", description, image_path))
+    conn.commit()
+    conn.close()
+
+
+def clear_clip_path(clip_path, db_path='complaints.db'):
+    """Remove the link to an incident clip that could not be written"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute('UPDATE complaints SET clip_path = NULL WHERE clip_path = ?', (clip_path,))
+    finally:
+        conn.close()
+
+
+class ComplaintWriter:
+    """
+    Writes detection snapshots and complaint rows on a dedicated thread
+    Frame loops only enqueue; JPEG encoding, disk writes and SQLite inserts happen
+    off the hot path, with each flush committed as a single transaction
+    """
+
+    def __init__(
+        self,
+        db_path: str = 'complaints.db',
+        max_queue: int = 256,
+        flush_interval: float = 1.0,
+        flush_size: int = 50,
+        block_timeout: float = 0.05
+    ):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.snapshots_failed = 0
+        self.flushes = 0
+        self.max_depth = 0
+        self.blocked_seconds = 0.0
+        self.last_flush_ms = 0.0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def submit(self, detection_type: str, confidence: float, frame: Optional[np.ndarray] = None,
+               image_path: Optional[str] = None, description: str = "", location: str = "Live Detection",
+               clip_path: Optional[str] = None) -> bool:
+        """Queue a complaint (and optional snapshot and clip link); returns False if dropped under backpressure"""
+        self._ensure_started()
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        item = (detection_type, float(confidence), timestamp, location, description, image_path, frame, clip_path)
+
+        start = time.perf_counter()
+        try:
+            self.queue.put(item, timeout=self.block_timeout)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        finally:
+            self.blocked_seconds += time.perf_counter() - start
+
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def drain(self, timeout: Optional[float] = None):
+        """Block until everything queued so far has been written"""
+        if self._thread is None:
+            return
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 10.0):
+        """Flush the remaining queue and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Backpressure and throughput counters"""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'max_queue_depth': self.max_depth,
+            'submitted': self.submitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'snapshots_failed': self.snapshots_failed,
+            'flushes': self.flushes,
+            'avg_batch_size': round(self.written / self.flushes, 1) if self.flushes else 0,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+            'blocked_seconds': round(self.blocked_seconds, 3)
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            while True:
+                batch = self._collect()
+                if batch:
+                    self._flush(conn, batch)
+                elif self._stop_event.is_set():
+                    return
+        finally:
+            conn.close()
+
+    def _collect(self):
+        """Gather up to flush_size items, waiting at most flush_interval after the first"""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.flush_size:
+            # Past the deadline (or shutting down) only take what is already queued
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0 and not self._stop_event.is_set():
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, conn, batch):
+        start = time.perf_counter()
+        rows = []
+        for detection_type, confidence, timestamp, location, description, image_path, frame, clip_path in batch:
+            if frame is not None and image_path:
+                # imwrite reports most failures (missing folder, full disk) by returning False
+                try:
+                    saved = cv2.imwrite(image_path, frame)
+                except Exception as e:
+                    print(f"Error writing snapshot {image_path}: {e}")
+                    saved = False
+                else:
+                    if not saved:
+                        print(f"Error writing snapshot {image_path}")
+                if not saved:
+                    self.snapshots_failed += 1
+                    image_path = None
+            rows.append((detection_type, confidence, timestamp, location, description, image_path, clip_path))
+
+        try:
+            with conn:
+                conn.executemany('''INSERT INTO complaints 
+                                    (detection_type, confidence, timestamp, location, description, image_path,
+                                     clip_path) 
+                                    VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+            self.written += len(rows)
+            self.flushes += 1
+        except sqlite3.Error as e:
+            print(f"Error saving {len(rows)} complaints: {e}")
+            self.failed += len(rows)
+        finally:
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            for _ in batch:
+                self.queue.task_done()
@@ -28,8 +28,86 @@ class Config:
     ENABLE_TERRAIN = True
     
     # AI/ML Model settings
+    # backend: 'pytorch', 'onnx' or 'openvino'; ONNX backends also take
+    # 'precision': 'int8' with a 'calibration' video or image directory
+    MODELS = {
+        'accident': {'path': 'models/ACCIDENT.pt', 'input_size': 640, 'backend': 'pytorch'},
+        'pothole': {'path': 'models/pathole_hump.pt', 'input_size': 640, 'backend': 'pytorch'}
+    }
+    INFERENCE_SIZE = 640  # model input size (longest side) for entries without input_size
+    DISPLAY_MAX_WIDTH = 800  # width of annotated stream frames
     YOLO_CONFIDENCE_THRESHOLD = 0.25
     HIGH_CONFIDENCE_THRESHOLD = 0.7
+    TRACK_IOU_THRESHOLD = 0.3  # IoU needed to continue a track
+    TRACK_MAX_MISSES = 10  # detector passes a track may go unseen before it ends
+    LIVE_INCIDENT_REPORT_DELAY = 15  # live frames to pick the best snapshot before reporting
+    YOLO_BATCH_SIZE = 8  # frames per forward pass for uploaded videos
+    VIDEO_DECODE_BUFFER_SIZE = 32  # frames decoded ahead of inference
+    FRAME_POOL = True  # decode and resize into reused frame buffers instead of allocating per frame
+    MODEL_PRELOAD = os.environ.get('MODEL_PRELOAD', 'false').lower() == 'true'
+    MODEL_WARMUP = True  # run a dummy inference after loading
+    MODEL_MEMORY_BUDGET_MB = 2048  # LRU-evict models beyond this
+    MODEL_IDLE_TIMEOUT = 900  # seconds before an unused model is evicted
+    INFERENCE_MAX_BATCH_SIZE = 8  # images per shared forward pass across live streams
+    INFERENCE_MAX_WAIT_MS = 5  # longest a request waits for others to join its batch
+    
+    # Background snapshot / complaint writer
+    COMPLAINT_WRITER_QUEUE_SIZE = 256  # pending writes before backpressure
+    COMPLAINT_WRITER_FLUSH_INTERVAL = 1.0  # seconds between batched inserts
+    COMPLAINT_WRITER_FLUSH_SIZE = 50  # max complaints per transaction
+    COMPLAINT_WRITER_BLOCK_TIMEOUT = 0.05  # seconds a frame loop may wait before dropping
+    
+    # Background video analysis
+    VIDEO_WORKER_PROCESSES = int(os.environ.get('VIDEO_WORKER_PROCESSES', 2))
+    VIDEO_WORKER_NICE = 5  # lower worker CPU priority so live inference is served first
+    VIDEO_PREVIEW_FPS = 15  # annotated preview frames encoded per second
+    VIDEO_PREVIEW_BUFFER = 64  # recent preview frames kept for viewers
+    VIDEO_PROGRESS_INTERVAL = 0.25  # seconds between progress updates
+    VIDEO_DETECTION_STRIDE = 1  # run the detector every k frames, tracking in between
+    VIDEO_MAX_DETECTION_STRIDE = 8  # upper bound for adaptive stride
+    VIDEO_ADAPTIVE_STRIDE = False  # adapt k to scene motion
+    VIDEO_SEGMENTS = int(os.environ.get('VIDEO_SEGMENTS', 1))  # split each upload across this many workers
+    VIDEO_MIN_SEGMENT_FRAMES = 300  # shortest segment worth its own worker
+    VIDEO_STITCH_WINDOW = 15  # frames either side of a cut within which tracks are stitched
+    ANNOTATED_VIDEO = True  # encode each analysis to a video file for replay without inference
+    
+    # Video session results (per-session detection files on disk)
+    RESULTS_FOLDER = 'results'
+    SESSION_TTL_SECONDS = 24 * 3600  # sessions idle this long are deleted with their results
+    MAX_SESSIONS = 200  # least recently used sessions beyond this are deleted
+    RESULTS_PAGE_SIZE = 500  # detections per get_detection_results page by default
+    RESULTS_MAX_PAGE_SIZE = 5000
+    STATUS_RECENT_DETECTIONS = 100  # latest detections included in each status poll
+    RESULT_CACHE_FOLDER = 'results/cache'  # completed analyses reused for repeat uploads
+    RESULT_CACHE_MAX_ENTRIES = 500
+    
+    # Road region of interest: None for the whole frame, 'auto', or a polygon of
+    # normalized (x, y) points such as [(0, 1), (0, 0.6), (1, 0.6), (1, 1)]
+    ROI_TILES = '1x1'  # 'colsxrows' tiles inside the ROI, each inferred at full input size
+    ROI_TILE_OVERLAP = 0.2  # fraction of a tile shared with its neighbours
+    ROI_AUTO_SAMPLE_FRAMES = 8  # frames used to estimate an 'auto' road area
+    
+    # Live camera streaming
+    LIVE_CAMERA_INDEX = int(os.environ.get('LIVE_CAMERA_INDEX', 0))
+    LIVE_CAMERA_ROI = None  # road region of interest for the live camera
+    # Named live video sources served at /video_feed/<source>/<detection_type>: 'uri' is a device index,
+    # an RTSP/HTTP URL or a local file (looped), 'fps' an optional target rate, 'roi' an optional region
+    LIVE_SOURCES = {
+        'default': {'uri': LIVE_CAMERA_INDEX, 'fps': None, 'roi': LIVE_CAMERA_ROI},
+    }
+    LIVE_DEFAULT_SOURCE = 'default'  # source of /video_feed/<detection_type>
+    LIVE_INFERENCE_WORKERS = 4  # detection threads shared round-robin by every live source
+    LIVE_CLIP_TYPES = ('accident',)  # incident types that get a pre/post-roll clip linked to their complaint
+    LIVE_CLIP_PRE_ROLL_SECONDS = 5.0  # seconds before the incident, kept in memory per stream
+    LIVE_CLIP_POST_ROLL_SECONDS = 5.0  # seconds after the incident
+    LIVE_CLIP_BUFFER_MB = 16  # cap on each stream's buffered JPEGs (and on each clip)
+    LIVE_CLIP_FOLDER = 'static/clips'
+    LIVE_CLIP_QUEUE_SIZE = 8  # finished clips waiting to be written before new ones are dropped
+    LIVE_IDLE_GRACE_SECONDS = 2.0  # keep the pipeline running this long after the last viewer leaves
+    LIVE_MOTION_GATE = True  # skip inference while the scene is unchanged
+    LIVE_MOTION_THRESHOLD = 0.003  # share of pixels that must change to run the models
+    LIVE_MOTION_PIXEL_DELTA = 25  # grey-level difference counted as a changed pixel
+    LIVE_MOTION_MAX_INTERVAL = 1.0  # seconds between forced inferences on a static scene
     
     # V2I Communication settings
     V2I_RANGE_METERS = 500
@@ -0,0 +1,422 @@
+"""
+Video Detection Pipeline
+Decode-ahead frame reading into reused buffers, letterboxed batched YOLO inference and array-based
+detection post-processing
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class FramePool:
+    """
+    Preallocated frame buffers that are handed out and given back explicitly
+    Capture decodes into them and resizing writes into them, so once the pool holds as many
+    buffers as are in flight at once, the frame loops stop allocating full-size arrays
+    A buffer must only be released once nothing reads or writes it any more
+    """
+
+    def __init__(self, capacity: int = 8):
+        self.capacity = capacity
+        self.allocations = 0
+        self._free: List[np.ndarray] = []
+        self._free_ids = set()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """A free buffer of this shape, or a new one when none is free"""
+        with self._lock:
+            for index in range(len(self._free) - 1, -1, -1):
+                buffer = self._free[index]
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    del self._free[index]
+                    self._free_ids.discard(id(buffer))
+                    return buffer
+            self.allocations += 1
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, *buffers: Optional[np.ndarray]):
+        """Return buffers for reuse; releasing one twice or releasing None is harmless"""
+        with self._lock:
+            for buffer in buffers:
+                if buffer is None or id(buffer) in self._free_ids:
+                    continue
+                if len(self._free) >= self.capacity:
+                    # Keep the newest shapes when the source resolution changes
+                    self._free_ids.discard(id(self._free.pop(0)))
+                self._free.append(buffer)
+                self._free_ids.add(id(buffer))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'capacity': self.capacity, 'free': len(self._free), 'allocations': self.allocations}
+
+
+def read_frame(capture, pool: Optional[FramePool] = None, shape: Optional[Tuple[int, ...]] = None):
+    """
+    capture.read(), decoding into a pooled buffer once the frame shape is known
+    Returns (success, frame); a buffer the decoder could not use is given back to the pool
+    """
+    if pool is None or shape is None:
+        return capture.read()
+    buffer = pool.acquire(shape)
+    ret, frame = capture.read(buffer)
+    if not ret or frame is not buffer:
+        pool.release(buffer)
+    return ret, frame
+
+
+class FrameReader:
+    """
+    Decodes frames from a cv2.VideoCapture on a background thread
+    Frames are buffered in a bounded queue so decoding overlaps with inference
+    A start and end frame restrict decoding to one segment of the video
+    With a FramePool, frames are decoded into its buffers; the consumer releases them when done
+    A decode error ends the stream and is raised to the consumer
+    """
+
+    _END = object()
+
+    def __init__(self, capture, buffer_size: int = 32, start_frame: int = 0, end_frame: Optional[int] = None,
+                 timings=None, pool: Optional[FramePool] = None):
+        self.capture = capture
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.timings = timings
+        self.pool = pool
+        if start_frame:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        self.buffer = queue.Queue(maxsize=max(1, buffer_size))
+        self._error = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+
+    def _decode_loop(self):
+        """Read frames until the video ends or the reader is closed"""
+        frame_number = self.start_frame
+        shape = None
+        try:
+            while not self._stop_event.is_set():
+                if self.end_frame is not None and frame_number >= self.end_frame:
+                    break
+                start = time.perf_counter()
+                ret, frame = read_frame(self.capture, self.pool, shape)
+                if not ret:
+                    break
+                shape = frame.shape
+                if self.timings is not None:
+                    self.timings.record('decode', time.perf_counter() - start)
+                frame_number += 1
+                if not self._put((frame_number, frame)):
+                    return
+        except Exception as e:
+            self._error = e
+        finally:
+            # The consumer always gets the end marker, so it never waits on a dead thread
+            self._put(self._END)
+
+    def _put(self, item) -> bool:
+        """Block on the bounded buffer, giving up if the reader is closed"""
+        while not self._stop_event.is_set():
+            try:
+                self.buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        while True:
+            item = self.buffer.get()
+            if item is self._END:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def batches(self, batch_size: int) -> Iterator[List[Tuple[int, np.ndarray]]]:
+        """Yield lists of up to batch_size (frame_number, frame) pairs in order"""
+        batch = []
+        for item in self:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        """Stop decoding and wait for the background thread to exit"""
+        self._stop_event.set()
+        while True:
+            try:
+                self.buffer.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join(timeout=2)
+
+
+def make_divisible(size: int, stride: int = 32) -> int:
+    """Round a model input size up to a multiple of the network stride"""
+    return max(stride, int(np.ceil(size / stride)) * stride)
+
+
+def letterbox(frame: np.ndarray, size: int, stride: int = 32, square: bool = False,
+              color: Tuple[int, int, int] = (114, 114, 114)) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Scale a frame so its longest side is size, then pad it to a multiple of stride
+    (or to size x size when square, for fixed-shape models)
+    Returns the model input, the scale factor and the (left, top) padding
+    """
+    height, width = frame.shape[:2]
+    scale = size / max(height, width)
+    new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+    if (new_width, new_height) != (width, height):
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=interpolation)
+
+    if square:
+        pad_width, pad_height = size - new_width, size - new_height
+    else:
+        pad_width, pad_height = -new_width % stride, -new_height % stride
+    left, top = pad_width // 2, pad_height // 2
+    if pad_width or pad_height:
+        frame = cv2.copyMakeBorder(frame, top, pad_height - top, left, pad_width - left,
+                                   cv2.BORDER_CONSTANT, value=color)
+    return frame, scale, (left, top)
+
+
+def unletterbox(pred: np.ndarray, scale: float, pad: Tuple[int, int], shape: Tuple[int, ...]) -> np.ndarray:
+    """Map (n, 6) predictions on a letterboxed input back to the original frame's pixels"""
+    pred = pred.copy()
+    pred[:, [0, 2]] = np.clip((pred[:, [0, 2]] - pad[0]) / scale, 0, shape[1])
+    pred[:, [1, 3]] = np.clip((pred[:, [1, 3]] - pad[1]) / scale, 0, shape[0])
+    return pred
+
+
+def to_rgb(images: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Model inputs in the channel order the weights were trained on
+    OpenCV decodes BGR; YOLOv5 models take RGB, and neither AutoShape nor the exported graphs convert it,
+    so every backend is handed the output of this one function
+    """
+    return [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images]
+
+
+def infer_batch(model, frames: List[np.ndarray], input_size: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Run one forward pass over a list of frames
+    With an input_size the frames are letterboxed to it first, so inference cost no longer
+    depends on the source resolution; boxes are always in original frame coordinates
+    Returns one (n, 6) [x1, y1, x2, y2, conf, class] array per frame, in input order
+    """
+    if not input_size:
+        results = model(to_rgb(frames))
+        return [predictions_to_array(pred) for pred in results.xyxy]
+    return _infer_letterboxed(model, frames, [letterbox(frame, input_size) for frame in frames], input_size)
+
+
+def infer_models(models: Dict[str, object], frames: List[np.ndarray],
+                 input_sizes: Dict[str, Optional[int]], roi=None) -> Dict[str, List[np.ndarray]]:
+    """
+    Run several models over the same decoded frames
+    Frames are letterboxed once per distinct input size and shared by every model using it
+    With a RegionOfInterest only its crop (or tiles) is inferred and boxes are mapped back
+    Returns each model's per-frame predictions keyed like models
+    """
+    if roi is not None:
+        tile_sizes = {
+            name: roi.input_size(input_sizes.get(name) or 640, frames[0].shape) for name in models
+        }
+        tile_predictions = infer_models(models, roi.split(frames), tile_sizes)
+        return {name: roi.merge(predictions) for name, predictions in tile_predictions.items()}
+
+    letterboxed = {}
+    predictions = {}
+    for name, model in models.items():
+        input_size = input_sizes.get(name)
+        if not input_size:
+            predictions[name] = infer_batch(model, frames)
+            continue
+        if input_size not in letterboxed:
+            letterboxed[input_size] = [letterbox(frame, input_size) for frame in frames]
+        predictions[name] = _infer_letterboxed(model, frames, letterboxed[input_size], input_size)
+    return predictions
+
+
+def _infer_letterboxed(model, frames: List[np.ndarray], inputs: List[Tuple], input_size: int) -> List[np.ndarray]:
+    results = model(to_rgb([image for image, _, _ in inputs]), size=input_size)
+    return [
+        unletterbox(predictions_to_array(pred), scale, pad, frame.shape)
+        for pred, (_, scale, pad), frame in zip(results.xyxy, inputs, frames)
+    ]
+
+
+def predictions_to_array(pred) -> np.ndarray:
+    """Convert a raw YOLO prediction tensor to a float32 NumPy array"""
+    if hasattr(pred, 'detach'):
+        pred = pred.detach().cpu().numpy()
+    pred = np.asarray(pred, dtype=np.float32)
+    return pred.reshape(-1, 6)
+
+
+def class_aware_nms(pred: np.ndarray, iou_threshold: float = 0.45, max_detections: int = 1000,
+                    scores: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Non-maximum suppression within each class over (n, 6) xyxy, conf, class rows
+    scores, if given, ranks the boxes instead of their confidences
+    """
+    if len(pred) < 2:
+        return pred
+    # Offsetting boxes by class keeps boxes of different classes from suppressing each other
+    boxes = pred[:, :4] + pred[:, 5:6] * 7680
+    xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+    scores = pred[:, 4] if scores is None else scores
+    keep = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), 0.0, iou_threshold)
+    keep = np.array(keep, dtype=np.int64).reshape(-1)[:max_detections]
+    return pred[keep]
+
+
+def sample_frames(video_path: str, count: int) -> List[np.ndarray]:
+    """Frames sampled evenly across a video"""
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for position in np.linspace(0, max(total - 1, 0), num=count, dtype=np.int64).tolist():
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+class FrameDetections:
+    """Detections for a single frame held as parallel arrays"""
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        confidences: np.ndarray,
+        class_ids: np.ndarray,
+        labels: np.ndarray,
+        high_confidence: np.ndarray
+    ):
+        self.boxes = boxes                      # (n, 4) int32 x1, y1, x2, y2
+        self.confidences = confidences          # (n,) float32
+        self.class_ids = class_ids              # (n,) int32
+        self.labels = labels                    # (n,) class names
+        self.high_confidence = high_confidence  # (n,) bool
+
+    def __len__(self):
+        return len(self.confidences)
+
+    @property
+    def has_high_confidence(self) -> bool:
+        return bool(self.high_confidence.any())
+
+    def scaled(self, factor: float) -> "FrameDetections":
+        """The same detections with boxes scaled, e.g. from source to display coordinates"""
+        if factor == 1:
+            return self
+        return FrameDetections(
+            boxes=(self.boxes * factor).astype(np.int32),
+            confidences=self.confidences,
+            class_ids=self.class_ids,
+            labels=self.labels,
+            high_confidence=self.high_confidence
+        )
+
+    def to_records(self, frame_number: int, model: Optional[str] = None) -> List[Dict]:
+        """Build the JSON-friendly detection dicts used by the status endpoints, tagged by model if given"""
+        records = [
+            {'frame': frame_number, 'type': label, 'confidence': confidence, 'bbox': bbox}
+            for label, confidence, bbox in zip(
+                self.labels.tolist(), self.confidences.tolist(), self.boxes.tolist()
+            )
+        ]
+        if model is not None:
+            for record in records:
+                record['model'] = model
+        return records
+
+
+def class_name_lookup(names: Union[Dict[int, str], List[str]]) -> np.ndarray:
+    """Turn a model's class names (dict or list) into an array indexable by class id"""
+    if isinstance(names, dict):
+        size = max(names) + 1 if names else 0
+        lookup = np.array([str(i) for i in range(size)], dtype=object)
+        for class_id, name in names.items():
+            lookup[class_id] = name
+        return lookup
+    return np.array(list(names), dtype=object)
+
+
+def postprocess_detections(
+    pred: np.ndarray,
+    names: np.ndarray,
+    conf_threshold: float = 0.25,
+    high_conf_threshold: float = 0.7
+) -> FrameDetections:
+    """Threshold, convert and label a frame's raw predictions without per-row Python loops"""
+    pred = predictions_to_array(pred)
+    pred = pred[pred[:, 4] > conf_threshold]
+
+    confidences = pred[:, 4]
+    class_ids = pred[:, 5].astype(np.int32)
+    labels = class_ids.astype(str).astype(object)
+    known = class_ids < len(names)
+    labels[known] = names[class_ids[known]]
+
+    return FrameDetections(
+        boxes=pred[:, :4].astype(np.int32),
+        confidences=confidences,
+        class_ids=class_ids,
+        labels=labels,
+        high_confidence=confidences > high_conf_threshold
+    )
+
+
+def detection_color(detection_type: str) -> Tuple[int, int, int]:
+    """BGR overlay color for a detection type"""
+    return (0, 255, 0) if detection_type == 'pothole' else (0, 0, 255)
+
+
+def draw_detections(frame: np.ndarray, detections: FrameDetections, color: Tuple[int, int, int]):
+    """Draw bounding boxes and confidence labels onto a frame in place"""
+    for (x1, y1, x2, y2), label, confidence in zip(
+        detections.boxes.tolist(), detections.labels.tolist(), detections.confidences.tolist()
+    ):
+        text = f"{label} {confidence:.2f}"
+
+        # Draw bounding box
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+        # Draw label background
+        label_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
+        cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
+
+        # Draw label text
+        cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+
+def resize_frame(frame: np.ndarray, max_width: int = 800, pool: Optional[FramePool] = None) -> np.ndarray:
+    """
+    Resize frame while maintaining aspect ratio
+    With a pool the result is written into one of its buffers; a frame that already fits is
+    returned as it is, so the caller may get the input back
+    """
+    height, width = frame.shape[:2]
+    if width > max_width:
+        ratio = max_width / width
+        new_width = max_width
+        new_height = int(height * ratio)
+        out = pool.acquire((new_height, new_width) + frame.shape[2:], frame.dtype) if pool else None
+        frame = cv2.resize(frame, (new_width, new_height), dst=out)
+    return frame
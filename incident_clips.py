@@ -0,0 +1,233 @@
+"""
+Live Incident Clips
+Each live stream keeps its last few seconds of already-encoded JPEGs in a bounded ring. An incident
+turns the ring (pre-roll) and the frames that follow (post-roll) into a short clip, written on a
+background thread as an MJPEG AVI that stores the JPEGs as they are, without re-encoding them
+"""
+
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def _chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack('<I', len(data)) + data + (b'\0' if len(data) % 2 else b'')
+
+
+def _list(list_type: bytes, data: bytes) -> bytes:
+    return _chunk(b'LIST', list_type + data)
+
+
+def jpeg_size(jpeg: bytes) -> Tuple[int, int]:
+    """(width, height) from a JPEG's frame header, without decoding it"""
+    position = 2
+    while position + 9 < len(jpeg):
+        if jpeg[position] != 0xFF:
+            position += 1
+            continue
+        marker = jpeg[position + 1]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', jpeg[position + 5:position + 9])
+            return width, height
+        position += 2 + struct.unpack('>H', jpeg[position + 2:position + 4])[0]
+    frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError('Clip frame is not a JPEG')
+    return frame.shape[1], frame.shape[0]
+
+
+def write_mjpeg_avi(path: str, jpegs: List[bytes], fps: float):
+    """Write JPEG frames into an AVI container as Motion JPEG; the frame size is read from the first one"""
+    width, height = jpeg_size(jpegs[0])
+    count = len(jpegs)
+    largest = max(len(jpeg) for jpeg in jpegs)
+    rate = max(int(round(fps * 1000)), 1)
+
+    avih = struct.pack('<14I', int(1e6 / fps), int(largest * fps), 0, 0x10, count, 0, 1, largest,
+                       width, height, 0, 0, 0, 0)
+    strh = struct.pack('<4s4sIHHIIIIIIIIhhhh', b'vids', b'MJPG', 0, 0, 0, 0, 1000, rate, 0, count,
+                       largest, 0xFFFFFFFF, 0, 0, 0, width, height)
+    strf = struct.pack('<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+    hdrl = _list(b'hdrl', _chunk(b'avih', avih) + _list(b'strl', _chunk(b'strh', strh) + _chunk(b'strf', strf)))
+
+    # idx1 offsets count from the 'movi' list type, which the first frame chunk directly follows
+    frames = []
+    index = []
+    offset = 4
+    for jpeg in jpegs:
+        frames.append(_chunk(b'00dc', jpeg))
+        index.append(struct.pack('<4sIII', b'00dc', 0x10, offset, len(jpeg)))
+        offset += len(frames[-1])
+    movi = _list(b'movi', b''.join(frames))
+    riff = _chunk(b'RIFF', b'AVI ' + hdrl + movi + _chunk(b'idx1', b''.join(index)))
+
+    tmp_path = f"{path}.part"
+    with open(tmp_path, 'wb') as f:
+        f.write(riff)
+    os.replace(tmp_path, path)
+
+
+class ClipRing:
+    """
+    The encoded frames of one live stream for the last pre_roll seconds, capped at max_bytes
+    While a clip is recording, new frames also go to it until post_roll seconds after its trigger;
+    the finished clip is handed to on_clip(path, jpegs, fps)
+    """
+
+    def __init__(self, pre_roll: float, post_roll: float, max_bytes: int, on_clip):
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_bytes = max_bytes
+        self.on_clip = on_clip
+        self.clips = 0
+        self._frames = deque()
+        self._bytes = 0
+        self._recording = None
+        self._lock = threading.Lock()
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._bytes
+
+    def add(self, capture_time: float, jpeg: bytes):
+        """Keep an encoded frame; called by the encode stage with the frame's capture time"""
+        finished = None
+        with self._lock:
+            self._frames.append((capture_time, jpeg))
+            self._bytes += len(jpeg)
+            while self._frames and (self._bytes > self.max_bytes
+                                    or self._frames[0][0] < capture_time - self.pre_roll):
+                self._bytes -= len(self._frames.popleft()[1])
+
+            recording = self._recording
+            if recording is not None:
+                recording['frames'].append((capture_time, jpeg))
+                recording['bytes'] += len(jpeg)
+                if capture_time >= recording['end'] or recording['bytes'] >= self.max_bytes:
+                    finished, self._recording = recording, None
+        if finished is not None:
+            self._finish(finished)
+
+    def trigger(self, path: str, capture_time: float) -> str:
+        """
+        Start a clip around a frame captured at capture_time and return the path it will be written to
+        An incident during a clip's post-roll shares that clip
+        """
+        with self._lock:
+            if self._recording is not None:
+                return self._recording['path']
+            frames = [(t, jpeg) for t, jpeg in self._frames if t >= capture_time - self.pre_roll]
+            self._recording = {'path': path, 'end': capture_time + self.post_roll, 'frames': frames,
+                               'bytes': sum(len(jpeg) for _, jpeg in frames)}
+            return path
+
+    def close(self):
+        """Finish a clip still recording, e.g. when the stream stops during its post-roll"""
+        with self._lock:
+            recording, self._recording = self._recording, None
+            self._frames.clear()
+            self._bytes = 0
+        if recording is not None:
+            self._finish(recording)
+
+    def _finish(self, recording: Dict):
+        frames = recording['frames']
+        if not frames:
+            return
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 10.0
+        self.clips += 1
+        self.on_clip(recording['path'], [jpeg for _, jpeg in frames], fps)
+
+
+class ClipWriter:
+    """
+    Writes finished clips on a dedicated thread so no frame loop waits on disk
+    Clips beyond max_queue are dropped rather than held in memory; the paths of dropped and failed
+    clips are remembered and passed to on_lost, so links to them can be removed
+    """
+
+    def __init__(self, max_queue: int = 8, on_lost: Optional[Callable[[str], None]] = None, lost_history: int = 256):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.on_lost = on_lost
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_write_ms = 0.0
+        self._lost = deque(maxlen=lost_history)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, path: str, jpegs: List[bytes], fps: float) -> bool:
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((path, jpegs, fps))
+        except queue.Full:
+            print(f"Incident clip queue full; dropped {path}")
+            self.dropped += 1
+            self._lose(path)
+            return False
+        return True
+
+    def is_lost(self, path: str) -> bool:
+        """Whether a clip was dropped or failed to write"""
+        return path in self._lost
+
+    def drain(self, timeout: Optional[float] = None):
+        """Block until every queued clip has been written"""
+        if self._thread is None:
+            return
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(0.01)
+
+    def stats(self) -> Dict:
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'last_write_ms': round(self.last_write_ms, 1)
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path, jpegs, fps = self.queue.get()
+            start = time.perf_counter()
+            try:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                write_mjpeg_avi(path, jpegs, fps)
+                self.written += 1
+            except Exception as e:
+                print(f"Error writing incident clip {path}: {e}")
+                self.failed += 1
+                self._lose(path)
+            finally:
+                self.last_write_ms = (time.perf_counter() - start) * 1000
+                self.queue.task_done()
+
+    def _lose(self, path: str):
+        self._lost.append(path)
+        if self.on_lost is not None:
+            try:
+                self.on_lost(path)
+            except Exception as e:
+                print(f"Error unlinking incident clip {path}: {e}")
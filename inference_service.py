@@ -0,0 +1,264 @@
+"""
+Micro-batching Inference Service
+Frames from every producer in the process (live streams, image endpoints) are queued per model,
+grouped into micro-batches of up to max_batch_size images or max_wait seconds, run in one
+forward pass and routed back to their callers. Live requests are served before bulk work.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from stage_timings import StageHistograms, histogram_lines, metric_lines
+
+LANES = ('live', 'bulk')
+
+# Upper bounds of the batch size histogram buckets, in images
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class _Request:
+    __slots__ = ('images', 'size', 'lane', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, images: List[np.ndarray], size: Optional[int], lane: str):
+        self.images = images
+        self.size = size
+        self.lane = lane
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchResults:
+    """The per-image predictions of one request, shaped like the model's own results"""
+
+    def __init__(self, xyxy: List):
+        self.xyxy = xyxy
+
+
+class ModelBatcher:
+    """
+    Request queues and batching thread of one model
+    Requests are only batched with others of the same input size; a request larger than
+    max_batch_size runs on its own
+    """
+
+    def __init__(self, model, max_batch_size: int = 8, max_wait: float = 0.005,
+                 wait_times: Optional[StageHistograms] = None, batch_sizes: Optional[StageHistograms] = None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.wait_times = wait_times
+        self.batch_sizes = batch_sizes
+        self.requests = {lane: 0 for lane in LANES}
+        self.batches = 0
+        self.images = 0
+        self._queues = {lane: deque() for lane in LANES}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def infer(self, images: List[np.ndarray], size: Optional[int] = None, lane: str = 'bulk') -> BatchResults:
+        """Queue images for the next batch and wait for their predictions"""
+        request = _Request(list(images), size, lane)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Inference service is closed')
+            self._queues[lane].append(request)
+            self.requests[lane] += 1
+            self._condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._condition:
+            return {lane: len(queue) for lane, queue in self._queues.items()}
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _next(self, size=None, any_size: bool = True, room: Optional[int] = None) -> Optional[_Request]:
+        """Pop the oldest request, live lane first, that matches the batch (caller holds the lock)"""
+        for lane in LANES:
+            queue = self._queues[lane]
+            for index, request in enumerate(queue):
+                if (any_size or request.size == size) and (room is None or len(request.images) <= room):
+                    del queue[index]
+                    return request
+        return None
+
+    def _collect(self) -> Optional[List[_Request]]:
+        """Wait for a first request, then add matching ones until the batch is full or its wait is up"""
+        with self._condition:
+            first = self._next()
+            while first is None:
+                if self._closed:
+                    return None
+                self._condition.wait()
+                first = self._next()
+
+            batch = [first]
+            count = len(first.images)
+            deadline = first.enqueued_at + self.max_wait
+            while count < self.max_batch_size:
+                request = self._next(first.size, any_size=False, room=self.max_batch_size - count)
+                if request is not None:
+                    batch.append(request)
+                    count += len(request.images)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._closed:
+                    break
+                self._condition.wait(remaining)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            images = [image for request in batch for image in request.images]
+            try:
+                size = batch[0].size
+                results = self.model(images, size=size) if size else self.model(images)
+                xyxy = list(results.xyxy)
+                offset = 0
+                for request in batch:
+                    request.result = BatchResults(xyxy[offset:offset + len(request.images)])
+                    offset += len(request.images)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+
+            self.batches += 1
+            self.images += len(images)
+            if self.batch_sizes is not None:
+                self.batch_sizes.record('batch', len(images))
+            for request in batch:
+                if self.wait_times is not None:
+                    self.wait_times.record(request.lane, started - request.enqueued_at)
+                request.done.set()
+
+
+class LaneModel:
+    """A model as seen by one lane: called like the model itself, but served through its batcher"""
+
+    def __init__(self, batcher: ModelBatcher, lane: str):
+        self.batcher = batcher
+        self.lane = lane
+        self.names = batcher.model.names
+
+    def __call__(self, images, size: Optional[int] = None) -> BatchResults:
+        if isinstance(images, np.ndarray):
+            images = [images]
+        return self.batcher.infer(images, size, self.lane)
+
+
+class InferenceLane:
+    """Registry-like view whose models are served by the inference service on one lane"""
+
+    def __init__(self, service: 'InferenceService', lane: str):
+        self.service = service
+        self.lane = lane
+        self.registry = service.registry
+
+    def types(self, detection_type: str):
+        return self.registry.types(detection_type)
+
+    def spec(self, detection_type: str) -> Dict:
+        return self.registry.spec(detection_type)
+
+    def input_size(self, detection_type: str, default: Optional[int] = None) -> Optional[int]:
+        return self.registry.input_size(detection_type, default)
+
+    def get(self, detection_type: str) -> Optional[LaneModel]:
+        model = self.registry.get(detection_type)
+        if model is None:
+            return None
+        return LaneModel(self.service.batcher(detection_type, model), self.lane)
+
+    @contextmanager
+    def lease(self, detection_type: str):
+        """Hold the registry model for the lifetime of a stream, serving it through the service"""
+        with self.registry.lease(detection_type) as model:
+            if model is None:
+                yield None
+            else:
+                yield LaneModel(self.service.batcher(detection_type, model), self.lane)
+
+
+class InferenceService:
+    """
+    One ModelBatcher per loaded model of a registry
+    Producers use lane('live') or lane('bulk') in place of the registry
+    """
+
+    def __init__(self, registry, max_batch_size: int = 8, max_wait: float = 0.005):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.wait_times = StageHistograms()
+        self.batch_sizes = StageHistograms(buckets=BATCH_SIZE_BUCKETS)
+        self._batchers: Dict[str, ModelBatcher] = {}
+        self._lock = threading.Lock()
+
+    def lane(self, lane: str) -> InferenceLane:
+        if lane not in LANES:
+            raise ValueError(f"Unknown inference lane: {lane}")
+        return InferenceLane(self, lane)
+
+    def batcher(self, detection_type: str, model) -> ModelBatcher:
+        """The batcher of a model, replacing it if the registry has since reloaded the model"""
+        with self._lock:
+            batcher = self._batchers.get(detection_type)
+            if batcher is None or batcher.model is not model:
+                if batcher is not None:
+                    batcher.close()
+                batcher = self._batchers[detection_type] = ModelBatcher(
+                    model, self.max_batch_size, self.max_wait, self.wait_times, self.batch_sizes
+                )
+            return batcher
+
+    def stats(self) -> Dict:
+        with self._lock:
+            batchers = list(self._batchers.items())
+        models = []
+        for detection_type, batcher in batchers:
+            models.append({
+                'detection_type': detection_type,
+                'requests': dict(batcher.requests),
+                'batches': batcher.batches,
+                'mean_batch_size': round(batcher.images / batcher.batches, 2) if batcher.batches else 0.0,
+                'queue_depth': batcher.queue_depths()
+            })
+        return {'max_batch_size': self.max_batch_size, 'max_wait_ms': self.max_wait * 1000, 'models': models}
+
+    def exposition(self) -> List[str]:
+        """Prometheus text-format lines for queue waits, batch sizes and queue depths"""
+        stats = self.stats()
+        lines = histogram_lines('sanchar_inference_queue_wait_seconds',
+                                'Time requests waited for their inference batch, per lane',
+                                [({}, self.wait_times)], stage_label='lane')
+        lines += histogram_lines('sanchar_inference_batch_size', 'Images per inference batch',
+                                 [({}, self.batch_sizes)], stage_label=None)
+        lines += metric_lines('sanchar_inference_queue_depth', 'gauge', 'Requests waiting for a batch',
+                              [({'detection_type': model['detection_type'], 'lane': lane}, depth)
+                               for model in stats['models'] for lane, depth in model['queue_depth'].items()])
+        return lines
+
+    def close(self):
+        with self._lock:
+            for batcher in self._batchers.values():
+                batcher.close()
+            self._batchers.clear()
@@ -0,0 +1,600 @@
+"""
+Live Camera Streaming
+One staged capture, inference and encode pipeline per (video source, detection type), fanned out to any number of viewers
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detection_pipeline import (
+    FramePool, infer_models, postprocess_detections, draw_detections, resize_frame
+)
+from incident_clips import ClipRing, ClipWriter
+from object_tracking import DetectorState, MotionGate
+from roi import RegionOfInterest, estimate_road_polygon
+from stage_timings import PipelineMetrics, StageRecorder
+from video_sources import RoundRobinScheduler, SourceRegistry, VideoSource
+
+
+def encode_message_frame(message: str) -> bytes:
+    """A black JPEG with a line of text, used when the pipeline cannot run"""
+    black_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(black_frame, message, (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    ret, buffer = cv2.imencode('.jpg', black_frame)
+    return buffer.tobytes()
+
+
+def percentiles(values_ms: np.ndarray) -> Dict:
+    """p50/p95/max of a window of millisecond samples, None while it is empty"""
+    return {
+        'p50': round(float(np.percentile(values_ms, 50)), 1) if values_ms.size else None,
+        'p95': round(float(np.percentile(values_ms, 95)), 1) if values_ms.size else None,
+        'max': round(float(values_ms.max()), 1) if values_ms.size else None
+    }
+
+
+class LatestSlot:
+    """
+    Single-slot buffer between two pipeline stages
+    A new value replaces an unread one, so a slow consumer always gets the freshest frame;
+    on_drop is called with each replaced value and on_put after each new one (outside the lock)
+    """
+
+    def __init__(self, on_drop: Optional[Callable] = None, on_put: Optional[Callable] = None):
+        self.dropped = 0
+        self.on_drop = on_drop
+        self.on_put = on_put
+        self._value = None
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, value):
+        with self._condition:
+            if self._value is not None:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(self._value)
+            self._value = value
+            self._condition.notify()
+        if self.on_put is not None:
+            self.on_put()
+
+    @property
+    def pending(self) -> bool:
+        return self._value is not None
+
+    def poll(self):
+        """The latest unread value without waiting, or None"""
+        with self._condition:
+            value, self._value = self._value, None
+            return value
+
+    def take(self, timeout: float = 1.0):
+        """The latest unread value; None once the slot is closed and empty"""
+        with self._condition:
+            while self._value is None:
+                if self._closed:
+                    return None
+                self._condition.wait(timeout)
+            value, self._value = self._value, None
+            return value
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class LiveBroadcaster:
+    """
+    Runs capture, detection and JPEG encoding as separate threads joined by latest-value slots
+    Stale frames are dropped rather than queued, so the feed never drifts behind the camera
+    Subscribers receive the latest encoded frame; the pipeline stops when the last one leaves
+    With a scheduler, detection runs on its shared workers instead of a thread of this pipeline
+    With a clip writer, the encoded frames are also kept in a ring for incident clips
+    With timings, per-frame decode, inference, postprocess, draw, encode and yield durations are recorded
+    """
+
+    def __init__(self, source: VideoSource, detection_type: str, model_registry, complaint_writer, settings: Dict,
+                 timings: Optional[StageRecorder] = None, scheduler: Optional[RoundRobinScheduler] = None,
+                 clip_writer: Optional[ClipWriter] = None):
+        self.source = source
+        self.detection_type = detection_type
+        self.model_registry = model_registry
+        self.complaint_writer = complaint_writer
+        self.settings = settings
+        self.timings = timings
+        self.scheduler = scheduler
+        self.clip_writer = clip_writer
+        self._file_tag = ''.join(c if c.isalnum() or c in '-_' else '_' for c in source.name)
+
+        self.subscribers = 0
+        self.running = False
+        self.frames_captured = 0
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+        self.frames_encoded = 0
+        self.inference_seconds = 0.0
+        self.gate_seconds = 0.0
+        self.started_at = None
+        self.latest_jpeg = None
+        self.latest_capture_time = None
+        self.sequence = 0
+        self.latencies = deque(maxlen=settings.get('latency_window', 300))
+        self.lags = deque(maxlen=settings.get('latency_window', 300))
+
+        self._captured = None
+        self._annotated = None
+        self._capture = None
+        self._clips = None
+        self._pool = None
+        self._models = None
+        self._states = []
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._stages_done = threading.Event()
+        self._idle_since = None
+        self._idle_stopped = False
+        self._winding_down = False
+        self._restart = False
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def subscribe(self) -> Iterator[bytes]:
+        """Yield each new encoded frame for one viewer until the pipeline stops"""
+        with self._lock:
+            self.subscribers += 1
+            self._idle_since = None
+            if self._thread is None:
+                self._start()
+            elif self._winding_down:
+                # The running pipeline is on its way out; start a fresh one once it has stopped
+                self._restart = True
+            last_sequence = self.sequence if self.latest_jpeg is not None else 0
+
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.sequence != last_sequence or not self.running,
+                                             timeout=1.0)
+                    if self.sequence == last_sequence:
+                        if not self.running:
+                            return
+                        continue
+                    last_sequence = self.sequence
+                    jpeg = self.latest_jpeg
+                    capture_time = self.latest_capture_time
+                yield_start = time.perf_counter()
+                yield jpeg
+
+                # The generator resumes once the frame has been written to the client
+                if self.timings is not None:
+                    self.timings.record('yield', time.perf_counter() - yield_start)
+                if capture_time is not None:
+                    self.latencies.append(time.perf_counter() - capture_time)
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+                if self.subscribers == 0:
+                    self._idle_since = time.time()
+
+    def stop(self):
+        """Stop the pipeline for every subscriber"""
+        self._stop_event.set()
+
+    def stats(self) -> Dict:
+        elapsed = time.time() - self.started_at if self.started_at and self.running else 0.0
+        latencies = np.array(self.latencies, dtype=np.float64) * 1000
+        lags = np.array(self.lags, dtype=np.float64) * 1000
+        capture = self._capture
+        dropped = {
+            'capture': self._captured.dropped if self._captured else 0,
+            'encode': self._annotated.dropped if self._annotated else 0
+        }
+        # Skipped frames would each have cost one average inference; the gate's own cost is deducted
+        processed = self.frames_inferred + self.frames_skipped
+        mean_inference = self.inference_seconds / self.frames_inferred if self.frames_inferred else 0.0
+        cpu_saved = max(self.frames_skipped * mean_inference - self.gate_seconds, 0.0)
+        cpu_without_gate = processed * mean_inference
+        return {
+            'source': self.source.name,
+            'kind': self.source.kind,
+            'detection_type': self.detection_type,
+            'running': self.running,
+            'subscribers': self.subscribers,
+            'frames_captured': self.frames_captured,
+            'frames_inferred': self.frames_inferred,
+            'frames_skipped': self.frames_skipped,
+            'frames_encoded': self.frames_encoded,
+            'skip_ratio': round(self.frames_skipped / processed, 3) if processed else 0.0,
+            'cpu_saved_seconds': round(cpu_saved, 2),
+            'cpu_saved_ratio': round(cpu_saved / cpu_without_gate, 3) if cpu_without_gate else 0.0,
+            'target_fps': self.source.fps,
+            'fps': round(self.frames_captured / elapsed, 1) if elapsed > 0 else 0.0,
+            'output_fps': round(self.frames_encoded / elapsed, 1) if elapsed > 0 else 0.0,
+            'dropped_frames': dropped,
+            'frames_paced': capture.frames_paced if capture else 0,
+            'reconnects': capture.reconnects if capture else 0,
+            'frame_buffer_allocations': self._pool.allocations if self._pool else None,
+            'clip_buffer_bytes': self._clips.buffered_bytes if self._clips else 0,
+            'clips': self._clips.clips if self._clips else 0,
+            'drop_rate': round(1 - self.frames_encoded / self.frames_captured, 3) if self.frames_captured else 0.0,
+            'latency_ms': percentiles(latencies),
+            # Capture to detection done, including the wait for a shared inference worker
+            'lag_ms': percentiles(lags)
+        }
+
+    def _start(self):
+        """Start the pipeline thread (caller holds the lock)"""
+        self._stop_event.clear()
+        self._stages_done.clear()
+        self._idle_stopped = self._winding_down = self._restart = False
+        self.running = True
+        self.started_at = time.time()
+        self.frames_captured = self.frames_inferred = self.frames_skipped = self.frames_encoded = 0
+        self.inference_seconds = self.gate_seconds = 0.0
+        self.latencies.clear()
+        self.lags.clear()
+        self._capture = None
+        # Captured and display frames live in reused buffers, returned once each stage is done
+        pool = self._pool = FramePool(8) if self.settings.get('frame_pool') else None
+        on_put = (lambda: self.scheduler.notify(self)) if self.scheduler is not None else None
+        self._captured = LatestSlot(on_drop=lambda item: pool.release(item[2]) if pool else None, on_put=on_put)
+        self._annotated = LatestSlot(on_drop=lambda item: pool.release(item[1]) if pool else None)
+        # Incident types that get a clip keep their stream's last encoded frames
+        self._clips = None
+        clip_types = set(self.settings.get('clip_types') or ())
+        if self.clip_writer is not None and clip_types & set(self.model_registry.types(self.detection_type)):
+            self._clips = ClipRing(self.settings['clip_pre_roll'], self.settings['clip_post_roll'],
+                                   int(self.settings['clip_buffer_mb'] * 1024 * 1024), self.clip_writer.submit)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _should_stop(self) -> bool:
+        if self._stop_event.is_set() or self._stages_done.is_set():
+            return True
+        idle_since = self._idle_since
+        if idle_since is not None and time.time() - idle_since >= self.settings['idle_grace']:
+            self._idle_stopped = True
+            return True
+        return False
+
+    def _wind_down(self):
+        """Mark the pipeline as stopping; a viewer that arrives from here on gets a restarted pipeline"""
+        with self._lock:
+            self._winding_down = True
+            # Stopped for lack of viewers, but one subscribed after the decision was made
+            if self._idle_stopped and self.subscribers > 0:
+                self._restart = True
+
+    def _run(self):
+        try:
+            self._pipeline()
+        except Exception as e:
+            print(f"Live detection error: {e}")
+        finally:
+            with self._condition:
+                self.running = False
+                self._thread = None
+                self._condition.notify_all()
+                # A viewer may have subscribed while the pipeline was shutting down
+                if self._restart and self.subscribers > 0 and not self._stop_event.is_set():
+                    self._start()
+
+    def _publish(self, jpeg: bytes, capture_time: Optional[float] = None):
+        with self._condition:
+            self.latest_jpeg = jpeg
+            self.latest_capture_time = capture_time
+            self.sequence += 1
+            self._condition.notify_all()
+
+    def _pipeline(self):
+        """Inference stage on this thread or the scheduler's workers, with capture and encode on their own threads"""
+        with ExitStack() as leases:
+            models = {
+                name: leases.enter_context(self.model_registry.lease(name))
+                for name in self.model_registry.types(self.detection_type)
+            }
+            if not models or not all(models.values()):
+                # Show a placeholder frame if a model fails to load
+                self._publish(encode_message_frame("Model not available"))
+                self._wind_down()
+                return
+
+            captured, annotated = self._captured, self._annotated
+            self._prepare_inference(models)
+            capture_thread = threading.Thread(target=self._capture_stage, args=(captured,), daemon=True)
+            encode_thread = threading.Thread(target=self._encode_stage, args=(annotated,), daemon=True)
+            capture_thread.start()
+            encode_thread.start()
+            try:
+                if self.scheduler is None:
+                    while True:
+                        item = captured.take()
+                        if item is None:
+                            break
+                        self._infer_frame(item)
+                else:
+                    # Frames are detected on the shared workers as this source's turns come up
+                    capture_thread.join()
+                    self.scheduler.detach(self)
+                    # A source that ended by itself still gets its last frame detected
+                    if not self._stop_event.is_set():
+                        self.process_pending()
+            finally:
+                # Stops the capture stage if detection ended first; stop() alone sets the stop event
+                self._stages_done.set()
+                if self.scheduler is not None:
+                    self.scheduler.detach(self)
+                annotated.close()
+                capture_thread.join(timeout=2)
+                encode_thread.join(timeout=2)
+                for state in self._states:
+                    self._save_incidents(state.detection_type, state.incidents.flush())
+                if self._clips is not None:
+                    self._clips.close()
+
+    def has_pending(self) -> bool:
+        return self._captured is not None and self._captured.pending
+
+    def process_pending(self):
+        """Detect the latest captured frame, if any; called by the scheduler's workers"""
+        item = self._captured.poll()
+        if item is not None:
+            self._infer_frame(item)
+
+    def _capture_stage(self, captured: LatestSlot):
+        capture = self._capture = self.source.open()
+        pool = self._pool
+        try:
+            frame_number = 0
+            shape = None
+            while True:
+                frame = capture.read(self._should_stop, pool, shape)
+                if frame is None:
+                    break
+                shape = frame.shape
+                if self.timings is not None:
+                    self.timings.record('decode', capture.decode_seconds)
+                frame_number += 1
+                self.frames_captured += 1
+                captured.put((frame_number, time.perf_counter(), frame))
+        finally:
+            self._wind_down()
+            captured.close()
+            capture.release()
+
+    def _prepare_inference(self, models: Dict):
+        """Per-stream detection state, kept on the pipeline so any worker can process its next frame"""
+        settings = self.settings
+        self._models = models
+        self._states = [
+            DetectorState(name, model, settings['track_iou_threshold'], settings['track_max_misses'],
+                          settings['incident_report_delay'])
+            for name, model in models.items()
+        ]
+        self._input_sizes = {name: self.model_registry.input_size(name, settings['default_inference_size'])
+                             for name in models}
+
+        # A configured road polygon applies at once; 'auto' is estimated from the first frames
+        roi_setting = self.source.roi if self.source.roi is not None else settings.get('roi')
+        self._roi = None
+        self._roi_samples = [] if roi_setting == 'auto' else None
+        if roi_setting and self._roi_samples is None:
+            self._roi = RegionOfInterest(roi_setting, settings['roi_tiles'], settings['roi_overlap'])
+
+        # On an unchanged scene the last detections are redrawn instead of running the models
+        self._gate = None
+        if settings.get('motion_gate'):
+            self._gate = MotionGate(settings['motion_threshold'], settings['motion_pixel_delta'],
+                                    settings['motion_max_interval'])
+
+    def _infer_frame(self, item):
+        """Detect, track and draw one captured frame, then hand it to the encode stage"""
+        settings = self.settings
+        models, states, input_sizes, gate = self._models, self._states, self._input_sizes, self._gate
+        frame_number, capture_time, frame = item
+        draw_start = time.perf_counter()
+        display = resize_frame(frame, max_width=settings['display_width'], pool=self._pool)
+        display_scale = display.shape[1] / frame.shape[1]
+        if self._roi_samples is not None:
+            self._roi_samples.append(display.copy())
+            if len(self._roi_samples) >= settings['roi_auto_frames']:
+                self._roi = RegionOfInterest(estimate_road_polygon(self._roi_samples), settings['roi_tiles'],
+                                             settings['roi_overlap'])
+                self._roi_samples = None
+        roi = self._roi
+        draw_seconds = time.perf_counter() - draw_start
+        postprocess_seconds = 0.0
+
+        detect = True
+        if gate is not None:
+            start = time.perf_counter()
+            detect = gate.should_detect(frame)
+            self.gate_seconds += time.perf_counter() - start
+
+        try:
+            if detect:
+                # Perform detection on a letterboxed copy; boxes come back in source coordinates
+                start = time.perf_counter()
+                predictions = infer_models(models, [frame], input_sizes, roi)
+                self.inference_seconds += time.perf_counter() - start
+                if self.timings is not None:
+                    self.timings.record('inference', time.perf_counter() - start)
+            start = time.perf_counter()
+            if roi is not None:
+                roi.draw(display)
+            draw_seconds += time.perf_counter() - start
+
+            for state in states:
+                if not detect:
+                    # Nothing moved: keep showing the tracked boxes, still releasing due reports
+                    start = time.perf_counter()
+                    draw_detections(display, state.tracker.current_detections().scaled(display_scale),
+                                    state.color)
+                    draw_seconds += time.perf_counter() - start
+                    self._save_incidents(state.detection_type, state.incidents.ready(frame_number, []))
+                    continue
+
+                start = time.perf_counter()
+                detections = postprocess_detections(predictions[state.detection_type][0],
+                                                    state.class_names, settings['conf_threshold'],
+                                                    settings['high_conf_threshold'])
+                postprocess_seconds += time.perf_counter() - start
+
+                # Draw bounding boxes and labels
+                start = time.perf_counter()
+                draw_detections(display, detections.scaled(display_scale), state.color)
+                draw_seconds += time.perf_counter() - start
+
+                # Save one complaint per tracked object, with its best frame
+                start = time.perf_counter()
+                track_ids = state.tracker.update(detections, frame_number)
+                state.incidents.observe(frame_number, display, detections, track_ids)
+                self._start_clips(state, capture_time)
+                self._save_incidents(state.detection_type,
+                                     state.incidents.ready(frame_number, state.tracker.pop_ended()))
+                postprocess_seconds += time.perf_counter() - start
+
+            # Add status overlay
+            start = time.perf_counter()
+            cv2.putText(display, f"Live {self.detection_type.title()} Detection", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            cv2.putText(display, "Press 'q' to quit", (10, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            draw_seconds += time.perf_counter() - start
+
+        except Exception as e:
+            print(f"Live detection error: {e}")
+            cv2.putText(display, f"Error: {str(e)}", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+        if detect:
+            self.frames_inferred += 1
+        else:
+            self.frames_skipped += 1
+        if self.timings is not None:
+            if detect:
+                self.timings.record('postprocess', postprocess_seconds)
+            self.timings.record('draw', draw_seconds)
+        self.lags.append(time.perf_counter() - capture_time)
+        self._annotated.put((capture_time, display))
+        # The captured frame is no longer needed unless it is itself the display frame
+        if self._pool is not None and display is not frame:
+            self._pool.release(frame)
+
+    def _encode_stage(self, annotated: LatestSlot):
+        # Encode once for every subscriber
+        while True:
+            item = annotated.take()
+            if item is None:
+                break
+            capture_time, frame = item
+            start = time.perf_counter()
+            ret, buffer = cv2.imencode('.jpg', frame)
+            if self.timings is not None:
+                self.timings.record('encode', time.perf_counter() - start)
+            if self._pool is not None:
+                self._pool.release(frame)
+            if ret:
+                jpeg = buffer.tobytes()
+                self.frames_encoded += 1
+                # Incident clips reuse the frames encoded for the viewers
+                if self._clips is not None:
+                    self._clips.add(capture_time, jpeg)
+                self._publish(jpeg, capture_time)
+
+    def _start_clips(self, state: DetectorState, capture_time: float):
+        """Link each new incident of a clip type to a clip around the frame that raised it"""
+        if self._clips is None or state.detection_type not in self.settings['clip_types']:
+            return
+        for incident in state.incidents.pending.values():
+            if incident.clip_path is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                path = os.path.join(self.settings['clip_folder'],
+                                    f"live_{self._file_tag}_{state.detection_type}_{timestamp}_"
+                                    f"{incident.track_id}.avi")
+                incident.clip_path = self._clips.trigger(path, capture_time)
+
+    def _save_incidents(self, detection_type: str, ready):
+        """Queue the best snapshot and a complaint for each finished live track"""
+        for incident in ready:
+            # A clip that was already dropped or failed is not linked; one lost later is unlinked by the writer
+            clip_path = incident.clip_path
+            if clip_path is not None and self.clip_writer is not None and self.clip_writer.is_lost(clip_path):
+                clip_path = None
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            image_path = (f"static/uploads/live_{self._file_tag}_{detection_type}_{timestamp}_"
+                          f"{incident.track_id}.jpg")
+            self.complaint_writer.submit(detection_type, incident.max_confidence, incident.best_frame,
+                                         image_path, f"Detected in live camera feed {self.source.name}",
+                                         clip_path=clip_path)
+
+
+class LiveStreamManager:
+    """
+    Creates and looks up the shared broadcaster for each (video source, detection type)
+    Sources are registered names, or any camera index, URL or path to read as-is
+    """
+
+    def __init__(self, model_registry, complaint_writer, settings: Dict,
+                 timings: Optional[StageRecorder] = None, metrics: Optional[PipelineMetrics] = None,
+                 sources: Optional[SourceRegistry] = None, scheduler: Optional[RoundRobinScheduler] = None,
+                 clip_writer: Optional[ClipWriter] = None):
+        self.model_registry = model_registry
+        self.complaint_writer = complaint_writer
+        self.settings = settings
+        self.timings = timings
+        self.metrics = metrics
+        self.sources = sources if sources is not None else SourceRegistry({})
+        self.scheduler = scheduler
+        self.clip_writer = clip_writer
+        self.broadcasters: Dict[Tuple, LiveBroadcaster] = {}
+        self._lock = threading.Lock()
+
+    def get(self, source, detection_type: str) -> LiveBroadcaster:
+        source = self.sources.resolve(source)
+        key = (source.name, detection_type)
+        with self._lock:
+            broadcaster = self.broadcasters.get(key)
+            if broadcaster is None:
+                # Each stream records into its own histograms when metrics are collected
+                timings = self.timings
+                if self.metrics is not None:
+                    timings = self.metrics.session('live', detection_type, source.name)
+                broadcaster = LiveBroadcaster(source, detection_type, self.model_registry,
+                                              self.complaint_writer, self.settings, timings, self.scheduler,
+                                              self.clip_writer)
+                self.broadcasters[key] = broadcaster
+            return broadcaster
+
+    def subscribe(self, source, detection_type: str) -> Iterator[bytes]:
+        return self.get(source, detection_type).subscribe()
+
+    def stop(self, detection_type: Optional[str] = None):
+        """Stop every pipeline, or only those for one detection type"""
+        with self._lock:
+            broadcasters = list(self.broadcasters.values())
+        for broadcaster in broadcasters:
+            if detection_type is None or broadcaster.detection_type == detection_type:
+                broadcaster.stop()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            broadcasters = list(self.broadcasters.values())
+        streams = [b.stats() for b in broadcasters]
+        return {
+            'active_streams': sum(1 for s in streams if s['running']),
+            'subscribers': sum(s['subscribers'] for s in streams),
+            'scheduler': self.scheduler.stats() if self.scheduler is not None else None,
+            'clips': self.clip_writer.stats() if self.clip_writer is not None else None,
+            'streams': streams
+        }
@@ -29,6 +29,10 @@ def migrate_database(db_path='complaints.db'):
         print("  Adding address column...")
         c.execute('ALTER TABLE complaints ADD COLUMN address TEXT')
     
+    if 'clip_path' not in columns:
+        print("  Adding clip_path column...")
+        c.execute('ALTER TABLE complaints ADD COLUMN clip_path TEXT')
+    
     # Create terrain_analysis table if it doesn't exist
     print("  Creating terrain_analysis table...")
     c.execute('''CREATE TABLE IF NOT EXISTS terrain_analysis
@@ -62,6 +66,7 @@ def migrate_database(db_path='complaints.db'):
     print("✅ Database migration complete!")
     print("   - Added latitude/longitude columns")
     print("   - Added address column")
+    print("   - Added clip_path column")
     print("   - Created terrain_analysis table")
     print("   - Created road_quality table")
 
@@ -0,0 +1,251 @@
+"""
+Detection Model Registry
+Process-wide cache of loaded YOLO models with warm-up, LRU/idle eviction and load statistics
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from onnx_backend import load_onnx_model, load_openvino_model
+
+
+def load_pytorch_model(model_path: str, confidence: float, spec: Optional[Dict] = None):
+    """Load a custom YOLOv5 model through torch.hub"""
+    model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path, force_reload=False)
+    model.conf = confidence
+    return model
+
+
+def estimate_model_size_mb(model) -> float:
+    """Approximate resident size of a model from its parameters and buffers"""
+    if not isinstance(model, torch.nn.Module):
+        return 0.0
+    total_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    total_bytes += sum(b.numel() * b.element_size() for b in model.buffers())
+    return total_bytes / (1024 * 1024)
+
+
+class _RegistryEntry:
+    """A loaded model plus the bookkeeping used for eviction and reporting"""
+
+    def __init__(self, model, load_time_ms: float, warmup_time_ms: float, size_mb: float):
+        self.model = model
+        self.load_time_ms = load_time_ms
+        self.warmup_time_ms = warmup_time_ms
+        self.size_mb = size_mb
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.requests = 0
+        self.active_leases = 0
+
+
+class ModelRegistry:
+    """
+    Thread-safe registry of detection models keyed by (detection_type, backend)
+    Each model is loaded once, warmed up with a dummy inference and shared by every stream
+    """
+
+    def __init__(
+        self,
+        model_paths: Dict[str, Union[str, Dict]],
+        confidence: float = 0.25,
+        memory_budget_mb: float = 2048,
+        idle_timeout: float = 900,
+        warmup: bool = True
+    ):
+        self.model_paths = model_paths
+        self.confidence = confidence
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout = idle_timeout
+        self.warmup = warmup
+        self.loaders: Dict[str, Callable] = {
+            'pytorch': load_pytorch_model,
+            'onnx': load_onnx_model,
+            'openvino': load_openvino_model
+        }
+        self.evictions = 0
+
+        self._entries: "OrderedDict[Tuple[str, str], _RegistryEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def spec(self, detection_type: str) -> Dict:
+        """A detection type's MODELS entry; entries may be a model path or a dict with a 'path' key"""
+        entry = self.model_paths.get(detection_type)
+        if isinstance(entry, dict):
+            return entry
+        return {'path': entry}
+
+    def input_size(self, detection_type: str, default: Optional[int] = None) -> Optional[int]:
+        """Model input size configured for a detection type, else the default"""
+        return self.spec(detection_type).get('input_size') or default
+
+    def types(self, detection_type: str):
+        """The configured detection types a request covers; 'all' runs every model"""
+        if detection_type == 'all':
+            return list(self.model_paths)
+        return [detection_type]
+
+    def backend(self, detection_type: str) -> str:
+        """Inference backend selected by a detection type's MODELS entry"""
+        return self.spec(detection_type).get('backend', 'pytorch')
+
+    def register_backend(self, backend: str, loader: Callable):
+        """Register a loader callable(model_path, confidence, spec) for a backend name"""
+        self.loaders[backend] = loader
+
+    def get(self, detection_type: str, backend: Optional[str] = None):
+        """Return the shared model for a detection type, loading it on first use"""
+        entry = self._checkout(detection_type, backend or self.backend(detection_type))
+        return entry.model if entry else None
+
+    @contextmanager
+    def lease(self, detection_type: str, backend: Optional[str] = None):
+        """Hold a model for the lifetime of a stream so it is never evicted mid-use"""
+        entry = self._checkout(detection_type, backend or self.backend(detection_type), lease=True)
+        try:
+            yield entry.model if entry else None
+        finally:
+            if entry:
+                with self._lock:
+                    entry.active_leases -= 1
+                    entry.last_used = time.time()
+
+    def preload(self, backend: Optional[str] = None):
+        """Load and warm up every configured model"""
+        for detection_type in self.model_paths:
+            self.get(detection_type, backend)
+
+    def evict_idle(self):
+        """Drop models that have not been used within the idle timeout"""
+        with self._lock:
+            self._evict_idle()
+
+    def stats(self) -> Dict:
+        """Report load time, resident size and usage for every loaded model"""
+        with self._lock:
+            self._evict_idle()
+            models = []
+            for (detection_type, backend), entry in self._entries.items():
+                models.append({
+                    'detection_type': detection_type,
+                    'backend': backend,
+                    'load_time_ms': round(entry.load_time_ms, 1),
+                    'warmup_time_ms': round(entry.warmup_time_ms, 1),
+                    'resident_mb': round(entry.size_mb, 1),
+                    'requests': entry.requests,
+                    'active_leases': entry.active_leases,
+                    'idle_seconds': round(time.time() - entry.last_used, 1)
+                })
+            return {
+                'models': models,
+                'resident_mb': round(sum(e.size_mb for e in self._entries.values()), 1),
+                'memory_budget_mb': self.memory_budget_mb,
+                'evictions': self.evictions
+            }
+
+    def _checkout(self, detection_type: str, backend: str, lease: bool = False) -> Optional[_RegistryEntry]:
+        """
+        The entry for a model, loading it on first use
+        A lease is taken under the same lock that finds or inserts the entry, so it cannot be evicted in between
+        """
+        key = (detection_type, backend)
+        with self._lock:
+            entry = self._touch(key, lease)
+            if entry:
+                return entry
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; others wait and reuse the result
+        with load_lock:
+            with self._lock:
+                entry = self._touch(key, lease)
+                if entry:
+                    return entry
+
+            entry = self._load(detection_type, backend)
+            if entry is None:
+                return None
+
+            with self._lock:
+                entry.requests = 1
+                entry.active_leases = int(lease)
+                self._entries[key] = entry
+                self._evict_idle()
+                self._enforce_budget(protect=key)
+            return entry
+
+    def _touch(self, key, lease: bool = False) -> Optional[_RegistryEntry]:
+        """Mark an entry as most recently used, optionally leasing it (caller holds the lock)"""
+        entry = self._entries.get(key)
+        if entry:
+            entry.last_used = time.time()
+            entry.requests += 1
+            entry.active_leases += int(lease)
+            self._entries.move_to_end(key)
+        return entry
+
+    def _load(self, detection_type: str, backend: str) -> Optional[_RegistryEntry]:
+        """Load and warm up a model without holding the registry lock"""
+        spec = self.spec(detection_type)
+        model_path = spec.get('path')
+        if not model_path or not os.path.exists(model_path):
+            print(f"Model path not found: {model_path}")
+            return None
+
+        loader = self.loaders.get(backend)
+        if loader is None:
+            print(f"Unknown model backend: {backend}")
+            return None
+
+        try:
+            start = time.perf_counter()
+            model = loader(model_path, self.confidence, spec)
+            load_time_ms = (time.perf_counter() - start) * 1000
+
+            warmup_time_ms = 0.0
+            if self.warmup:
+                start = time.perf_counter()
+                size = self.input_size(detection_type, 640)
+                model(np.zeros((size, size, 3), dtype=np.uint8), size=size)
+                warmup_time_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            print(f"Error loading model {detection_type}: {e}")
+            return None
+
+        size_mb = estimate_model_size_mb(model)
+        if size_mb == 0.0 and os.path.exists(model_path):
+            size_mb = os.path.getsize(model_path) / (1024 * 1024)
+
+        print(f"Loaded {detection_type} model ({backend}) in {load_time_ms:.0f} ms, "
+              f"warm-up {warmup_time_ms:.0f} ms, ~{size_mb:.1f} MB")
+        return _RegistryEntry(model, load_time_ms, warmup_time_ms, size_mb)
+
+    def _evict_idle(self):
+        """Evict entries unused for longer than the idle timeout (caller holds the lock)"""
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if entry.active_leases > 0 or not self.idle_timeout:
+                continue
+            if now - entry.last_used > self.idle_timeout:
+                del self._entries[key]
+                self.evictions += 1
+
+    def _enforce_budget(self, protect):
+        """Evict least recently used entries until within the memory budget"""
+        resident = sum(e.size_mb for e in self._entries.values())
+        for key, entry in list(self._entries.items()):
+            if resident <= self.memory_budget_mb:
+                break
+            if key == protect or entry.active_leases > 0:
+                continue
+            resident -= entry.size_mb
+            del self._entries[key]
+            self.evictions += 1
@@ -0,0 +1,425 @@
+"""
+Object Tracking
+IoU track association, optical-flow box propagation between detector passes,
+and per-track incident collection so each object is reported once
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detection_pipeline import FrameDetections, class_name_lookup, detection_color
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two (n, 4) and (m, 4) x1, y1, x2, y2 box arrays"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+
+def greedy_match(iou: np.ndarray, threshold: float):
+    """Match rows to columns greedily by descending IoU; returns (row, col) index arrays"""
+    rows, cols = [], []
+    if iou.size == 0:
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+    candidates = np.argwhere(iou >= threshold)
+    order = np.argsort(-iou[candidates[:, 0], candidates[:, 1]])
+    used_rows, used_cols = set(), set()
+    for row, col in candidates[order].tolist():
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        rows.append(row)
+        cols.append(col)
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+
+def downscale_gray(frame: np.ndarray, width: int = 320) -> np.ndarray:
+    """Small grayscale copy of a frame for motion estimation and optical flow"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height = max(1, int(gray.shape[0] * width / gray.shape[1]))
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def frame_motion(previous_gray: Optional[np.ndarray], current_gray: np.ndarray) -> float:
+    """Mean absolute difference between two small grayscale frames, scaled to 0-1"""
+    if previous_gray is None or previous_gray.shape != current_gray.shape:
+        return 1.0
+    return float(cv2.absdiff(previous_gray, current_gray).mean()) / 255.0
+
+
+class Track:
+    """A single object followed across frames"""
+
+    def __init__(self, track_id: int, box: np.ndarray, class_id: int, label: str,
+                 confidence: float, frame_number: int):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.class_id = class_id
+        self.label = label
+        self.confidence = confidence
+        self.max_confidence = confidence
+        self.first_frame = frame_number
+        self.last_frame = frame_number
+        self.hits = 1
+        self.misses = 0
+
+
+class IoUTracker:
+    """
+    Associates detector outputs into tracks by IoU and carries boxes forward
+    on frames the detector skips using sparse Lucas-Kanade optical flow
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 2, flow_width: int = 320):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.flow_width = flow_width
+        self.tracks: List[Track] = []
+        self.ended_track_ids: List[int] = []
+        self.next_track_id = 1
+        self._previous_gray = None
+        self._scale = 1.0
+
+    def update(self, detections: FrameDetections, frame_number: int,
+               gray: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Fold a detector pass into the tracks
+        Returns the track id assigned to each detection, aligned with the detections
+        """
+        track_ids = np.zeros(len(detections), dtype=np.int64)
+        boxes = detections.boxes.astype(np.float32)
+
+        if self.tracks and len(detections):
+            iou = iou_matrix(np.stack([t.box for t in self.tracks]), boxes)
+            same_class = (np.array([t.class_id for t in self.tracks])[:, None]
+                          == detections.class_ids[None, :])
+            rows, cols = greedy_match(np.where(same_class, iou, 0.0), self.iou_threshold)
+        else:
+            rows, cols = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+        matched_tracks = set(rows.tolist())
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            track = self.tracks[row]
+            track.box = boxes[col]
+            track.confidence = float(detections.confidences[col])
+            track.max_confidence = max(track.max_confidence, track.confidence)
+            track.last_frame = frame_number
+            track.hits += 1
+            track.misses = 0
+            track_ids[col] = track.track_id
+
+        for index, track in enumerate(self.tracks):
+            if index not in matched_tracks:
+                track.misses += 1
+
+        matched_detections = set(cols.tolist())
+        for col in range(len(detections)):
+            if col in matched_detections:
+                continue
+            track = Track(self.next_track_id, boxes[col], int(detections.class_ids[col]),
+                          str(detections.labels[col]), float(detections.confidences[col]), frame_number)
+            self.next_track_id += 1
+            self.tracks.append(track)
+            track_ids[col] = track.track_id
+
+        self.ended_track_ids.extend(t.track_id for t in self.tracks if t.misses > self.max_misses)
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        if gray is not None:
+            self._previous_gray = gray
+        return track_ids
+
+    def pop_ended(self) -> List[int]:
+        """Ids of tracks dropped since the last call"""
+        ended, self.ended_track_ids = self.ended_track_ids, []
+        return ended
+
+    def prepare(self, frame: np.ndarray, gray: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Downscaled grayscale frame used for optical flow (and motion estimation)
+        A gray frame already prepared by another tracker can be passed in to share it
+        """
+        if gray is None:
+            gray = downscale_gray(frame, self.flow_width)
+        self._scale = gray.shape[1] / float(frame.shape[1])
+        return gray
+
+    def propagate(self, gray: np.ndarray) -> FrameDetections:
+        """Shift every live track by the median optical flow inside its box"""
+        if self.tracks and self._previous_gray is not None and self._previous_gray.shape == gray.shape:
+            self._shift_tracks(self._previous_gray, gray)
+        self._previous_gray = gray
+        return self.current_detections()
+
+    def current_detections(self) -> FrameDetections:
+        """The tracked boxes as a FrameDetections (never high confidence)"""
+        count = len(self.tracks)
+        return FrameDetections(
+            boxes=np.array([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4).astype(np.int32),
+            confidences=np.array([t.confidence for t in self.tracks], dtype=np.float32),
+            class_ids=np.array([t.class_id for t in self.tracks], dtype=np.int32),
+            labels=np.array([t.label for t in self.tracks], dtype=object),
+            high_confidence=np.zeros(count, dtype=bool)
+        )
+
+    def _shift_tracks(self, previous_gray: np.ndarray, gray: np.ndarray):
+        # Sample a 3x3 grid of points inside each box, in flow-image coordinates
+        grid = np.array([0.25, 0.5, 0.75], dtype=np.float32)
+        points = []
+        for track in self.tracks:
+            x1, y1, x2, y2 = track.box * self._scale
+            xs = x1 + (x2 - x1) * grid
+            ys = y1 + (y2 - y1) * grid
+            points.append(np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2))
+        points = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(
+            previous_gray, gray, points, None, winSize=(15, 15), maxLevel=2
+        )
+        displacement = (moved - points).reshape(len(self.tracks), 9, 2)
+        valid = status.reshape(len(self.tracks), 9).astype(bool)
+
+        for track, shifts, ok in zip(self.tracks, displacement, valid):
+            if not ok.any():
+                continue
+            dx, dy = np.median(shifts[ok], axis=0) / self._scale
+            track.box = track.box + np.array([dx, dy, dx, dy], dtype=np.float32)
+
+
+class TrackIncident:
+    """One reportable object: its best snapshot and the frames it was seen in"""
+
+    def __init__(self, track_id: int, label: str, frame_number: int):
+        self.track_id = track_id
+        self.label = label
+        self.max_confidence = 0.0
+        self.first_frame = frame_number
+        self.last_frame = frame_number
+        self.best_frame_number = frame_number
+        self.best_frame = None
+        self.first_box = None
+        self.last_box = None
+        self.clip_path = None
+
+    def absorb(self, other: "TrackIncident"):
+        """Extend this incident with a later piece of the same object"""
+        self.last_frame = max(self.last_frame, other.last_frame)
+        self.last_box = other.last_box
+        if other.max_confidence > self.max_confidence:
+            self.max_confidence = other.max_confidence
+            self.best_frame_number = other.best_frame_number
+            self.best_frame = other.best_frame
+
+
+class IncidentCollector:
+    """
+    Groups high-confidence detections by track so that each object yields a
+    single complaint with its best-confidence frame, instead of one per frame
+    """
+
+    def __init__(self, report_delay: Optional[int] = None):
+        # Frames to wait after the first high-confidence hit before reporting;
+        # None waits until the track ends
+        self.report_delay = report_delay
+        self.pending: Dict[int, TrackIncident] = {}
+        self.reported = set()
+
+    def observe(self, frame_number: int, frame: np.ndarray,
+                detections: FrameDetections, track_ids: np.ndarray):
+        """Record the high-confidence detections of a detector pass"""
+        for index in np.flatnonzero(detections.high_confidence).tolist():
+            track_id = int(track_ids[index])
+            if track_id in self.reported:
+                continue
+            incident = self.pending.get(track_id)
+            if incident is None:
+                incident = TrackIncident(track_id, str(detections.labels[index]), frame_number)
+                incident.first_box = detections.boxes[index].copy()
+                self.pending[track_id] = incident
+            incident.last_frame = frame_number
+            incident.last_box = detections.boxes[index].copy()
+
+            confidence = float(detections.confidences[index])
+            if confidence > incident.max_confidence:
+                incident.max_confidence = confidence
+                incident.best_frame_number = frame_number
+                incident.best_frame = frame.copy()
+
+    def ready(self, frame_number: int, ended_track_ids: List[int]) -> List[TrackIncident]:
+        """Incidents whose track has ended or whose report delay has elapsed"""
+        for track_id in ended_track_ids:
+            self.reported.discard(track_id)
+
+        ended = set(ended_track_ids)
+        ready = []
+        for track_id, incident in list(self.pending.items()):
+            delay_elapsed = (self.report_delay is not None
+                             and frame_number - incident.first_frame >= self.report_delay)
+            if track_id in ended or delay_elapsed:
+                ready.append(self.pending.pop(track_id))
+                if track_id not in ended:
+                    self.reported.add(track_id)
+        return ready
+
+    def flush(self) -> List[TrackIncident]:
+        """Every incident still pending, e.g. when the video ends"""
+        ready = list(self.pending.values())
+        self.pending.clear()
+        return ready
+
+
+def stitch_incidents(segments: List[List[Tuple]], iou_threshold: float = 0.3,
+                     max_gap: int = 30) -> List[Tuple[str, TrackIncident]]:
+    """
+    Join incidents cut by the boundaries of a video processed as consecutive segments
+    segments holds, per segment in order, (detection_type, incident, at_start, at_end) tuples
+    for incidents seen near its first or last frame. An incident open at the end of one segment
+    is merged with an incident of the same type and label starting in the next when their boxes
+    overlap across the cut. Returns the (detection_type, incident) pairs to report
+    """
+    finished = []
+    open_incidents = []
+    for boundary in segments:
+        starting = [item for item in boundary if item[2]]
+        continuing = []
+        if open_incidents and starting:
+            iou = iou_matrix(np.stack([incident.last_box for _, incident in open_incidents]).astype(np.float32),
+                             np.stack([item[1].first_box for item in starting]).astype(np.float32))
+            for row, (detection_type, incident) in enumerate(open_incidents):
+                for col, item in enumerate(starting):
+                    if (item[0] != detection_type or item[1].label != incident.label
+                            or item[1].first_frame - incident.last_frame > max_gap):
+                        iou[row, col] = 0.0
+            rows, cols = greedy_match(iou, iou_threshold)
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                detection_type, incident = open_incidents[row]
+                incident.absorb(starting[col][1])
+                continuing.append((detection_type, incident, starting[col][3]))
+            matched_rows, matched_cols = set(rows.tolist()), set(cols.tolist())
+            finished.extend(item for row, item in enumerate(open_incidents) if row not in matched_rows)
+            starting = [item for col, item in enumerate(starting) if col not in matched_cols]
+        else:
+            finished.extend(open_incidents)
+
+        continuing.extend((detection_type, incident, at_end) for detection_type, incident, _, at_end in starting)
+        continuing.extend((detection_type, incident, at_end)
+                          for detection_type, incident, at_start, at_end in boundary if not at_start)
+
+        open_incidents = []
+        for detection_type, incident, at_end in continuing:
+            if at_end:
+                open_incidents.append((detection_type, incident))
+            else:
+                finished.append((detection_type, incident))
+    finished.extend(open_incidents)
+    return finished
+
+
+class DetectorState:
+    """Class names, overlay color, tracker and incident collector for one model in a frame loop"""
+
+    def __init__(self, detection_type: str, model, iou_threshold: float = 0.3, max_misses: int = 2,
+                 report_delay: Optional[int] = None):
+        self.detection_type = detection_type
+        self.class_names = class_name_lookup(model.names)
+        self.color = detection_color(detection_type)
+        self.tracker = IoUTracker(iou_threshold=iou_threshold, max_misses=max_misses)
+        self.incidents = IncidentCollector(report_delay=report_delay)
+
+
+class StrideController:
+    """Chooses how many frames to skip between detector passes based on scene motion"""
+
+    def __init__(self, base_stride: int = 1, max_stride: int = 8, adaptive: bool = True,
+                 low_motion: float = 0.01, high_motion: float = 0.05):
+        self.max_stride = max(base_stride, max_stride)
+        self.adaptive = adaptive
+        self.low_motion = low_motion
+        self.high_motion = high_motion
+        self.stride = max(1, base_stride)
+        self._since_detection = None
+        self._motion_total = 0.0
+
+    def should_detect(self, motion: float) -> bool:
+        """Call once per decoded frame; True when the detector should run on it"""
+        self._motion_total += motion
+
+        # A sudden change forces a detector pass and tightens the stride
+        if self.adaptive and motion > self.high_motion:
+            self.stride = max(1, self.stride // 2)
+            return self._detect()
+
+        if self._since_detection is None or self._since_detection + 1 >= self.stride:
+            if self.adaptive and self._since_detection is not None:
+                mean_motion = self._motion_total / (self._since_detection + 1)
+                if mean_motion < self.low_motion:
+                    self.stride = min(self.max_stride, self.stride + 1)
+            return self._detect()
+
+        self._since_detection += 1
+        return False
+
+    def _detect(self) -> bool:
+        self._since_detection = 0
+        self._motion_total = 0.0
+        return True
+
+
+class MotionGate:
+    """
+    Skips detector passes while a fixed camera looks at an unchanged scene
+    A frame is inferred when the share of its pixels that differ from the last inferred
+    frame exceeds a threshold, and at least every max_interval seconds regardless
+    """
+
+    def __init__(self, threshold: float = 0.003, pixel_delta: int = 25, max_interval: float = 1.0,
+                 width: int = 160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_interval = max_interval
+        self.width = width
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.forced = 0
+        self._reference = None
+        self._reference_time = None
+
+    def should_detect(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """Call once per frame; True when the detector should run on it"""
+        now = time.perf_counter() if now is None else now
+        gray = cv2.GaussianBlur(downscale_gray(frame, self.width), (5, 5), 0)
+        self.frames_checked += 1
+
+        if self._reference is None or self._reference.shape != gray.shape:
+            changed = 1.0
+        else:
+            changed = np.count_nonzero(cv2.absdiff(self._reference, gray) > self.pixel_delta) / gray.size
+
+        if changed > self.threshold:
+            detect = True
+        elif now - self._reference_time >= self.max_interval:
+            # A periodic full pass catches slow changes the difference test misses
+            self.forced += 1
+            detect = True
+        else:
+            detect = False
+
+        if detect:
+            self._reference = gray
+            self._reference_time = now
+        else:
+            self.frames_skipped += 1
+        return detect
+
@@ -0,0 +1,251 @@
+"""
+ONNX Runtime Detection Backend
+Exports the YOLOv5 .pt models to ONNX once, optionally INT8-quantizes them on sample frames,
+and runs them on CPU through ONNX Runtime (or its OpenVINO execution provider)
+"""
+
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detection_pipeline import letterbox, unletterbox, class_aware_nms, sample_frames, to_rgb
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader
+except ImportError:
+    ort = None
+    CalibrationDataReader = object
+
+
+DEFAULT_CACHE_DIR = 'models/onnx_cache'
+IOU_THRESHOLD = 0.45  # NMS IoU, as in the YOLOv5 hub models
+MAX_DETECTIONS = 1000
+
+# Agreement with the PyTorch model on the same frames, checked by benchmark_backends.py:
+# mean IoU of matched boxes, largest confidence difference, and share of PyTorch boxes found
+TOLERANCES = {
+    'fp32': {'min_mean_iou': 0.98, 'max_confidence_delta': 0.01, 'min_recall': 0.99},
+    'int8': {'min_mean_iou': 0.90, 'max_confidence_delta': 0.08, 'min_recall': 0.95}
+}
+
+PROVIDERS = {
+    'onnx': ['CPUExecutionProvider'],
+    'openvino': ['OpenVINOExecutionProvider', 'CPUExecutionProvider']
+}
+
+
+def file_digest(path: str) -> str:
+    """Short SHA-1 of a file, so cached artifacts are rebuilt when the .pt changes"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()[:12]
+
+
+def preprocess(frames: List[np.ndarray], size: int) -> Tuple[np.ndarray, List[Tuple[float, Tuple[int, int]]]]:
+    """
+    Letterbox RGB images (see to_rgb) to size x size and stack them as a float32 NCHW batch
+    Returns the batch and each frame's (scale, pad) for mapping boxes back
+    """
+    letterboxed = [letterbox(frame, size, square=True) for frame in frames]
+    batch = np.stack([image for image, _, _ in letterboxed]).transpose(0, 3, 1, 2)
+    return (np.ascontiguousarray(batch, dtype=np.float32) / 255.0,
+            [(scale, pad) for _, scale, pad in letterboxed])
+
+
+def non_max_suppression(pred: np.ndarray, conf_threshold: float) -> np.ndarray:
+    """Raw (n, 5 + classes) xywh output of one image to (m, 6) xyxy, conf, class rows"""
+    pred = pred[pred[:, 4] > conf_threshold]
+    if not len(pred):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    class_scores = pred[:, 5:] * pred[:, 4:5]
+    class_ids = class_scores.argmax(axis=1)
+    confidences = class_scores[np.arange(len(pred)), class_ids]
+    keep = confidences > conf_threshold
+    pred, class_ids, confidences = pred[keep], class_ids[keep], confidences[keep]
+    if not len(pred):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    boxes = np.empty((len(pred), 4), dtype=np.float32)
+    boxes[:, :2] = pred[:, :2] - pred[:, 2:4] / 2
+    boxes[:, 2:] = pred[:, :2] + pred[:, 2:4] / 2
+
+    rows = np.concatenate([boxes, confidences[:, None], class_ids[:, None].astype(np.float32)], axis=1)
+    return class_aware_nms(rows.astype(np.float32), IOU_THRESHOLD, MAX_DETECTIONS)
+
+
+def calibration_frames(source: str, count: int) -> List[np.ndarray]:
+    """Sample frames evenly from a video, or read the images in a directory"""
+    if os.path.isdir(source):
+        paths = sorted(p for ext in ('jpg', 'jpeg', 'png') for p in glob.glob(os.path.join(source, f'*.{ext}')))
+        step = max(1, len(paths) // count)
+        frames = [cv2.imread(path) for path in paths[::step][:count]]
+        return [frame for frame in frames if frame is not None]
+
+    return sample_frames(source, count)
+
+
+class _CalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed sample frames to the static quantizer one at a time"""
+
+    def __init__(self, input_name: str, frames: List[np.ndarray], size: int):
+        self._batches = iter([{input_name: preprocess(to_rgb([frame]), size)[0]} for frame in frames])
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def export_onnx(model_path: str, onnx_path: str, size: int) -> List[str]:
+    """Export a YOLOv5 .pt to ONNX with a dynamic batch axis; returns the class names"""
+    import torch
+
+    model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path, autoshape=False, force_reload=False)
+    model.eval()
+    for module in model.modules():
+        # Make the Detect head return one concatenated (batch, anchors, 5 + classes) tensor
+        if type(module).__name__ == 'Detect':
+            module.inplace = False
+            module.export = True
+
+    class _Export(torch.nn.Module):
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, images):
+            output = self.wrapped(images)
+            return output[0] if isinstance(output, (list, tuple)) else output
+
+    tmp_path = onnx_path + '.tmp'
+    torch.onnx.export(
+        _Export(model), torch.zeros(1, 3, size, size), tmp_path,
+        opset_version=12, input_names=['images'], output_names=['output'],
+        dynamic_axes={'images': {0: 'batch'}, 'output': {0: 'batch'}}
+    )
+    os.replace(tmp_path, onnx_path)
+
+    names = model.names
+    return [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+
+
+def quantize_onnx(onnx_path: str, int8_path: str, calibration: str, size: int, count: int = 64):
+    """Static INT8 post-training quantization calibrated on sample frames"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    frames = calibration_frames(calibration, count)
+    if not frames:
+        raise ValueError(f"No calibration frames found in {calibration}")
+
+    input_name = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    tmp_path = int8_path + '.tmp'
+    quantize_static(
+        onnx_path, tmp_path, _CalibrationReader(input_name, frames, size),
+        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8, per_channel=True
+    )
+    os.replace(tmp_path, int8_path)
+
+
+def build_artifact(model_path: str, spec: Dict) -> Dict:
+    """
+    Return the cached ONNX artifact for a MODELS entry, exporting (and quantizing) it first if needed
+    Artifacts are keyed by the .pt digest, input size and precision
+    """
+    size = spec.get('input_size') or 640
+    precision = spec.get('precision', 'fp32')
+    cache_dir = spec.get('cache_dir', DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    stem = f"{os.path.splitext(os.path.basename(model_path))[0]}-{file_digest(model_path)}-{size}"
+    onnx_path = os.path.join(cache_dir, f"{stem}.onnx")
+    meta_path = os.path.join(cache_dir, f"{stem}.json")
+
+    if not (os.path.exists(onnx_path) and os.path.exists(meta_path)):
+        print(f"Exporting {model_path} to {onnx_path}")
+        names = export_onnx(model_path, onnx_path, size)
+        with open(meta_path, 'w') as f:
+            json.dump({'source': model_path, 'input_size': size, 'names': names}, f)
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    if precision == 'int8':
+        int8_path = os.path.join(cache_dir, f"{stem}-int8.onnx")
+        if not os.path.exists(int8_path):
+            calibration = spec.get('calibration')
+            if not calibration:
+                raise ValueError("INT8 quantization needs a 'calibration' video or image directory")
+            print(f"Quantizing {onnx_path} to INT8 using {calibration}")
+            quantize_onnx(onnx_path, int8_path, calibration, size, spec.get('calibration_frames', 64))
+        onnx_path = int8_path
+
+    return {'path': onnx_path, 'input_size': size, 'precision': precision, 'names': meta['names']}
+
+
+class _Results:
+    """The part of the YOLOv5 Detections interface used by infer_batch"""
+
+    def __init__(self, xyxy: List[np.ndarray]):
+        self.xyxy = xyxy
+
+
+class OnnxDetector:
+    """
+    Runs an exported YOLOv5 model with ONNX Runtime behind the same call interface
+    as the torch.hub model: model(frames, size=...) -> results.xyxy, with RGB frames from to_rgb
+    """
+
+    def __init__(self, onnx_path: str, names: List[str], input_size: int, confidence: float = 0.25,
+                 providers: Optional[List[str]] = None, threads: Optional[int] = None):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        available = ort.get_available_providers()
+        providers = [p for p in (providers or PROVIDERS['onnx']) if p in available] or ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.providers = self.session.get_providers()
+        self.names = dict(enumerate(names))
+        self.input_size = input_size
+        self.conf = confidence
+        self.onnx_path = onnx_path
+
+    def __call__(self, frames, size: Optional[int] = None) -> _Results:
+        if not isinstance(frames, list):
+            frames = [frames]
+
+        # The graph has a fixed square input; size is accepted for interface compatibility, so smaller
+        # inputs such as region-of-interest crops are scaled up to input_size and cost the same
+        batch, transforms = preprocess(frames, self.input_size)
+        output = self.session.run(None, {self.input_name: batch})[0]
+        return _Results([
+            unletterbox(non_max_suppression(pred, self.conf), scale, pad, frame.shape)
+            for pred, (scale, pad), frame in zip(output, transforms, frames)
+        ])
+
+
+def load_onnx_model(model_path: str, confidence: float, spec: Optional[Dict] = None, backend: str = 'onnx'):
+    """Registry loader: export/quantize on first use, then open an ONNX Runtime session"""
+    if ort is None:
+        raise ImportError("onnxruntime is not installed")
+    spec = spec or {}
+    artifact = build_artifact(model_path, spec)
+    model = OnnxDetector(artifact['path'], artifact['names'], artifact['input_size'], confidence,
+                         providers=PROVIDERS[backend], threads=spec.get('threads'))
+    print(f"ONNX {artifact['precision']} model {artifact['path']} on {', '.join(model.providers)}")
+    return model
+
+
+def load_openvino_model(model_path: str, confidence: float, spec: Optional[Dict] = None):
+    """Registry loader for ONNX Runtime's OpenVINO execution provider"""
+    return load_onnx_model(model_path, confidence, spec, backend='openvino')
@@ -0,0 +1,292 @@
+"""
+Video Session Result Storage
+Per-session detections in compact fixed-width columnar files on disk, with a small
+in-memory summary per session and TTL / size-bounded eviction
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# One fixed-width record per detection (27 bytes, versus several hundred for a Python dict)
+DETECTION_DTYPE = np.dtype([
+    ('frame', '<i4'),
+    ('label', '<u2'),       # index into the session's label table
+    ('model', '<u1'),       # index into the session's model table
+    ('confidence', '<f4'),
+    ('bbox', '<i4', (4,))   # x1, y1, x2, y2
+])
+
+# Detections per processed frame, frame n at index n - 1, for the scrubbing timeline
+COUNT_DTYPE = np.dtype('<u2')
+
+
+class SessionResults:
+    """
+    Append-only detection file for one session plus its label/model code tables
+    and a per-frame detection count file, and once finished the annotated video and its sidecar
+    The worker process appends; the web process pages through them without loading them whole
+    """
+
+    VIDEO_CONTAINERS = ('mp4', 'webm')
+
+    def __init__(self, directory: str, session_id: str):
+        self.path = os.path.join(directory, f"{session_id}.det")
+        self.tables_path = os.path.join(directory, f"{session_id}.labels.json")
+        self.counts_path = os.path.join(directory, f"{session_id}.counts")
+        self.video_prefix = os.path.join(directory, session_id)
+        self.sidecar_path = os.path.join(directory, f"{session_id}.sidecar.json")
+        self._tables = None
+        self._tables_changed = False
+
+    def append(self, records: List[Dict]) -> int:
+        """Append detection records (dicts from FrameDetections.to_records); returns the new count"""
+        if not records:
+            return self.count()
+
+        array = np.empty(len(records), dtype=DETECTION_DTYPE)
+        array['frame'] = [record['frame'] for record in records]
+        array['label'] = self._encode('labels', [record.get('type', '') for record in records])
+        array['model'] = self._encode('models', [record.get('model', '') for record in records])
+        array['confidence'] = [record['confidence'] for record in records]
+        array['bbox'] = [record['bbox'] for record in records]
+        self._write(array)
+        return self.count()
+
+    def extend(self, other: 'SessionResults', chunk_size: int = 65536) -> int:
+        """Append another file's detections and frame counts in chunks, re-coding its labels"""
+        other_tables = other._load_tables()
+        label_map = np.array(self._encode('labels', other_tables['labels']) or [0], dtype=np.uint16)
+        model_map = np.array(self._encode('models', other_tables['models']) or [0], dtype=np.uint8)
+
+        offset = 0
+        while True:
+            array = other.read(offset, chunk_size).copy()
+            if not len(array):
+                break
+            array['label'] = label_map[array['label']]
+            array['model'] = model_map[array['model']]
+            self._write(array)
+            offset += len(array)
+
+        counts = other._read_slice(other.counts_path, COUNT_DTYPE, 0, None)
+        if len(counts):
+            with open(self.counts_path, 'ab') as f:
+                f.write(counts.tobytes())
+        return self.count()
+
+    def append_counts(self, counts: List[int]):
+        """Append the detection counts of the next processed frames"""
+        if counts:
+            with open(self.counts_path, 'ab') as f:
+                f.write(np.minimum(counts, np.iinfo(COUNT_DTYPE).max).astype(COUNT_DTYPE).tobytes())
+
+    def timeline(self, after_frame: int = 0, limit: Optional[int] = None) -> List[int]:
+        """Detection counts of the frames after a frame number"""
+        return self._read_slice(self.counts_path, COUNT_DTYPE, after_frame, limit).tolist()
+
+    def index_after_frame(self, frame: int) -> int:
+        """Index of the first stored detection on a frame after the given one"""
+        count = self.count()
+        if not count:
+            return 0
+        # Frames are stored in order, so a binary search only touches a few pages
+        frames = np.memmap(self.path, dtype=DETECTION_DTYPE, mode='r', shape=(count,))['frame']
+        return int(np.searchsorted(frames, frame, side='right'))
+
+    def count(self) -> int:
+        try:
+            return os.path.getsize(self.path) // DETECTION_DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> np.ndarray:
+        """A slice of the stored detections as a structured array, read with one seek"""
+        return self._read_slice(self.path, DETECTION_DTYPE, offset, limit)
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """A slice of the stored detections as the JSON records used by the endpoints"""
+        array = self.read(offset, limit)
+        if not len(array):
+            return []
+        self._tables = None
+        tables = self._load_tables()
+        labels = np.array(tables['labels'], dtype=object)[array['label']].tolist()
+        models = np.array(tables['models'], dtype=object)[array['model']].tolist()
+        records = []
+        for frame, label, model, confidence, bbox in zip(
+            array['frame'].tolist(), labels, models, array['confidence'].tolist(), array['bbox'].tolist()
+        ):
+            record = {'frame': frame, 'type': label, 'confidence': confidence, 'bbox': bbox}
+            if model:
+                record['model'] = model
+            records.append(record)
+        return records
+
+    def annotated_video(self) -> Optional[str]:
+        """Path of the finished annotated video, if one was written"""
+        for container in self.VIDEO_CONTAINERS:
+            path = f"{self.video_prefix}.{container}"
+            if os.path.exists(path):
+                return path
+        return None
+
+    def write_sidecar(self, video: Dict, chunk_size: int = 65536):
+        """
+        Write the detections as one JSON file for players that overlay or list them
+        video describes the annotated file (fps, size, codec, scale of its frames to source pixels);
+        each detection is [frame, label index, model index, confidence, x1, y1, x2, y2] in source pixels
+        """
+        self._tables = None
+        tables = self._load_tables()
+        tmp_path = self.sidecar_path + '.tmp'
+        # Written a chunk at a time so long videos never hold every detection in memory
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps({'video': video, 'labels': tables['labels'], 'models': tables['models']})[:-1])
+            f.write(', "detections": [')
+            offset = 0
+            while True:
+                array = self.read(offset, chunk_size)
+                if not len(array):
+                    break
+                rows = [
+                    [frame, label, model, confidence] + bbox for frame, label, model, confidence, bbox in zip(
+                        array['frame'].tolist(), array['label'].tolist(), array['model'].tolist(),
+                        np.round(array['confidence'].astype(np.float64), 4).tolist(), array['bbox'].tolist()
+                    )
+                ]
+                f.write((', ' if offset else '') + json.dumps(rows)[1:-1])
+                offset += len(array)
+            f.write(']}')
+        os.replace(tmp_path, self.sidecar_path)
+
+    def files(self) -> List[str]:
+        """Every file the session may have, in a fixed order"""
+        return [self.path, self.tables_path, self.counts_path, self.sidecar_path] + [
+            f"{self.video_prefix}.{container}" for container in self.VIDEO_CONTAINERS
+        ]
+
+    def delete(self):
+        for path in self.files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read_slice(path: str, dtype: np.dtype, offset: int, limit: Optional[int]) -> np.ndarray:
+        try:
+            count = os.path.getsize(path) // dtype.itemsize
+        except OSError:
+            count = 0
+        offset = min(max(offset, 0), count)
+        end = count if limit is None else min(count, offset + max(limit, 0))
+        if end <= offset:
+            return np.empty(0, dtype=dtype)
+        with open(path, 'rb') as f:
+            f.seek(offset * dtype.itemsize)
+            data = f.read((end - offset) * dtype.itemsize)
+        return np.frombuffer(data, dtype=dtype)
+
+    def _encode(self, table: str, names: List[str]) -> List[int]:
+        """Codes for label or model names, adding unseen names to the table"""
+        names_table = self._load_tables()[table]
+        codes = {name: code for code, name in enumerate(names_table)}
+        for name in names:
+            if name not in codes:
+                codes[name] = len(names_table)
+                names_table.append(name)
+                self._tables_changed = True
+        return [codes[name] for name in names]
+
+    def _write(self, array: np.ndarray):
+        # Code tables are on disk before any record that uses them
+        if self._tables_changed:
+            tmp_path = self.tables_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._tables, f)
+            os.replace(tmp_path, self.tables_path)
+            self._tables_changed = False
+        with open(self.path, 'ab') as f:
+            f.write(array.tobytes())
+
+    def _load_tables(self) -> Dict:
+        if self._tables is None:
+            try:
+                with open(self.tables_path) as f:
+                    self._tables = json.load(f)
+            except (OSError, ValueError):
+                self._tables = {'labels': [], 'models': []}
+        return self._tables
+
+
+class ResultStore:
+    """
+    In-memory summaries of video sessions backed by SessionResults files
+    Sessions idle for longer than the TTL, or beyond max_sessions, are evicted with their files
+    """
+
+    def __init__(self, directory: str, ttl: float = 86400, max_sessions: int = 200,
+                 is_active: Optional[Callable[[str], bool]] = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.is_active = is_active
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._summaries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self, session_id: str, **summary) -> Dict:
+        """Register a new session with its summary fields"""
+        with self._lock:
+            self._summaries[session_id] = dict(summary, last_access=time.time())
+            self._evict()
+            return self._summaries.get(session_id)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """A session's summary, refreshing its TTL"""
+        with self._lock:
+            self._evict()
+            summary = self._summaries.get(session_id)
+            if summary is not None:
+                summary['last_access'] = time.time()
+            return summary
+
+    def results(self, session_id: str) -> SessionResults:
+        return SessionResults(self.directory, session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._evict()
+            return {
+                'sessions': len(self._summaries),
+                'stored_detections': sum(self.results(s).count() for s in self._summaries),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl,
+                'evictions': self.evictions
+            }
+
+    def _evict(self):
+        """Drop expired sessions, then the least recently used beyond the cap (caller holds the lock)"""
+        now = time.time()
+        idle = sorted(
+            (summary['last_access'], session_id) for session_id, summary in self._summaries.items()
+            if not (self.is_active and self.is_active(session_id))
+        )
+        excess = len(self._summaries) - self.max_sessions
+        for last_access, session_id in idle:
+            if now - last_access <= self.ttl and excess <= 0:
+                break
+            del self._summaries[session_id]
+            self.results(session_id).delete()
+            if self.on_evict:
+                self.on_evict(session_id)
+            self.evictions += 1
+            excess -= 1
@@ -0,0 +1,177 @@
+"""
+Road Region of Interest
+Crops and masks frames to the road area before inference, optionally splitting it into
+overlapping tiles for small distant objects; predictions come back in full-frame coordinates
+"""
+
+import json
+from typing import List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from detection_pipeline import make_divisible, class_aware_nms
+
+# Lower part of a forward-facing camera view, used when no road area can be estimated
+DEFAULT_ROAD_POLYGON = [(0.0, 1.0), (0.0, 0.6), (0.35, 0.45), (0.65, 0.45), (1.0, 0.6), (1.0, 1.0)]
+
+
+def parse_polygon(value) -> List[Tuple[float, float]]:
+    """A polygon of at least three normalized (x, y) points, from a list or a JSON string"""
+    if isinstance(value, str):
+        value = json.loads(value)
+    points = [(float(x), float(y)) for x, y in value]
+    if len(points) < 3 or not all(0.0 <= v <= 1.0 for point in points for v in point):
+        raise ValueError("ROI polygon needs at least three points with coordinates between 0 and 1")
+    return points
+
+
+def parse_tiles(value) -> Tuple[int, int]:
+    """A 'colsxrows' tile grid such as '2x1'"""
+    if isinstance(value, (list, tuple)):
+        cols, rows = value
+    else:
+        cols, rows = str(value).lower().split('x')
+    cols, rows = int(cols), int(rows)
+    if not (1 <= cols <= 8 and 1 <= rows <= 8):
+        raise ValueError("ROI tiles must be between 1x1 and 8x8")
+    return cols, rows
+
+
+def estimate_road_polygon(frames: Sequence[np.ndarray], width: int = 160) -> List[Tuple[float, float]]:
+    """
+    Rough road area from a few sample frames: the largest low-saturation, mid-brightness
+    region below the upper third of the image, as a convex polygon in normalized coordinates
+    """
+    if not len(frames):
+        return list(DEFAULT_ROAD_POLYGON)
+
+    height = max(1, int(frames[0].shape[0] * width / frames[0].shape[1]))
+    hsv = np.median(np.stack([
+        cv2.cvtColor(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2HSV)
+        for frame in frames
+    ]), axis=0).astype(np.uint8)
+
+    road = ((hsv[..., 1] < 60) & (hsv[..., 2] > 40) & (hsv[..., 2] < 220)).astype(np.uint8)
+    road[:height // 3] = 0
+    kernel = np.ones((5, 5), dtype=np.uint8)
+    road = cv2.morphologyEx(cv2.morphologyEx(road, cv2.MORPH_OPEN, kernel), cv2.MORPH_CLOSE, kernel)
+
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(road)
+    if count < 2:
+        return list(DEFAULT_ROAD_POLYGON)
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    if stats[largest, cv2.CC_STAT_AREA] < 0.05 * width * height:
+        return list(DEFAULT_ROAD_POLYGON)
+
+    points = cv2.findNonZero((labels == largest).astype(np.uint8))
+    hull = cv2.convexHull(points)
+    hull = cv2.approxPolyDP(hull, 0.01 * cv2.arcLength(hull, True), True).reshape(-1, 2)
+    return [(round(x / (width - 1), 4), round(y / (height - 1), 4)) for x, y in hull.tolist()]
+
+
+class RegionOfInterest:
+    """
+    Restricts inference to a polygon of the frame
+    The polygon's bounding box is cropped, pixels outside the polygon are greyed out,
+    and the crop is inferred whole at the full frame's scale or as a grid of tiles
+    """
+
+    def __init__(self, polygon: Sequence[Tuple[float, float]], tiles: Tuple[int, int] = (1, 1),
+                 overlap: float = 0.2, mask: bool = True):
+        self.polygon = np.array(polygon, dtype=np.float32)
+        self.tiles = tuple(tiles)
+        self.overlap = overlap
+        self.mask = mask
+        self._shape = None
+        self._rect = None
+        self._outside = None
+        self._tile_rects = []
+
+    @property
+    def pixel_fraction(self) -> float:
+        """Share of the frame's pixels that are sent to the model"""
+        if self._shape is None:
+            return 1.0
+        x1, y1, x2, y2 = self._rect
+        return (x2 - x1) * (y2 - y1) / float(self._shape[0] * self._shape[1])
+
+    def input_size(self, input_size: int, frame_shape: Tuple[int, ...]) -> int:
+        """
+        Model input size for each crop or tile
+        A whole crop keeps the full frame's scale so cost falls with the pixels removed, on backends
+        that honour the size (pytorch; the fixed-shape onnx/openvino graphs letterbox to their own);
+        tiles are each letterboxed to the full input size for finer detail
+        """
+        self._prepare(frame_shape)
+        if self.tiles != (1, 1):
+            return input_size
+        x1, y1, x2, y2 = self._rect
+        return make_divisible(max(x2 - x1, y2 - y1) * input_size / max(frame_shape[:2]))
+
+    def split(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """Crop, mask and tile every frame; tiles are ordered frame by frame"""
+        self._prepare(frames[0].shape)
+        x1, y1, x2, y2 = self._rect
+        tiles = []
+        for frame in frames:
+            crop = frame[y1:y2, x1:x2]
+            if self.mask and self._outside.any():
+                crop = crop.copy()
+                crop[self._outside] = 114
+            tiles.extend(crop[ty1:ty2, tx1:tx2] for tx1, ty1, tx2, ty2 in self._tile_rects)
+        return tiles
+
+    def merge(self, predictions: List[np.ndarray], iou_threshold: float = 0.45) -> List[np.ndarray]:
+        """Shift tile predictions back to full-frame coordinates and merge duplicates per frame"""
+        x1, y1, x2, y2 = self._rect
+        per_frame = len(self._tile_rects)
+        merged = []
+        for start in range(0, len(predictions), per_frame):
+            shifted, cut = [], []
+            for pred, (tx1, ty1, tx2, ty2) in zip(predictions[start:start + per_frame], self._tile_rects):
+                # Boxes touching an edge shared with another tile are likely truncated copies
+                cut.append(((pred[:, 0] <= 2) & (tx1 > 0)) | ((pred[:, 2] >= tx2 - tx1 - 2) & (tx2 < x2 - x1))
+                           | ((pred[:, 1] <= 2) & (ty1 > 0)) | ((pred[:, 3] >= ty2 - ty1 - 2) & (ty2 < y2 - y1)))
+                pred = pred.copy()
+                pred[:, [0, 2]] += x1 + tx1
+                pred[:, [1, 3]] += y1 + ty1
+                shifted.append(pred)
+            if per_frame == 1:
+                merged.append(shifted[0])
+                continue
+            frame_pred = np.concatenate(shifted)
+            # Rank whole boxes above truncated ones so the complete copy survives NMS
+            scores = frame_pred[:, 4] * np.where(np.concatenate(cut), 0.5, 1.0)
+            merged.append(class_aware_nms(frame_pred, iou_threshold, scores=scores))
+        return merged
+
+    def draw(self, display: np.ndarray, color: Tuple[int, int, int] = (0, 255, 255)):
+        """Outline the region on a display-size frame"""
+        height, width = display.shape[:2]
+        points = (self.polygon * [width - 1, height - 1]).astype(np.int32)
+        cv2.polylines(display, [points], True, color, 1)
+
+    def _prepare(self, shape: Tuple[int, ...]):
+        """Pixel crop rectangle, outside-polygon mask and tile grid for a frame size"""
+        shape = tuple(shape[:2])
+        if shape == self._shape:
+            return
+        height, width = shape
+        points = np.round(self.polygon * [width - 1, height - 1]).astype(np.int32)
+        x, y, w, h = cv2.boundingRect(points)
+        self._rect = (x, y, x + w, y + h)
+
+        inside = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(inside, [points - [x, y]], 1)
+        self._outside = inside == 0
+
+        cols, rows = self.tiles
+        tile_w = w / (cols - (cols - 1) * self.overlap)
+        tile_h = h / (rows - (rows - 1) * self.overlap)
+        self._tile_rects = [
+            (int(c * tile_w * (1 - self.overlap)), int(r * tile_h * (1 - self.overlap)),
+             min(w, int(c * tile_w * (1 - self.overlap) + tile_w)), min(h, int(r * tile_h * (1 - self.overlap) + tile_h)))
+            for r in range(rows) for c in range(cols)
+        ]
+        self._shape = shape
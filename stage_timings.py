@@ -0,0 +1,218 @@
+"""
+Pipeline Stage Timings
+Per-stage durations (decode, inference, post-process, draw, encode, yield) recorded by the
+video and live pipelines when a recorder is passed in: rolling percentiles for benchmarks,
+or cumulative histograms per detection type and session for the /metrics endpoint
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Upper bounds of the histogram buckets, in seconds
+HISTOGRAM_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class StageRecorder:
+    """Base for the stage recorders: record(stage, seconds, count) plus a timing context manager"""
+
+    def record(self, stage: str, seconds: float, count: int = 1):
+        raise NotImplementedError
+
+    @contextmanager
+    def time(self, stage: str, count: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, count)
+
+
+class StageTimings(StageRecorder):
+    """Keeps the most recent durations of each named stage and summarizes them as percentiles"""
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, count: int = 1):
+        """Record a duration; with count > 1 it is split evenly, e.g. over the frames of a batch"""
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+            samples.extend([seconds / count] * count)
+            self._counts[stage] += count
+
+    def summary(self) -> Dict[str, Dict]:
+        """count, mean and p50/p95/p99 in milliseconds for every stage"""
+        with self._lock:
+            snapshot = {stage: (np.array(samples, dtype=np.float64) * 1000, self._counts[stage])
+                        for stage, samples in self._samples.items()}
+        summary = {}
+        for stage, (samples, count) in sorted(snapshot.items()):
+            if not samples.size:
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            summary[stage] = {
+                'count': count,
+                'mean_ms': round(float(samples.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3)
+            }
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+class StageHistograms(StageRecorder):
+    """
+    Cumulative bucket counts, sum and count of each stage's durations
+    A parent, e.g. the totals of a detection type, receives everything recorded here as well
+    Buckets default to durations in seconds but can hold any value, e.g. batch sizes
+    """
+
+    def __init__(self, parent: Optional['StageHistograms'] = None, buckets: Tuple = HISTOGRAM_BUCKETS):
+        self.parent = parent
+        self.buckets = buckets
+        self._stages: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, count: int = 1):
+        bucket = int(np.searchsorted(self.buckets, seconds / count))
+        with self._lock:
+            counts, total = self._entry(stage)
+            counts[bucket] += count
+            total[0] += seconds
+        if self.parent is not None:
+            self.parent.record(stage, seconds, count)
+
+    def merge(self, snapshot: Dict[str, Tuple[List[int], float]]):
+        """Add a snapshot taken elsewhere, e.g. sent back by a worker process"""
+        with self._lock:
+            for stage, (bucket_counts, seconds) in snapshot.items():
+                counts, total = self._entry(stage)
+                for bucket, value in enumerate(bucket_counts):
+                    counts[bucket] += value
+                total[0] += seconds
+        if self.parent is not None:
+            self.parent.merge(snapshot)
+
+    def snapshot(self) -> Dict[str, Tuple[List[int], float]]:
+        """Per-bucket (not cumulative) counts and the summed seconds of every stage"""
+        with self._lock:
+            return {stage: (list(counts), total[0]) for stage, (counts, total) in self._stages.items()}
+
+    def take(self) -> Dict[str, Tuple[List[int], float]]:
+        """The snapshot since the last take, for sending as a delta"""
+        with self._lock:
+            snapshot = {stage: (list(counts), total[0]) for stage, (counts, total) in self._stages.items()}
+            self._stages.clear()
+        return snapshot
+
+    def _entry(self, stage: str):
+        """Bucket counts (one per bound plus +Inf) and a one-item sum (caller holds the lock)"""
+        if stage not in self._stages:
+            self._stages[stage] = ([0] * (len(self.buckets) + 1), [0.0])
+        return self._stages[stage]
+
+
+class PipelineMetrics:
+    """
+    Stage histograms of the video and live pipelines
+    Totals are kept per (pipeline, detection type); each session also has its own histograms
+    until it is forgotten
+    """
+
+    def __init__(self):
+        self._totals: Dict[Tuple[str, str], StageHistograms] = {}
+        self._sessions: Dict[Tuple[str, str, str], StageHistograms] = {}
+        self._lock = threading.Lock()
+
+    def session(self, pipeline: str, detection_type: str, session_id: str) -> StageHistograms:
+        """The recorder for one upload job or live stream"""
+        key = (pipeline, detection_type, str(session_id))
+        with self._lock:
+            histograms = self._sessions.get(key)
+            if histograms is None:
+                totals = self._totals.get(key[:2])
+                if totals is None:
+                    totals = self._totals[key[:2]] = StageHistograms()
+                histograms = self._sessions[key] = StageHistograms(parent=totals)
+            return histograms
+
+    def forget(self, session_id: str):
+        """Drop a session's own histograms; its durations stay in the totals"""
+        with self._lock:
+            for key in [key for key in self._sessions if key[2] == session_id]:
+                del self._sessions[key]
+
+    def exposition(self) -> List[str]:
+        """Prometheus text-format lines for the totals and the per-session histograms"""
+        with self._lock:
+            totals = list(self._totals.items())
+            sessions = list(self._sessions.items())
+        lines = []
+        lines += histogram_lines(
+            'sanchar_stage_seconds', 'Frame loop stage durations per pipeline and detection type',
+            [({'pipeline': pipeline, 'detection_type': detection_type}, histograms)
+             for (pipeline, detection_type), histograms in totals]
+        )
+        lines += histogram_lines(
+            'sanchar_session_stage_seconds', 'Frame loop stage durations per upload job or live stream',
+            [({'pipeline': pipeline, 'detection_type': detection_type, 'session': session_id}, histograms)
+             for (pipeline, detection_type, session_id), histograms in sessions]
+        )
+        return lines
+
+
+def format_labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def metric_lines(name: str, kind: str, help_text: str, samples: List[Tuple[Dict, float]]) -> List[str]:
+    """Prometheus text-format lines for a gauge or counter"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{format_labels(labels)} {value}" for labels, value in samples]
+    return lines
+
+
+def histogram_lines(name: str, help_text: str, series: List[Tuple[Dict, StageHistograms]],
+                    stage_label: Optional[str] = 'stage') -> List[str]:
+    """
+    Prometheus text-format lines for StageHistograms, each stage labelled with stage_label
+    (leave it out for histograms that only record one stage)
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histograms in series:
+        for stage, (counts, seconds) in sorted(histograms.snapshot().items()):
+            stage_labels = dict(labels, **{stage_label: stage}) if stage_label else dict(labels)
+            cumulative = np.cumsum(counts).tolist()
+            for bound, value in zip(histograms.buckets + ('+Inf',), cumulative):
+                lines.append(f"{name}_bucket{format_labels(dict(stage_labels, le=bound))} {value}")
+            lines.append(f"{name}_sum{format_labels(stage_labels)} {round(seconds, 6)}")
+            lines.append(f"{name}_count{format_labels(stage_labels)} {cumulative[-1]}")
+    return lines
+
+
+def stage_timer(timings: Optional[StageRecorder]):
+    """timings.time, or a no-op timer when the caller did not ask for timings"""
+    if timings is None:
+        return lambda stage, count=1: nullcontext()
+    return timings.time
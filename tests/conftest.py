@@ -0,0 +1,24 @@
+"""Shared fixtures for the pipeline tests; the modules under test live in the repository root"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def clip_path(tmp_path):
+    """A short MJPG clip with a bright square moving across a grey road"""
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (320, 240))
+    for index in range(60):
+        frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+        x = 10 + index * 4
+        cv2.rectangle(frame, (x, 100), (x + 40, 140), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
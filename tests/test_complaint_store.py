@@ -0,0 +1,30 @@
+import sqlite3
+
+import numpy as np
+
+from complaint_store import ComplaintWriter
+
+
+def test_unwritable_snapshot_is_not_linked(tmp_path):
+    db_path = str(tmp_path / 'complaints.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('''CREATE TABLE complaints (id INTEGER PRIMARY KEY, detection_type TEXT, confidence REAL,
+                    timestamp TEXT, location TEXT, description TEXT, image_path TEXT, clip_path TEXT)''')
+    conn.commit()
+    conn.close()
+
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    saved = str(tmp_path / 'saved.jpg')
+    # imwrite returns False rather than raising when the folder does not exist
+    missing = str(tmp_path / 'missing' / 'lost.jpg')
+    writer = ComplaintWriter(db_path=db_path, flush_interval=0.01)
+    writer.submit('pothole', 0.9, frame, saved)
+    writer.submit('pothole', 0.8, frame, missing)
+    writer.drain(5)
+    writer.close()
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT confidence, image_path FROM complaints ORDER BY confidence DESC').fetchall()
+    conn.close()
+    assert [(round(confidence, 1), path) for confidence, path in rows] == [(0.9, saved), (0.8, None)]
+    assert writer.stats()['snapshots_failed'] == 1 and writer.stats()['written'] == 2
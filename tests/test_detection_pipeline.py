@@ -0,0 +1,47 @@
+import cv2
+import pytest
+
+from detection_pipeline import FrameReader
+
+
+class BrokenCapture:
+    """Yields a few frames of a real capture, then fails the way a corrupt stream can"""
+
+    def __init__(self, path, frames):
+        self.capture = cv2.VideoCapture(path)
+        self.frames = frames
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def read(self, *args):
+        if not self.frames:
+            raise cv2.error('corrupt stream')
+        self.frames -= 1
+        return self.capture.read(*args)
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self, *args):
+        if not self.frames:
+            raise cv2.error('corrupt stream')
+        self.frames -= 1
+        return self.capture.retrieve(*args)
+
+
+def test_reader_yields_segment_frames_in_order(clip_path):
+    reader = FrameReader(cv2.VideoCapture(clip_path), buffer_size=4, start_frame=10, end_frame=25)
+    numbers = [number for batch in reader.batches(4) for number, _ in batch]
+    reader.close()
+    assert numbers == list(range(11, 26))
+
+
+def test_decode_error_reaches_the_consumer(clip_path):
+    reader = FrameReader(BrokenCapture(clip_path, 3), buffer_size=2)
+    numbers = []
+    with pytest.raises(cv2.error):
+        for number, _ in reader:
+            numbers.append(number)
+    reader.close()
+    assert numbers == [1, 2, 3]
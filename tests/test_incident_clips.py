@@ -0,0 +1,106 @@
+import os
+import sqlite3
+
+import cv2
+import numpy as np
+
+from complaint_store import clear_clip_path
+from incident_clips import ClipRing, ClipWriter, jpeg_size, write_mjpeg_avi
+
+
+def encoded_frames(count, size=(160, 120)):
+    frames = []
+    for index in range(count):
+        frame = np.full((size[1], size[0], 3), index * 4 % 256, dtype=np.uint8)
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    return frames
+
+
+def test_jpeg_size_reads_frame_header():
+    assert jpeg_size(encoded_frames(1, (200, 90))[0]) == (200, 90)
+
+
+def test_write_mjpeg_avi_reads_back(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    write_mjpeg_avi(path, encoded_frames(30), 12.5)
+
+    capture = cv2.VideoCapture(path)
+    assert capture.get(cv2.CAP_PROP_FPS) == 12.5
+    frames = 0
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        assert frame.shape == (120, 160, 3)
+        frames += 1
+    capture.release()
+    assert frames == 30
+    assert not os.path.exists(path + '.part')
+
+
+def test_clip_ring_keeps_pre_and_post_roll():
+    clips = []
+    ring = ClipRing(pre_roll=1.0, post_roll=0.5, max_bytes=10 ** 7,
+                    on_clip=lambda path, jpegs, fps: clips.append((path, len(jpegs), fps)))
+    frames = encoded_frames(40)
+    for index, jpeg in enumerate(frames):
+        capture_time = index * 0.1
+        if index == 20:
+            assert ring.trigger('first.avi', capture_time) == 'first.avi'
+            # An incident during the post-roll shares the clip
+            assert ring.trigger('second.avi', capture_time) == 'first.avi'
+        ring.add(capture_time, jpeg)
+
+    # Frames captured at 1.0-1.9 s before the trigger, then 2.0-2.5 s after it
+    assert len(clips) == 1
+    path, count, fps = clips[0]
+    assert (path, count) == ('first.avi', 16)
+    assert abs(fps - 10.0) < 0.01
+    assert ring.clips == 1
+
+
+def test_clip_ring_respects_byte_cap():
+    frames = encoded_frames(20)
+    cap = sum(len(jpeg) for jpeg in frames[:5])
+    ring = ClipRing(pre_roll=60.0, post_roll=1.0, max_bytes=cap, on_clip=lambda *args: None)
+    for index, jpeg in enumerate(frames):
+        ring.add(index * 0.1, jpeg)
+    assert ring.buffered_bytes <= cap
+
+
+def test_clip_ring_close_finishes_recording():
+    clips = []
+    ring = ClipRing(1.0, 5.0, 10 ** 7, lambda path, jpegs, fps: clips.append(len(jpegs)))
+    for index, jpeg in enumerate(encoded_frames(5)):
+        ring.add(index * 0.1, jpeg)
+    ring.trigger('clip.avi', 0.5)
+    ring.close()
+    assert clips == [5]
+
+
+def test_failed_clip_is_unlinked(tmp_path):
+    db_path = str(tmp_path / 'complaints.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE complaints (id INTEGER PRIMARY KEY, clip_path TEXT)')
+    conn.execute("INSERT INTO complaints (clip_path) VALUES ('missing/clip.avi')")
+    conn.commit()
+    conn.close()
+
+    writer = ClipWriter(on_lost=lambda path: clear_clip_path(path, db_path))
+    # Not a JPEG, so the write fails
+    writer.submit('missing/clip.avi', [b'not a jpeg'], 10.0)
+    writer.drain(5)
+
+    assert writer.failed == 1
+    assert writer.is_lost('missing/clip.avi')
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT clip_path FROM complaints').fetchone() == (None,)
+    conn.close()
+
+
+def test_full_queue_drops_clip():
+    writer = ClipWriter(max_queue=1)
+    writer._ensure_started = lambda: None
+    assert writer.submit('a.avi', encoded_frames(1), 10.0)
+    assert not writer.submit('b.avi', encoded_frames(1), 10.0)
+    assert writer.dropped == 1 and writer.is_lost('b.avi') and not writer.is_lost('a.avi')
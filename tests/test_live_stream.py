@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from live_stream import LatestSlot, LiveBroadcaster
+from video_sources import SourceRegistry
+
+SETTINGS = {
+    'conf_threshold': 0.25,
+    'high_conf_threshold': 0.7,
+    'track_iou_threshold': 0.3,
+    'track_max_misses': 2,
+    'incident_report_delay': 15,
+    'default_inference_size': None,
+    'display_width': 320,
+    'idle_grace': 0.1,
+    'frame_pool': False,
+    'motion_gate': False,
+    'roi': None,
+}
+
+
+class GatedModel:
+    """Returns no detections; while the gate is closed every call waits for it to open"""
+
+    names = {0: 'pothole'}
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, images, size=None):
+        self.gate.wait(10)
+        return type('Results', (), {'xyxy': [np.zeros((0, 6), dtype=np.float32) for _ in images]})()
+
+
+class OneModelRegistry:
+    def __init__(self, model):
+        self.model = model
+
+    def types(self, detection_type):
+        return [detection_type]
+
+    def input_size(self, detection_type, default=None):
+        return default
+
+    @contextmanager
+    def lease(self, detection_type):
+        yield self.model
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_latest_slot_replaces_unread_value():
+    dropped = []
+    slot = LatestSlot(on_drop=dropped.append)
+    slot.put(1)
+    slot.put(2)
+    assert slot.poll() == 2
+    assert dropped == [1] and slot.dropped == 1
+    slot.close()
+    assert slot.take(timeout=0.01) is None
+
+
+def test_viewer_subscribing_during_shutdown_restarts_pipeline(clip_path):
+    model = GatedModel()
+    source = SourceRegistry({'cam': {'uri': clip_path, 'fps': 50, 'loop': True}}).get('cam')
+    broadcaster = LiveBroadcaster(source, 'pothole', OneModelRegistry(model), None, SETTINGS)
+
+    first = broadcaster.subscribe()
+    assert next(first)
+    # Hold detection so the pipeline is still shutting down when the next viewer arrives
+    model.gate.clear()
+    first.close()
+    # Past the idle grace the capture stage has stopped, while detection is still held
+    time.sleep(SETTINGS['idle_grace'] + 0.4)
+    assert broadcaster.running
+
+    second = broadcaster.subscribe()
+    model.gate.set()
+    frames = []
+    reader = threading.Thread(target=lambda: frames.extend(jpeg for _, jpeg in zip(range(3), second)))
+    reader.start()
+    reader.join(10)
+    assert len(frames) == 3
+    assert broadcaster.running
+    second.close()
+    broadcaster.stop()
+    assert wait_until(lambda: not broadcaster.running)
+
+
+def test_stop_does_not_restart(clip_path):
+    source = SourceRegistry({'cam': {'uri': clip_path, 'loop': True}}).get('cam')
+    broadcaster = LiveBroadcaster(source, 'pothole', OneModelRegistry(GatedModel()), None, SETTINGS)
+    viewer = broadcaster.subscribe()
+    assert next(viewer)
+    broadcaster.stop()
+    assert wait_until(lambda: not broadcaster.running)
+    assert broadcaster._thread is None
+    viewer.close()
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+pytest.importorskip('torch')
+
+from model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, images, size=None):
+        return None
+
+
+def registry(tmp_path, **kwargs):
+    paths = {}
+    for name in ('pothole', 'accident'):
+        path = tmp_path / f"{name}.pt"
+        path.write_bytes(b'x' * (1024 * 1024))
+        paths[name] = {'path': str(path), 'backend': 'fake'}
+    models = ModelRegistry(paths, warmup=False, **kwargs)
+    models.register_backend('fake', lambda path, confidence, spec: FakeModel(path))
+    return models
+
+
+def leases(models, detection_type):
+    return {model['detection_type']: model['active_leases'] for model in models.stats()['models']}.get(detection_type)
+
+
+def test_lease_is_held_from_first_load(tmp_path):
+    models = registry(tmp_path, memory_budget_mb=1.5, idle_timeout=0)
+    with models.lease('pothole') as model:
+        assert leases(models, 'pothole') == 1
+        # Loading another model over budget cannot evict the leased one
+        models.get('accident')
+        assert models.get('pothole') is model
+        assert leases(models, 'pothole') == 1
+    assert leases(models, 'pothole') == 0
+
+
+def test_leased_model_survives_idle_eviction(tmp_path):
+    models = registry(tmp_path, idle_timeout=0.05)
+    with models.lease('pothole') as model:
+        time.sleep(0.1)
+        models.evict_idle()
+        assert leases(models, 'pothole') == 1
+        assert models.get('pothole') is model
+    time.sleep(0.1)
+    models.evict_idle()
+    assert models.stats()['models'] == []
+    assert models.evictions == 1
+
+
+def test_lease_of_missing_model_yields_none(tmp_path):
+    models = registry(tmp_path)
+    models.model_paths['pothole']['path'] = str(tmp_path / 'missing.pt')
+    with models.lease('pothole') as model:
+        assert model is None
@@ -0,0 +1,56 @@
+import numpy as np
+
+from object_tracking import TrackIncident, stitch_incidents
+
+
+def incident(track_id, label, first_frame, last_frame, first_box, last_box, confidence=0.5):
+    item = TrackIncident(track_id, label, first_frame)
+    item.last_frame = last_frame
+    item.first_box = np.array(first_box, dtype=np.float32)
+    item.last_box = np.array(last_box, dtype=np.float32)
+    item.max_confidence = confidence
+    return item
+
+
+def test_stitch_joins_incident_cut_by_segment_boundary():
+    first = incident(1, 'pothole', 80, 99, [0, 0, 10, 10], [10, 10, 50, 50], confidence=0.4)
+    second = incident(1, 'pothole', 100, 130, [12, 12, 52, 52], [20, 20, 60, 60], confidence=0.9)
+    second.best_frame_number = 120
+
+    stitched = stitch_incidents([[('pothole', first, False, True)], [('pothole', second, True, False)]])
+
+    assert len(stitched) == 1
+    detection_type, joined = stitched[0]
+    assert detection_type == 'pothole' and joined is first
+    assert (joined.first_frame, joined.last_frame) == (80, 130)
+    assert joined.max_confidence == 0.9 and joined.best_frame_number == 120
+
+
+def test_stitch_keeps_distinct_objects_apart():
+    ending = incident(1, 'pothole', 80, 99, [0, 0, 10, 10], [10, 10, 50, 50])
+    elsewhere = incident(2, 'pothole', 100, 110, [200, 200, 240, 240], [200, 200, 240, 240])
+    other_label = incident(3, 'hump', 100, 110, [10, 10, 50, 50], [10, 10, 50, 50])
+    other_type = incident(4, 'pothole', 100, 110, [10, 10, 50, 50], [10, 10, 50, 50])
+
+    stitched = stitch_incidents([
+        [('pothole', ending, False, True)],
+        [('pothole', elsewhere, True, False), ('pothole', other_label, True, False),
+         ('accident', other_type, True, False)]
+    ])
+
+    assert sorted(item.track_id for _, item in stitched) == [1, 2, 3, 4]
+
+
+def test_stitch_respects_gap_and_chains_segments():
+    late = incident(1, 'pothole', 80, 99, [0, 0, 10, 10], [10, 10, 50, 50])
+    too_late = incident(2, 'pothole', 200, 210, [10, 10, 50, 50], [10, 10, 50, 50])
+    assert len(stitch_incidents([[('pothole', late, False, True)], [('pothole', too_late, True, False)]],
+                                max_gap=30)) == 2
+
+    # An object spanning a whole middle segment is joined across both cuts
+    head = incident(1, 'pothole', 90, 99, [0, 0, 10, 10], [10, 10, 50, 50])
+    middle = incident(1, 'pothole', 100, 199, [10, 10, 50, 50], [10, 10, 50, 50])
+    tail = incident(1, 'pothole', 200, 220, [10, 10, 50, 50], [10, 10, 50, 50])
+    stitched = stitch_incidents([[('pothole', head, False, True)], [('pothole', middle, True, True)],
+                                 [('pothole', tail, True, False)]])
+    assert len(stitched) == 1 and stitched[0][1].last_frame == 220
@@ -0,0 +1,85 @@
+import numpy as np
+
+import onnx_backend
+from onnx_backend import OnnxDetector, preprocess
+
+
+def test_preprocess_returns_batch_and_transforms():
+    frames = [np.zeros((240, 320, 3), dtype=np.uint8), np.zeros((100, 50, 3), dtype=np.uint8)]
+    batch, transforms = preprocess(frames, 160)
+    assert batch.shape == (2, 3, 160, 160) and batch.dtype == np.float32
+    assert transforms == [(0.5, (0, 20)), (1.6, (40, 0))]
+
+
+class FixedSession:
+    """Reports one box covering the middle of the letterboxed input for every image"""
+
+    def run(self, outputs, feeds):
+        batch = next(iter(feeds.values()))
+        pred = np.zeros((len(batch), 1, 6), dtype=np.float32)
+        # x, y, w, h, objectness, class score
+        pred[:, 0] = [80, 80, 40, 40, 0.9, 1.0]
+        return [pred]
+
+
+def test_detector_letterboxes_each_frame_once(monkeypatch):
+    calls = []
+    letterbox = onnx_backend.letterbox
+
+    def counting_letterbox(frame, *args, **kwargs):
+        calls.append(frame.shape)
+        return letterbox(frame, *args, **kwargs)
+
+    monkeypatch.setattr(onnx_backend, 'letterbox', counting_letterbox)
+
+    detector = OnnxDetector.__new__(OnnxDetector)
+    detector.session = FixedSession()
+    detector.input_name = 'images'
+    detector.input_size = 160
+    detector.conf = 0.25
+
+    frames = [np.zeros((240, 320, 3), dtype=np.uint8), np.zeros((100, 50, 3), dtype=np.uint8)]
+    results = detector(frames)
+
+    assert len(calls) == len(frames)
+    # The 40 x 40 box at (60, 60)-(100, 100) mapped back through each frame's scale and padding
+    np.testing.assert_allclose(results.xyxy[0][0, :4], [120, 80, 200, 160])
+    np.testing.assert_allclose(results.xyxy[1][0, :4], [12.5, 37.5, 37.5, 62.5])
+
+
+class RecordingModel:
+    """Keeps the images it is called with, like the torch.hub model's interface"""
+
+    def __init__(self):
+        self.images = None
+
+    def __call__(self, images, size=None):
+        self.images = images
+        return type('Results', (), {'xyxy': [np.zeros((0, 6), dtype=np.float32) for _ in images]})()
+
+
+class RecordingSession(FixedSession):
+    def run(self, outputs, feeds):
+        self.batch = next(iter(feeds.values()))
+        return super().run(outputs, feeds)
+
+
+def test_backends_get_the_same_rgb_input():
+    from detection_pipeline import infer_batch
+
+    # Pure blue in OpenCV's BGR order
+    frame = np.zeros((160, 160, 3), dtype=np.uint8)
+    frame[..., 0] = 255
+
+    pytorch = RecordingModel()
+    infer_batch(pytorch, [frame], 160)
+    detector = OnnxDetector.__new__(OnnxDetector)
+    detector.session = RecordingSession()
+    detector.input_name = 'images'
+    detector.input_size = 160
+    detector.conf = 0.25
+    infer_batch(detector, [frame], 160)
+
+    rgb = pytorch.images[0]
+    assert (rgb[..., 2] == 255).all() and (rgb[..., 0] == 0).all()
+    np.testing.assert_allclose(detector.session.batch[0], rgb.transpose(2, 0, 1) / 255.0)
@@ -0,0 +1,59 @@
+from result_store import SessionResults
+
+
+def detections(frames, label='pothole', model=''):
+    return [{'frame': frame, 'type': label, 'model': model, 'confidence': 0.5, 'bbox': [frame, 0, frame + 5, 5]}
+            for frame in frames]
+
+
+def test_since_cursor_pages_only_new_detections(tmp_path):
+    results = SessionResults(str(tmp_path), 'session')
+    assert results.append(detections([1, 1, 2])) == 3
+
+    first = results.page(0, 2)
+    assert [record['frame'] for record in first] == [1, 1]
+    cursor = len(first)
+    assert [record['frame'] for record in results.page(cursor, 100)] == [2]
+    cursor = results.count()
+    assert results.page(cursor, 100) == []
+
+    # A poll after more detections arrive only returns those
+    results.append(detections([5, 7], label='hump', model='pathole_hump'))
+    page = results.page(cursor, 100)
+    assert [(record['frame'], record['type'], record['model']) for record in page] == [
+        (5, 'hump', 'pathole_hump'), (7, 'hump', 'pathole_hump')]
+    assert 'model' not in results.page(0, 1)[0]
+
+
+def test_since_frame_maps_to_first_later_detection(tmp_path):
+    results = SessionResults(str(tmp_path), 'session')
+    assert results.index_after_frame(10) == 0
+    results.append(detections([1, 3, 3, 8]))
+    assert results.index_after_frame(0) == 0
+    assert results.index_after_frame(3) == 3
+    assert results.index_after_frame(4) == 3
+    assert results.index_after_frame(8) == 4
+    assert [record['frame'] for record in results.page(results.index_after_frame(2))] == [3, 3, 8]
+
+
+def test_page_reads_labels_written_by_another_instance(tmp_path):
+    reader = SessionResults(str(tmp_path), 'session')
+    writer = SessionResults(str(tmp_path), 'session')
+    writer.append(detections([1]))
+    assert reader.page(0)[0]['type'] == 'pothole'
+    writer.append(detections([2], label='hump'))
+    assert reader.page(1)[0]['type'] == 'hump'
+
+
+def test_timeline_and_extend(tmp_path):
+    first = SessionResults(str(tmp_path), 'first')
+    first.append(detections([1, 2]))
+    first.append_counts([1, 1, 0])
+    second = SessionResults(str(tmp_path), 'second')
+    second.append(detections([4], label='hump'))
+    second.append_counts([1])
+
+    assert first.extend(second) == 3
+    assert [record['type'] for record in first.page()] == ['pothole', 'pothole', 'hump']
+    assert first.timeline() == [1, 1, 0, 1]
+    assert first.timeline(2, 1) == [0]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from roi import RegionOfInterest, parse_polygon, parse_tiles
+
+
+def box(x1, y1, x2, y2, confidence, class_id=0):
+    return [x1, y1, x2, y2, confidence, class_id]
+
+
+def test_parse_options():
+    assert parse_polygon('[[0, 0], [1, 0], [0.5, 1]]') == [(0.0, 0.0), (1.0, 0.0), (0.5, 1.0)]
+    assert parse_tiles('2x1') == (2, 1)
+    with pytest.raises(ValueError):
+        parse_polygon([[0, 0], [2, 0], [0, 1]])
+    with pytest.raises(ValueError):
+        parse_tiles('9x1')
+
+
+def test_split_crops_and_masks_to_polygon():
+    frame = np.full((101, 101, 3), 255, dtype=np.uint8)
+    roi = RegionOfInterest([(0.5, 0.5), (1.0, 0.5), (0.5, 1.0)])
+    crop, = roi.split([frame])
+    assert crop.shape == (51, 51, 3)
+    assert (crop[0, 0] == 255).all() and (crop[-1, -1] == 114).all()
+    assert roi.pixel_fraction == pytest.approx(51 * 51 / 101 ** 2)
+
+
+def test_merge_shifts_whole_crop_predictions_to_frame():
+    roi = RegionOfInterest([(0.5, 0.5), (1.0, 0.5), (1.0, 1.0), (0.5, 1.0)])
+    roi.split([np.zeros((101, 101, 3), dtype=np.uint8)] * 2)
+    merged = roi.merge([np.array([box(0, 0, 10, 10, 0.9)], dtype=np.float32),
+                        np.zeros((0, 6), dtype=np.float32)])
+    assert len(merged) == 2
+    np.testing.assert_allclose(merged[0][0, :4], [50, 50, 60, 60])
+    assert len(merged[1]) == 0
+
+
+def test_merge_keeps_whole_copy_of_object_in_tile_overlap():
+    roi = RegionOfInterest([(0, 0), (1, 0), (1, 1), (0, 1)], tiles=(2, 1), overlap=0.2)
+    tiles = roi.split([np.zeros((100, 200, 3), dtype=np.uint8)])
+    assert len(tiles) == 2
+    (_, _, left_end, _), (right_start, _, _, _) = roi._tile_rects
+    assert right_start < left_end
+
+    # The same object from both tiles; the right tile sees it against its left edge
+    object_x1 = right_start
+    left = np.array([box(object_x1, 40, object_x1 + 15, 60, 0.8)], dtype=np.float32)
+    right = np.array([box(0, 40, 15, 60, 0.9), box(60, 10, 80, 30, 0.7)], dtype=np.float32)
+    merged, = roi.merge([left, right])
+
+    assert len(merged) == 2
+    kept = merged[np.isclose(merged[:, 4], 0.8)]
+    np.testing.assert_allclose(kept[0, :4], [object_x1, 40, object_x1 + 15, 60])
+    np.testing.assert_allclose(merged[np.isclose(merged[:, 4], 0.7)][0, :4],
+                               [right_start + 60, 10, right_start + 80, 30])
@@ -0,0 +1,82 @@
+import pytest
+
+from upload_cache import ResultCache
+
+SETTINGS = {'conf_threshold': 0.25, 'inference_size': None, 'roi': None, 'annotated_video': False}
+
+
+class CompletedJob:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = 'completed'
+        self.frames = []
+        self.total_frames = 10
+        self.video_fps = 25.0
+        self.current_frame = 10
+        self.total_detections = 1
+        self.detection_count = 1
+        self.inferred_frames = 10
+        self.detection_stride = 1
+
+    def progress(self):
+        return {'elapsed_seconds': 1.0}
+
+
+@pytest.fixture
+def model_specs(tmp_path):
+    path = tmp_path / 'model.pt'
+    path.write_bytes(b'weights')
+    return {'pothole': {'path': str(path), 'input_size': 640}}
+
+
+def test_key_covers_video_models_and_settings(tmp_path, model_specs):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    key = cache.key('digest', 'pothole', model_specs, SETTINGS)
+    assert key == cache.key('digest', 'pothole', model_specs, dict(SETTINGS, display_width=1280))
+    assert key != cache.key('other', 'pothole', model_specs, SETTINGS)
+    assert key != cache.key('digest', 'accident', model_specs, SETTINGS)
+    assert key != cache.key('digest', 'pothole', model_specs, dict(SETTINGS, conf_threshold=0.5))
+    assert key != cache.key('digest', 'pothole', model_specs, dict(SETTINGS, roi=[[0, 0], [1, 0], [1, 1]]))
+    assert key != cache.key('digest', 'pothole', {'pothole': dict(model_specs['pothole'], input_size=320)},
+                            SETTINGS)
+
+
+def test_key_covers_annotated_video_and_encoder(tmp_path, model_specs, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    without_video = cache.key('digest', 'pothole', model_specs, SETTINGS)
+    video_settings = dict(SETTINGS, annotated_video=True)
+    monkeypatch.setattr('upload_cache.available_codec', lambda: 'avc1.mp4')
+    with_h264 = cache.key('digest', 'pothole', model_specs, video_settings)
+    monkeypatch.setattr('upload_cache.available_codec', lambda: None)
+    with_no_encoder = cache.key('digest', 'pothole', model_specs, video_settings)
+    assert len({without_video, with_h264, with_no_encoder}) == 3
+
+
+def test_key_changes_when_model_file_changes(tmp_path, model_specs):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    key = cache.key('digest', 'pothole', model_specs, SETTINGS)
+    with open(model_specs['pothole']['path'], 'ab') as f:
+        f.write(b' retrained')
+    assert key != cache.key('digest', 'pothole', model_specs, SETTINGS)
+
+
+def test_entry_with_missing_video_is_a_miss(tmp_path):
+    from result_store import SessionResults
+
+    results = SessionResults(str(tmp_path), 'session')
+    results.append([{'frame': 1, 'type': 'pothole', 'confidence': 0.9, 'bbox': [0, 0, 5, 5]}])
+    with open(f"{results.video_prefix}.mp4", 'wb') as f:
+        f.write(b'video')
+
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cache.expect('session', 'key')
+    cache.store(CompletedJob('session'), results)
+    assert cache.lookup('key')['annotated_video']
+
+    restored = SessionResults(str(tmp_path), 'repeat')
+    cache.restore('key', restored)
+    assert restored.count() == 1 and restored.annotated_video()
+
+    cache._results('key').delete()
+    assert cache.lookup('key') is None
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('torch')
+
+from result_store import SessionResults
+from video_jobs import VideoJob, VideoJobManager, plan_segments
+
+
+def test_plan_segments_splits_into_contiguous_ranges(clip_path):
+    segments = plan_segments(clip_path, 4, 10)
+    assert [index for index, _, _ in segments] == [0, 1, 2, 3]
+    assert segments[0][1] == 0 and segments[-1][2] is None
+    for (_, _, end), (_, start, _) in zip(segments, segments[1:]):
+        assert end == start
+
+
+def test_plan_segments_keeps_segments_long_enough(clip_path):
+    # The clip has 60 frames, so only two 25-frame segments fit
+    assert len(plan_segments(clip_path, 8, 25)) == 2
+    assert plan_segments(clip_path, 8, 40) == []
+    assert plan_segments(clip_path, 1, 1) == []
+    assert plan_segments('missing.mp4', 4, 1) == []
+
+
+def test_progress_reports_detections_waiting_for_merge():
+    job = VideoJob('job', 'video.mp4', 'pothole', 4)
+    job.status = 'processing'
+    job.segments = {0: {'detection_count': 5}, 1: {'detection_count': 7}, 2: {'detection_count': 3}}
+    assert job.progress()['unmerged_detections'] == 10
+    job.status = 'completed'
+    assert job.progress()['unmerged_detections'] == 0
+
+
+class SettledPool:
+    """Completes each submitted segment at once; the segment numbered failing raises"""
+
+    def __init__(self, failing):
+        self.failing = failing
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(fn.__name__)
+        future = Future()
+        segment = args[-1]
+        if segment[0] == self.failing:
+            future.set_exception(RuntimeError('decoder crashed'))
+        else:
+            future.set_result({'index': segment[0]})
+        return future
+
+
+def test_failed_split_job_deletes_segment_files(tmp_path):
+    results_dir = str(tmp_path)
+    for index in range(3):
+        results = SessionResults(results_dir, f"job-{index}")
+        results.append([{'frame': 1, 'type': 'pothole', 'confidence': 0.5, 'bbox': [0, 0, 1, 1]}])
+        results.append_counts([1])
+        with open(f"{results.video_prefix}.mp4", 'wb') as f:
+            f.write(b'video')
+    SessionResults(results_dir, 'job').append([{'frame': 1, 'type': 'pothole', 'confidence': 0.5,
+                                                'bbox': [0, 0, 1, 1]}])
+
+    manager = VideoJobManager({'results_dir': results_dir, 'worker_threads': 1})
+    manager._pool = SettledPool(failing=1)
+    job = VideoJob('job', 'video.mp4', 'pothole', 4)
+    manager.jobs['job'] = job
+    manager._submit_segments(job, [(0, 0, 10), (1, 10, 20), (2, 20, None)], manager.settings)
+
+    assert job.status == 'failed' and 'decoder crashed' in job.error
+    assert '_merge_segments' not in manager._pool.submitted
+    assert sorted(os.listdir(results_dir)) == ['job.det', 'job.labels.json']
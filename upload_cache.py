@@ -0,0 +1,212 @@
+"""
+Upload Deduplication and Result Cache
+Uploads are hashed while they are streamed to disk and stored once per content hash;
+finished analyses are cached by video hash, detection type, model versions and settings
+so a repeat upload is answered without reprocessing
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from annotated_video import available_codec
+from onnx_backend import file_digest
+from result_store import SessionResults
+
+CHUNK_SIZE = 1 << 20
+
+# Job settings that change the detections or complaints an analysis produces
+CACHE_SETTINGS = (
+    'conf_threshold', 'high_conf_threshold', 'inference_size', 'default_inference_size',
+    'roi', 'roi_tiles', 'roi_overlap', 'roi_auto_frames', 'detection_stride',
+    'max_detection_stride', 'adaptive_stride', 'track_iou_threshold', 'track_max_misses',
+    'annotated_video'
+)
+
+
+def save_upload(stream, folder: str, extension: str) -> Tuple[str, str, bool]:
+    """
+    Write an upload stream to disk in chunks while hashing it
+    The file is stored once under its content hash; returns (path, sha256, already_stored)
+    """
+    os.makedirs(folder, exist_ok=True)
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                f.write(chunk)
+        digest = sha256.hexdigest()
+        path = os.path.join(folder, f"{digest[:16]}.{extension}")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return path, digest, True
+        os.replace(tmp_path, path)
+        return path, digest, False
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _link_or_copy(source: str, destination: str):
+    """Hard-link a file where the filesystem allows it, else copy it"""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    """
+    Completed analyses keyed by content, detection type, model versions and settings
+    Each entry keeps the session's detection and annotated video files, progress counters and
+    last preview frame;
+    the least recently used entries beyond max_entries are deleted
+    """
+
+    def __init__(self, directory: str, max_entries: int = 500):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Dict] = {}
+        self._pending: Dict[str, str] = {}
+        self._model_versions: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(directory, name)) as f:
+                        self._entries[name[:-5]] = json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+    def model_version(self, spec: Dict) -> str:
+        """Digest of a model file (re-hashed only when it changes) plus its backend settings"""
+        path = spec.get('path') or ''
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 'missing'
+        memo_key = (path, stat.st_mtime, stat.st_size)
+        if memo_key not in self._model_versions:
+            self._model_versions[memo_key] = file_digest(path)
+        backend = spec.get('backend', 'pytorch')
+        return f"{self._model_versions[memo_key]}:{backend}:{spec.get('precision', 'fp32')}:{spec.get('input_size')}"
+
+    def key(self, video_digest: str, detection_type: str, model_specs: Dict[str, Dict], settings: Dict) -> str:
+        """Cache key of an analysis; with annotated video on, the encoder it would be written with is part of it"""
+        identity = {
+            'video': video_digest,
+            'detection_type': detection_type,
+            'models': {name: self.model_version(spec) for name, spec in sorted(model_specs.items())},
+            'settings': {name: settings.get(name) for name in CACHE_SETTINGS},
+            'video_encoder': available_codec() if settings.get('annotated_video') else None
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """A cached analysis, counting the hit or miss; an entry whose annotated video is gone is a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.get('annotated_video') and not self._results(key).annotated_video():
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry['last_used'] = time.time()
+            return entry
+
+    def restore(self, key: str, results: SessionResults) -> Optional[bytes]:
+        """Give a new session the cached detection files; returns the cached preview frame"""
+        cached = self._results(key)
+        for source, destination in zip(cached.files(), results.files()):
+            if os.path.exists(source):
+                _link_or_copy(source, destination)
+        preview_path = os.path.join(self.directory, f"{key}.jpg")
+        if os.path.exists(preview_path):
+            with open(preview_path, 'rb') as f:
+                return f.read()
+        return None
+
+    def expect(self, job_id: str, key: str):
+        """Remember the key of a job so its results are cached when it completes"""
+        with self._lock:
+            self._pending[job_id] = key
+
+    def store(self, job, results: SessionResults):
+        """Cache a completed job's detection and video files, counters and last preview frame"""
+        with self._lock:
+            key = self._pending.pop(job.job_id, None)
+        if key is None or job.status != 'completed':
+            return
+
+        cached = self._results(key)
+        for source, destination in zip(results.files(), cached.files()):
+            if os.path.exists(source):
+                _link_or_copy(source, destination)
+        if job.frames:
+            with open(os.path.join(self.directory, f"{key}.jpg"), 'wb') as f:
+                f.write(job.frames[-1][2])
+
+        progress = job.progress()
+        entry = {
+            'total_frames': job.total_frames,
+            'video_fps': job.video_fps,
+            'current_frame': job.current_frame,
+            'total_detections': job.total_detections,
+            'detection_count': job.detection_count,
+            'inferred_frames': job.inferred_frames,
+            'detection_stride': job.detection_stride,
+            'processing_seconds': progress['elapsed_seconds'],
+            'annotated_video': cached.annotated_video() is not None,
+            'last_used': time.time()
+        }
+        with open(os.path.join(self.directory, f"{key}.json"), 'w') as f:
+            json.dump(entry, f)
+        with self._lock:
+            self._entries[key] = entry
+            self._evict()
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._pending.pop(job_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def _results(self, key: str) -> SessionResults:
+        return SessionResults(self.directory, key)
+
+    def _evict(self):
+        """Delete least recently used entries beyond max_entries (caller holds the lock)"""
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1].get('last_used', 0))[:excess]:
+            del self._entries[key]
+            self._results(key).delete()
+            for suffix in ('.json', '.jpg'):
+                path = os.path.join(self.directory, f"{key}{suffix}")
+                if os.path.exists(path):
+                    os.remove(path)
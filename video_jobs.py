@@ -0,0 +1,757 @@
+"""
+Background Video Analysis Jobs
+Runs uploaded-video detection in worker processes, independently of any HTTP viewer
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from annotated_video import AnnotatedVideoWriter, concatenate_videos
+from complaint_store import ComplaintWriter
+from detection_pipeline import (
+    FramePool, FrameReader, infer_models, postprocess_detections, draw_detections, resize_frame, sample_frames
+)
+from model_registry import ModelRegistry
+from object_tracking import DetectorState, StrideController, TrackIncident, frame_motion, stitch_incidents
+from result_store import SessionResults
+from roi import RegionOfInterest, estimate_road_polygon
+from stage_timings import PipelineMetrics, StageHistograms, StageRecorder, stage_timer
+
+
+def submit_incident(writer: ComplaintWriter, detection_type: str, incident: TrackIncident):
+    """Queue the complaint and best-frame snapshot for one tracked object"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    image_path = f"static/uploads/{detection_type}_detection_{timestamp}_{incident.best_frame_number}.jpg"
+    writer.submit(detection_type, incident.max_confidence, incident.best_frame, image_path,
+                  f"Detected in uploaded video at frames {incident.first_frame}-{incident.last_frame} "
+                  f"(best frame {incident.best_frame_number})")
+
+
+def generate_processed_frames(models: Dict, capture, detection_type: str, settings: Dict,
+                              writer: ComplaintWriter, summary: Optional[Dict] = None,
+                              timings: Optional[StageRecorder] = None) -> Iterator[Dict]:
+    """
+    Decode, detect and annotate an uploaded video
+    models maps each detection type to its model; with detection_type 'all' every frame is
+    decoded once and passed through all of them, and results are tagged by model
+    Yields one result per frame with the display-size annotated frame and its detection records;
+    the final complaint count (including tracks still open at the end) is written to summary
+
+    With a detection stride above 1 (or adaptive stride) the detectors only run on
+    keyframes and boxes are carried forward by the optical-flow trackers in between
+
+    settings may restrict the loop to frames start_frame + 1 .. end_frame; when 'segmented',
+    incidents within stitch_window frames of either cut are not reported but returned in
+    summary['boundary_incidents'] for stitch_incidents
+
+    With timings, per-frame decode, inference, postprocess and draw durations are recorded
+
+    With settings['frame_pool'], frames are decoded and resized into reused buffers; a yielded
+    frame is only valid until the consumer asks for the next one
+    """
+    timer = stage_timer(timings)
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    detections_found = 0
+    conf_threshold = settings['conf_threshold']
+    high_conf_threshold = settings['high_conf_threshold']
+    batch_size = settings['batch_size']
+    input_sizes = settings['inference_sizes']
+    display_width = settings['display_width']
+    roi = None
+    if settings.get('roi'):
+        roi = RegionOfInterest(settings['roi'], settings['roi_tiles'], settings['roi_overlap'])
+
+    stride_control = StrideController(
+        base_stride=settings['detection_stride'],
+        max_stride=settings['max_detection_stride'],
+        adaptive=settings['adaptive_stride']
+    )
+    use_flow = stride_control.stride > 1 or stride_control.adaptive
+    states = [
+        DetectorState(name, model, settings['track_iou_threshold'], settings['track_max_misses'])
+        for name, model in models.items()
+    ]
+    previous_gray = None
+
+    start_frame = settings.get('start_frame', 0)
+    end_frame = settings.get('end_frame')
+    stitch_window = settings['stitch_window'] if settings.get('segmented') else None
+    boundary_incidents = []
+
+    def save_incidents(state, ready, video_end=False):
+        nonlocal detections_found
+        for incident in ready:
+            if stitch_window is not None:
+                at_start = start_frame > 0 and incident.first_frame <= start_frame + stitch_window
+                at_end = video_end and end_frame is not None and incident.last_frame > end_frame - stitch_window
+                if at_start or at_end:
+                    boundary_incidents.append((state.detection_type, incident, at_start, at_end))
+                    continue
+            submit_incident(writer, state.detection_type, incident)
+            detections_found += 1
+
+    # Enough buffers for the decode queue, one batch and the frame being decoded
+    pool = None
+    if settings.get('frame_pool'):
+        pool = FramePool(settings['decode_buffer_size'] + batch_size * stride_control.stride + 4)
+    reader = FrameReader(capture, buffer_size=settings['decode_buffer_size'],
+                         start_frame=start_frame, end_frame=end_frame, timings=timings, pool=pool)
+
+    try:
+        for batch in reader.batches(batch_size * stride_control.stride):
+            # Decide which frames get a detector pass before running any inference
+            grays = [None] * len(batch)
+            keyframes = [True] * len(batch)
+            if use_flow:
+                for index, (_, frame) in enumerate(batch):
+                    grays[index] = states[0].tracker.prepare(frame)
+                    keyframes[index] = stride_control.should_detect(frame_motion(previous_gray, grays[index]))
+                    previous_gray = grays[index]
+
+            # Batched forward passes over the keyframes, split back out per frame and model
+            detect_indices = [index for index, keyframe in enumerate(keyframes) if keyframe]
+            batch_predictions = {state.detection_type: {} for state in states}
+            for start in range(0, len(detect_indices), batch_size):
+                indices = detect_indices[start:start + batch_size]
+                try:
+                    with timer('inference', len(indices)):
+                        predictions = infer_models(models, [batch[index][1] for index in indices], input_sizes, roi)
+                except Exception as e:
+                    print(f"Error processing frames {batch[indices[0]][0]}-{batch[indices[-1]][0]}: {e}")
+                    predictions = {name: [None] * len(indices) for name in models}
+                for name, model_predictions in predictions.items():
+                    batch_predictions[name].update(zip(indices, model_predictions))
+
+            for index, (frame_count, frame) in enumerate(batch):
+                records = []
+                draw_start = time.perf_counter()
+                # Overlays are drawn on the display-size frame; boxes stay in source coordinates
+                display = resize_frame(frame, max_width=display_width, pool=pool)
+                display_scale = display.shape[1] / frame.shape[1]
+                if roi is not None:
+                    roi.draw(display)
+                draw_seconds = time.perf_counter() - draw_start
+                box_seconds = 0.0
+                postprocess_start = time.perf_counter()
+                for state in states:
+                    tracker = state.tracker
+                    try:
+                        detections = None
+                        track_ids = None
+                        if not keyframes[index]:
+                            detections = tracker.propagate(tracker.prepare(frame, grays[index]))
+                        elif batch_predictions[state.detection_type][index] is not None:
+                            detections = postprocess_detections(batch_predictions[state.detection_type][index],
+                                                                state.class_names, conf_threshold,
+                                                                high_conf_threshold)
+                            gray = tracker.prepare(frame, grays[index]) if use_flow else None
+                            track_ids = tracker.update(detections, frame_count, gray)
+
+                        if detections is not None:
+                            # Draw bounding boxes and labels
+                            draw_start = time.perf_counter()
+                            draw_detections(display, detections.scaled(display_scale), state.color)
+                            box_seconds += time.perf_counter() - draw_start
+                            records.extend(detections.to_records(frame_count, state.detection_type))
+
+                        # One complaint per track, with its best-confidence frame
+                        if track_ids is not None:
+                            state.incidents.observe(frame_count, display, detections, track_ids)
+                            save_incidents(state, state.incidents.ready(frame_count, tracker.pop_ended()))
+
+                    except Exception as e:
+                        print(f"Error processing frame {frame_count}: {e}")
+
+                postprocess_seconds = time.perf_counter() - postprocess_start - box_seconds
+                draw_start = time.perf_counter()
+
+                # Add processing info overlay
+                progress = (frame_count / total_frames) * 100 if total_frames else 0
+                info_text = f"Frame: {frame_count}/{total_frames} | Detections: {detections_found} | Progress: {progress:.1f}%"
+                cv2.putText(display, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+                cv2.putText(display, f"Detection: {detection_type}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+                if timings is not None:
+                    timings.record('postprocess', postprocess_seconds)
+                    timings.record('draw', draw_seconds + box_seconds + time.perf_counter() - draw_start)
+
+                yield {
+                    'frame_number': frame_count,
+                    'frame': display,
+                    'detections': records,
+                    'total_detections': detections_found,
+                    'inferred': keyframes[index],
+                    'detection_stride': stride_control.stride
+                }
+                # The consumer has finished with the frame once it resumes the generator
+                if pool is not None:
+                    pool.release(frame, display)
+
+        for state in states:
+            save_incidents(state, state.incidents.flush(), video_end=True)
+        if summary is not None:
+            summary['total_detections'] = detections_found
+            summary['boundary_incidents'] = boundary_incidents
+    finally:
+        reader.close()
+
+
+# ============ WORKER PROCESS ============
+
+_worker_state = {}
+
+
+def _init_worker(events, settings: Dict):
+    """Set up the per-process model registry and event channel"""
+    _worker_state['events'] = events
+    # Bulk upload work yields the CPU to the live streams in the web process
+    if settings.get('worker_nice') and hasattr(os, 'nice'):
+        os.nice(settings['worker_nice'])
+    # Share the cores between worker processes instead of each one using all of them
+    if settings.get('worker_threads'):
+        torch.set_num_threads(settings['worker_threads'])
+        cv2.setNumThreads(settings['worker_threads'])
+    _worker_state['registry'] = ModelRegistry(
+        settings['model_paths'],
+        confidence=settings['conf_threshold'],
+        memory_budget_mb=settings['model_memory_budget_mb'],
+        idle_timeout=0,
+        warmup=settings['model_warmup']
+    )
+    _worker_state['writer'] = ComplaintWriter(**settings['complaint_writer'])
+    os.makedirs(settings['results_dir'], exist_ok=True)
+
+
+def _run_job(job_id: str, video_path: str, detection_type: str, settings: Dict,
+             segment: Optional[Tuple[int, int, Optional[int]]] = None) -> Optional[Dict]:
+    """
+    Process one uploaded video end to end, reporting progress to the parent
+    With a segment (index, start_frame, end_frame) only that frame range is processed; its progress
+    is reported as 'segment' events and its totals and boundary incidents are returned for
+    _merge_segments. The first segment writes to the session's results, later ones to their own file
+    """
+    events = _worker_state['events']
+    registry = _worker_state['registry']
+    models = {name: registry.get(name) for name in registry.types(detection_type)}
+    missing = [name for name, model in models.items() if model is None]
+    if missing or not models:
+        events.put(('failed', job_id, {'error': f"Model not available for {', '.join(missing) or detection_type}"}))
+        return
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        events.put(('failed', job_id, {'error': f'Error opening video file: {video_path}'}))
+        return
+
+    results_id = job_id
+    video_id = job_id
+    progress_kind = 'progress'
+    preview_interval = 1.0 / settings['preview_fps']
+    if segment is not None:
+        index, start_frame, end_frame = segment
+        # The first segment's detections are stored and paged as they are found; later segments
+        # follow them in frame order when the job is merged
+        results_id = job_id if index == 0 else f"{job_id}-{index}"
+        video_id = f"{job_id}-{index}"
+        progress_kind = 'segment'
+        # Segments share the job's preview rate
+        preview_interval *= settings['segment_count']
+        settings = dict(settings, start_frame=start_frame, end_frame=end_frame, segmented=True)
+
+    if segment is None or segment[0] == 0:
+        events.put(('started', job_id, {
+            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'video_fps': cap.get(cv2.CAP_PROP_FPS)
+        }))
+
+    progress_interval = settings['progress_interval']
+    last_preview = 0.0
+    last_progress = 0.0
+    pending_detections = []
+    pending_counts = []
+    # Detection records go to the session's columnar file; events only carry the count
+    results = SessionResults(settings['results_dir'], results_id)
+    inferred_frames = 0
+    summary = {'total_detections': 0}
+    result = None
+    # Stage durations go back to the parent with each progress event
+    timings = StageHistograms()
+    # The annotated frames are encoded once so a finished upload can be replayed without inference
+    video = None
+    if settings.get('annotated_video'):
+        video = AnnotatedVideoWriter(SessionResults(settings['results_dir'], video_id).video_prefix,
+                                     cap.get(cv2.CAP_PROP_FPS))
+
+    # An upload may override the model input size; otherwise use each type's MODELS default
+    settings = dict(settings, inference_sizes={
+        name: settings.get('inference_size') or registry.input_size(name, settings['default_inference_size'])
+        for name in models
+    })
+
+    # 'auto' estimates the road area from frames sampled across the upload
+    if settings.get('roi') == 'auto':
+        settings['roi'] = estimate_road_polygon(sample_frames(video_path, settings['roi_auto_frames']))
+
+    try:
+        writer = _worker_state['writer']
+        for result in generate_processed_frames(models, cap, detection_type, settings, writer, summary, timings):
+            pending_detections.extend(result['detections'])
+            pending_counts.append(len(result['detections']))
+            inferred_frames += result['inferred']
+            if video is not None:
+                with timings.time('video_encode'):
+                    video.write(result['frame'])
+            now = time.time()
+
+            # Only encode the frames a viewer could actually see
+            if now - last_preview >= preview_interval:
+                with timings.time('encode'):
+                    ret, buffer = cv2.imencode('.jpg', result['frame'], [cv2.IMWRITE_JPEG_QUALITY, 80])
+                if ret:
+                    events.put(('frame', job_id, {
+                        'frame_number': result['frame_number'],
+                        'jpeg': buffer.tobytes()
+                    }))
+                last_preview = now
+
+            if now - last_progress >= progress_interval:
+                results.append_counts(pending_counts)
+                progress = {
+                    'current_frame': result['frame_number'],
+                    'detection_count': results.append(pending_detections),
+                    'total_detections': result['total_detections'],
+                    'inferred_frames': inferred_frames,
+                    'detection_stride': result['detection_stride'],
+                    'stages': timings.take()
+                }
+                if segment is not None:
+                    progress.update(index=segment[0], frames_done=result['frame_number'] - segment[1])
+                events.put((progress_kind, job_id, progress))
+                pending_detections = []
+                pending_counts = []
+                last_progress = now
+
+        # Snapshots and complaints are on disk before the job reports completion
+        writer.drain()
+        video_info = None
+        if video is not None and video.close():
+            video_info = {
+                'fps': video.fps,
+                'width': video.size[0],
+                'height': video.size[1],
+                'codec': video.codec,
+                'container': video.container,
+                'scale': video.size[0] / cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            }
+        results.append_counts(pending_counts)
+        progress = {
+            'current_frame': result['frame_number'] if result else 0,
+            'detection_count': results.append(pending_detections),
+            'total_detections': summary['total_detections'],
+            'inferred_frames': inferred_frames,
+            'detection_stride': result['detection_stride'] if result else 1,
+            'stages': timings.take()
+        }
+        if segment is None:
+            if video_info:
+                results.write_sidecar(dict(video_info, frames=video.frames))
+            events.put(('completed', job_id, progress))
+            return None
+
+        progress.update(index=segment[0], frames_done=progress['current_frame'] - segment[1] if result else 0)
+        events.put(('segment', job_id, progress))
+        return dict(progress, results_id=results_id, boundary_incidents=summary['boundary_incidents'],
+                    video_path=video.path if video_info else None, video_info=video_info)
+    except Exception as e:
+        if video is not None:
+            video.discard()
+        events.put(('failed', job_id, {'error': str(e)}))
+    finally:
+        cap.release()
+
+
+def _merge_segments(job_id: str, segments: List[Dict], settings: Dict):
+    """
+    Concatenate the segment results of a split job in frame order, report the incidents
+    stitched across segment boundaries and mark the job completed
+    """
+    events = _worker_state['events']
+    writer = _worker_state['writer']
+    try:
+        results = SessionResults(settings['results_dir'], job_id)
+        # The segment videos are joined by re-encoding their frames, without inference
+        video_info = None
+        video_paths = [segment['video_path'] for segment in segments if segment['video_path']]
+        if video_paths and len(video_paths) == len(segments):
+            video = concatenate_videos(video_paths, results.video_prefix, segments[0]['video_info']['fps'])
+            if video is not None:
+                video_info = dict(segments[0]['video_info'], codec=video.codec, container=video.container,
+                                  frames=video.frames)
+
+        for path in video_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        # The first segment already wrote to the session's results
+        for segment in segments:
+            if segment['results_id'] == job_id:
+                continue
+            segment_results = SessionResults(settings['results_dir'], segment['results_id'])
+            results.extend(segment_results)
+            segment_results.delete()
+        if video_info:
+            results.write_sidecar(video_info)
+
+        stitched = stitch_incidents([segment['boundary_incidents'] for segment in segments],
+                                    settings['track_iou_threshold'], settings['stitch_window'])
+        for detection_type, incident in stitched:
+            submit_incident(writer, detection_type, incident)
+        writer.drain()
+
+        events.put(('completed', job_id, {
+            'current_frame': sum(segment['frames_done'] for segment in segments),
+            'detection_count': results.count(),
+            'total_detections': sum(segment['total_detections'] for segment in segments) + len(stitched),
+            'inferred_frames': sum(segment['inferred_frames'] for segment in segments),
+            'detection_stride': segments[-1]['detection_stride']
+        }))
+    except Exception as e:
+        delete_segments(settings['results_dir'], job_id, len(segments))
+        events.put(('failed', job_id, {'error': str(e)}))
+
+
+def delete_segments(results_dir: str, job_id: str, count: int):
+    """Remove the results and videos segments of a split job wrote under their own names"""
+    for index in range(count):
+        SessionResults(results_dir, f"{job_id}-{index}").delete()
+
+
+# ============ WEB PROCESS ============
+
+def plan_segments(video_path: str, count: int, min_segment_frames: int) -> List[Tuple[int, int, Optional[int]]]:
+    """
+    Split a video into up to count (index, start_frame, end_frame) ranges of at least
+    min_segment_frames; the last range runs to the end of the stream
+    """
+    if count <= 1:
+        return []
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+    count = min(count, total_frames // max(1, min_segment_frames))
+    if count <= 1:
+        return []
+    bounds = np.linspace(0, total_frames, count + 1).astype(int).tolist()
+    return [(index, bounds[index], bounds[index + 1] if index < count - 1 else None) for index in range(count)]
+
+
+class VideoJob:
+    """Progress counters and recent preview frames for one background analysis"""
+
+    def __init__(self, job_id: str, video_path: str, detection_type: str, preview_buffer: int):
+        self.job_id = job_id
+        self.video_path = video_path
+        self.detection_type = detection_type
+        self.status = 'queued'
+        self.error = None
+        self.current_frame = 0
+        self.total_frames = 0
+        self.video_fps = 0.0
+        self.detection_count = 0
+        self.total_detections = 0
+        self.inferred_frames = 0
+        self.detection_stride = 1
+        # Latest progress of each segment when the video is split across workers
+        self.segment_count = 1
+        self.segments: Dict[int, Dict] = {}
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        # (sequence, frame_number, jpeg bytes) of the most recent annotated frames
+        self.frames = deque(maxlen=preview_buffer)
+        self.frame_sequence = 0
+        self.condition = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def progress(self) -> Dict:
+        """Status counters plus processing rate and estimated time remaining"""
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        frames_per_second = self.current_frame / elapsed if elapsed > 0 else 0.0
+        inference_fps = self.inferred_frames / elapsed if elapsed > 0 else 0.0
+        eta_seconds = None
+        if self.status == 'completed':
+            eta_seconds = 0
+        elif frames_per_second > 0 and self.total_frames:
+            eta_seconds = round(max(self.total_frames - self.current_frame, 0) / frames_per_second, 1)
+
+        # Detections of a split job's later segments are stored, and readable, once the job is merged
+        unmerged_detections = 0
+        if self.status != 'completed':
+            unmerged_detections = sum(segment['detection_count'] for index, segment in list(self.segments.items())
+                                      if index)
+
+        return {
+            'status': self.status,
+            'current_frame': self.current_frame,
+            'total_frames': self.total_frames,
+            'total_detections': self.total_detections,
+            'detection_count': self.detection_count,
+            'unmerged_detections': unmerged_detections,
+            'frames_per_second': round(frames_per_second, 1),
+            'inference_fps': round(inference_fps, 1),
+            'inferred_frames': self.inferred_frames,
+            'detection_stride': self.detection_stride,
+            'segments': self.segment_count,
+            'eta_seconds': eta_seconds,
+            'elapsed_seconds': round(elapsed, 1),
+            'error': self.error
+        }
+
+
+class VideoJobManager:
+    """
+    Submits uploaded videos to a process pool and tracks their progress
+    Viewers tail already-annotated preview frames instead of driving the analysis
+    """
+
+    def __init__(self, settings: Dict, max_workers: int = 2, preview_buffer: int = 64,
+                 on_complete: Optional[Callable[[VideoJob], None]] = None,
+                 metrics: Optional[PipelineMetrics] = None):
+        self.settings = dict(settings)
+        if not self.settings.get('worker_threads'):
+            self.settings['worker_threads'] = max(1, (os.cpu_count() or 1) // max_workers)
+        self.max_workers = max_workers
+        self.preview_buffer = preview_buffer
+        self.on_complete = on_complete
+        self.metrics = metrics
+        self.jobs: Dict[str, VideoJob] = {}
+
+        # The pool and listener are created on first use so importing this
+        # module (including from spawned workers) never starts processes
+        self._pool = None
+        self._events = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                return
+            context = multiprocessing.get_context('spawn')
+            self._events = context.Queue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._events, self.settings)
+            )
+            self._listener = threading.Thread(target=self._listen, daemon=True)
+            self._listener.start()
+
+    def submit(self, job_id: str, video_path: str, detection_type: str,
+               options: Optional[Dict] = None) -> VideoJob:
+        """
+        Queue a video for background analysis; options override settings for this job
+        Long videos are split into up to 'segments' frame ranges processed in parallel
+        """
+        self._ensure_pool()
+        job = VideoJob(job_id, video_path, detection_type, self.preview_buffer)
+        self.jobs[job_id] = job
+        settings = self.job_settings(options)
+        segments = plan_segments(video_path, settings.get('segments') or 1, settings['min_segment_frames'])
+        if len(segments) > 1:
+            self._submit_segments(job, segments, dict(settings, segment_count=len(segments)))
+            return job
+        future = self._pool.submit(_run_job, job_id, video_path, detection_type, settings)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job
+
+    def job_settings(self, options: Optional[Dict] = None) -> Dict:
+        """The settings a job runs with: the defaults overridden by its upload options"""
+        return dict(self.settings, **(options or {}))
+
+    def restore(self, job_id: str, video_path: str, detection_type: str, progress: Dict,
+                preview: Optional[bytes] = None) -> VideoJob:
+        """Register an already completed job, e.g. one answered from the result cache"""
+        job = VideoJob(job_id, video_path, detection_type, self.preview_buffer)
+        for name in ('total_frames', 'video_fps', 'current_frame', 'total_detections',
+                     'detection_count', 'inferred_frames', 'detection_stride'):
+            setattr(job, name, progress[name])
+        job.status = 'completed'
+        job.started_at = job.finished_at = time.time()
+        if preview:
+            job.frame_sequence = 1
+            job.frames.append((1, job.current_frame, preview))
+        self.jobs[job_id] = job
+        return job
+
+    def _submit_segments(self, job: VideoJob, segments: List[Tuple], settings: Dict):
+        """Run each segment in its own worker and merge them once all have finished"""
+        job.segment_count = len(segments)
+        futures = [
+            self._pool.submit(_run_job, job.job_id, job.video_path, job.detection_type, settings, segment)
+            for segment in segments
+        ]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_segment_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            errors = [f.exception() for f in futures if not f.cancelled() and f.exception()]
+            summaries = [None if f.cancelled() or f.exception() else f.result() for f in futures]
+            if job.done or errors or any(summary is None for summary in summaries):
+                # Only a merge would consume the segment files
+                delete_segments(settings['results_dir'], job.job_id, len(segments))
+                if errors and not job.done:
+                    self._apply(job, 'failed', {'error': str(errors[0])})
+                return
+            future = self._pool.submit(_merge_segments, job.job_id, summaries, settings)
+            future.add_done_callback(lambda f: self._on_done(job.job_id, f))
+
+        for future in futures:
+            future.add_done_callback(on_segment_done)
+
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        return self.jobs.get(job_id)
+
+    def is_active(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        return job is not None and not job.done
+
+    def stats(self) -> Dict:
+        """Jobs by status and the number of worker events not yet applied"""
+        statuses = [job.status for job in list(self.jobs.values())]
+        try:
+            pending_events = self._events.qsize() if self._events is not None else 0
+        except NotImplementedError:
+            pending_events = None
+        return {
+            'workers': self.max_workers,
+            'jobs': {status: statuses.count(status) for status in ('queued', 'processing', 'completed', 'failed')},
+            'pending_events': pending_events
+        }
+
+    def forget(self, job_id: str):
+        """Drop a finished job's record and preview frames"""
+        job = self.jobs.get(job_id)
+        if job and job.done:
+            del self.jobs[job_id]
+
+    def tail(self, job_id: str) -> Iterator[bytes]:
+        """Yield annotated JPEG frames as the job produces them, starting from the latest"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        last_sequence = max(job.frame_sequence - 1, 0)
+        timings = self.metrics.session('video', job.detection_type, job_id) if self.metrics else None
+
+        while True:
+            with job.condition:
+                job.condition.wait_for(lambda: job.frame_sequence > last_sequence or job.done, timeout=1.0)
+                frames = [(seq, jpeg) for seq, _, jpeg in job.frames if seq > last_sequence]
+                finished = job.done
+
+            for last_sequence, jpeg in frames:
+                start = time.perf_counter()
+                yield jpeg
+                # The generator resumes once the frame has been written to the client
+                if timings is not None:
+                    timings.record('yield', time.perf_counter() - start)
+
+            if finished and not frames:
+                return
+
+    def shutdown(self):
+        """Cancel queued jobs and stop the worker processes, abandoning any running analysis"""
+        if self._pool is None:
+            return
+        processes = list((self._pool._processes or {}).values())
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _listen(self):
+        """Apply worker events to the parent-side job records"""
+        while True:
+            try:
+                kind, job_id, payload = self._events.get()
+            except (EOFError, OSError):
+                return
+            job = self.jobs.get(job_id)
+            if job:
+                self._apply(job, kind, payload)
+
+    def _apply(self, job: VideoJob, kind: str, payload: Dict):
+        if self.metrics is not None and payload.get('stages'):
+            self.metrics.session('video', job.detection_type, job.job_id).merge(payload['stages'])
+        with job.condition:
+            if kind == 'started':
+                job.status = 'processing'
+                job.started_at = time.time()
+                job.total_frames = payload['total_frames']
+                job.video_fps = payload['video_fps']
+            elif kind == 'frame':
+                job.frame_sequence += 1
+                job.frames.append((job.frame_sequence, payload['frame_number'], payload['jpeg']))
+            elif kind == 'segment':
+                job.segments[payload['index']] = payload
+                if payload['index'] == 0:
+                    job.detection_count = payload['detection_count']
+                job.current_frame = sum(segment['frames_done'] for segment in job.segments.values())
+                job.total_detections = sum(segment['total_detections'] for segment in job.segments.values())
+                job.inferred_frames = sum(segment['inferred_frames'] for segment in job.segments.values())
+                job.detection_stride = payload['detection_stride']
+            elif kind in ('progress', 'completed'):
+                job.current_frame = payload['current_frame']
+                job.detection_count = payload['detection_count']
+                job.total_detections = payload['total_detections']
+                job.inferred_frames = payload['inferred_frames']
+                job.detection_stride = payload['detection_stride']
+                if kind == 'completed':
+                    job.status = 'completed'
+                    job.finished_at = time.time()
+                    print(f"Video processing completed. Total detections: {job.total_detections}")
+            elif kind == 'failed':
+                job.status = 'failed'
+                job.error = payload['error']
+                job.finished_at = time.time()
+                print(f"Video processing failed for {job.job_id}: {job.error}")
+            job.condition.notify_all()
+
+        if kind == 'completed' and self.on_complete:
+            try:
+                self.on_complete(job)
+            except Exception as e:
+                print(f"Error in completion handler for {job.job_id}: {e}")
+
+    def _on_done(self, job_id: str, future):
+        """Mark a job failed if its worker died without reporting"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            return
+        job = self.jobs.get(job_id)
+        if job and not job.done:
+            self._apply(job, 'failed', {'error': str(error)})
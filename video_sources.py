@@ -0,0 +1,237 @@
+"""
+Live Video Sources
+Named cameras (device index, RTSP/HTTP URL, or a looping local file as a stand-in), each paced to
+its own target FPS, and the scheduler that shares a fixed pool of inference workers across them
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Union
+
+import cv2
+
+from detection_pipeline import read_frame
+
+
+class VideoSource:
+    """
+    One named camera
+    kind is 'device' for an index, 'stream' for a URL and 'file' for a local path; files loop and are
+    played back at their own frame rate when realtime, as a camera would deliver them
+    """
+
+    def __init__(self, name: str, uri: Union[int, str], fps: Optional[float] = None,
+                 loop: Optional[bool] = None, realtime: bool = True, roi=None):
+        self.name = name
+        self.uri = int(uri) if isinstance(uri, str) and uri.isdigit() else uri
+        if isinstance(self.uri, int):
+            self.kind = 'device'
+        elif '://' in self.uri:
+            self.kind = 'stream'
+        else:
+            self.kind = 'file'
+        self.fps = fps
+        self.loop = self.kind == 'file' if loop is None else loop
+        self.realtime = realtime
+        self.roi = roi
+
+    def open(self) -> 'SourceCapture':
+        return SourceCapture(self)
+
+    def describe(self) -> Dict:
+        """Name, kind and target rate; the URI is left out as it may carry credentials"""
+        return {'name': self.name, 'kind': self.kind, 'target_fps': self.fps, 'loop': self.loop}
+
+
+class SourceCapture:
+    """
+    An open VideoSource: reads frames at the source's target FPS, rewinds looping files and
+    reconnects dropped streams
+    """
+
+    def __init__(self, source: VideoSource, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0):
+        self.source = source
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.reconnects = 0
+        self.frames_paced = 0
+        self.frames_since_open = 0
+        self.decode_seconds = 0.0
+        self.capture = self._open()
+        self.interval = self._interval()
+        self._next_due = None
+
+    def read(self, should_stop: Callable[[], bool], pool=None, shape=None):
+        """The next frame due at the target rate, or None once the source has ended or should_stop is true"""
+        while not should_stop():
+            start = time.perf_counter()
+            success, frame = read_frame(self.capture, pool, shape)
+            self.decode_seconds = time.perf_counter() - start
+            if success:
+                self.frames_since_open += 1
+            else:
+                if not self._recover(should_stop):
+                    return None
+                continue
+            if self._due(frame, pool):
+                return frame
+        return None
+
+    def release(self):
+        self.capture.release()
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.source.uri)
+        if self.source.kind == 'stream':
+            # Keep only the newest frame in the driver so a slow reader never works on old ones
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return capture
+
+    def _interval(self) -> float:
+        fps = self.source.fps
+        if not fps and self.source.kind == 'file' and self.source.realtime:
+            fps = self.capture.get(cv2.CAP_PROP_FPS)
+        return 1.0 / fps if fps and fps > 0 else 0.0
+
+    def _due(self, frame, pool) -> bool:
+        """Pace files by waiting and live sources by dropping frames that arrive early"""
+        if not self.interval:
+            return True
+        now = time.perf_counter()
+        if self._next_due is None:
+            self._next_due = now
+        if now < self._next_due:
+            if self.source.kind == 'file' and self.source.realtime:
+                time.sleep(self._next_due - now)
+            else:
+                self.frames_paced += 1
+                if pool is not None:
+                    pool.release(frame)
+                return False
+        # A source running behind starts its schedule again instead of bursting to catch up
+        self._next_due = max(self._next_due + self.interval, time.perf_counter() - self.interval)
+        return True
+
+    def _recover(self, should_stop: Callable[[], bool]) -> bool:
+        """Rewind a looping file or reopen a stream; False when the source has ended"""
+        if self.source.kind == 'file':
+            if not self.source.loop:
+                return False
+            # A file that yielded nothing since the last rewind would loop forever
+            if not self.frames_since_open:
+                return False
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.frames_since_open = 0
+            return True
+        if self.source.kind == 'device':
+            return False
+
+        delay = self.reconnect_delay
+        while not should_stop():
+            self.capture.release()
+            print(f"Reconnecting to video source {self.source.name} in {delay:.0f}s")
+            deadline = time.time() + delay
+            while time.time() < deadline:
+                if should_stop():
+                    return False
+                time.sleep(0.1)
+            self.capture = self._open()
+            self.frames_since_open = 0
+            self.reconnects += 1
+            if self.capture.isOpened():
+                return True
+            delay = min(delay * 2, self.max_reconnect_delay)
+        return False
+
+
+class SourceRegistry:
+    """Named video sources from the LIVE_SOURCES setting"""
+
+    def __init__(self, sources: Dict[str, Dict], default: Optional[str] = None):
+        self.sources = {
+            name: VideoSource(name, spec['uri'], spec.get('fps'), spec.get('loop'), roi=spec.get('roi'))
+            for name, spec in sources.items()
+        }
+        self.default = default if default is not None else next(iter(self.sources), None)
+
+    def get(self, name: Optional[str] = None) -> Optional[VideoSource]:
+        return self.sources.get(self.default if name is None else name)
+
+    def resolve(self, source) -> VideoSource:
+        """A registered source by name, or an unregistered URI read once at its natural speed"""
+        if isinstance(source, VideoSource):
+            return source
+        if isinstance(source, str) and source in self.sources:
+            return self.sources[source]
+        return VideoSource(str(source), source, loop=False, realtime=False)
+
+    def names(self) -> List[str]:
+        return list(self.sources)
+
+    def describe(self) -> List[Dict]:
+        return [source.describe() for source in self.sources.values()]
+
+
+class RoundRobinScheduler:
+    """
+    A fixed pool of inference workers shared by every live pipeline
+    A pipeline with a new frame queues for a worker behind the others that are waiting; it gets one
+    frame processed per turn, and never runs on two workers at once, so each source is served in order
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self.turns = 0
+        self._ready = deque()
+        self._queued = set()
+        self._busy = set()
+        self._threads = []
+        self._condition = threading.Condition()
+
+    def notify(self, pipeline):
+        """Queue a pipeline that has a frame waiting; it must provide process_pending() and has_pending()"""
+        with self._condition:
+            if pipeline in self._queued or pipeline in self._busy:
+                return
+            self._ready.append(pipeline)
+            self._queued.add(pipeline)
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify()
+
+    def detach(self, pipeline, timeout: float = 5.0):
+        """Remove a pipeline from the queue and wait for a worker to finish with it"""
+        with self._condition:
+            if pipeline in self._queued:
+                self._ready.remove(pipeline)
+                self._queued.discard(pipeline)
+            self._condition.wait_for(lambda: pipeline not in self._busy, timeout)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {'workers': self.workers, 'busy': len(self._busy), 'waiting': len(self._ready),
+                    'turns': self.turns}
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._ready)
+                pipeline = self._ready.popleft()
+                self._queued.discard(pipeline)
+                self._busy.add(pipeline)
+                self.turns += 1
+            try:
+                pipeline.process_pending()
+            except Exception as e:
+                print(f"Live detection error: {e}")
+            finally:
+                with self._condition:
+                    self._busy.discard(pipeline)
+                    # A frame that arrived during this turn waits behind the other sources
+                    if pipeline.has_pending():
+                        self._ready.append(pipeline)
+                        self._queued.add(pipeline)
+                    self._condition.notify_all()